@@ -4,19 +4,19 @@
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import pandas as pd
 import math
 import os # Per ottenere il nome del file
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from matplotlib.ticker import MaxNLocator
+import queue
+import threading
+# pandas e matplotlib sono importati solo quando servono (primo file letto / primo grafico mostrato)
 
 # --- IMPORTA LA LIBRERIA DI CALCOLO ---
 # Assicurati che sf36_library.py sia nella stessa cartella
 try:
     import sf36_library
+    import sf36_batch
 except ImportError:
-    messagebox.showerror("Errore Importazione", "Errore: il file 'sf36_library.py' non è stato trovato.\nAssicurati che sia nella stessa cartella di questo script.")
+    messagebox.showerror("Errore Importazione", "Errore: i file 'sf36_library.py' e 'sf36_batch.py' non sono stati trovati.\nAssicurati che siano nella stessa cartella di questo script.")
     exit()
 
 # --- Usa le costanti dalla libreria ---
@@ -79,6 +79,21 @@ BILINGUAL_LABELS = {
 }
 CHART_SCALE_ORDER = ['PF', 'RP', 'BP', 'GH', 'VT', 'SF', 'RE', 'MH'] # Per grafici standardizzati
 
+LIVE_UPDATE_DELAY_MS = 300 # Attesa dopo l'ultimo tasto prima del ricalcolo automatico
+
+# Schede dei grafici: titolo, etichetta asse Y, dimensioni figura, margini, tipo di asse ('0-100', 'z', 't'), barre
+_CHART_MARGINS = dict(bottom=0.25, top=0.9, left=0.12, right=0.95)
+CHART_SPECS = {
+    "Scale 0-100": dict(title="Punteggi Scale (0-100)", ylabel="Punteggio (0-100)", figsize=(6, 4.5),
+                        margins=_CHART_MARGINS, axis='0-100', scales=SCALES_ORDER),
+    "Z-Score USA": dict(title="Punteggi Z (vs Pop. USA)", ylabel="Z-Score (Media=0, DS=1)", figsize=(6, 4.5),
+                        margins=_CHART_MARGINS, axis='z', scales=CHART_SCALE_ORDER),
+    "PCS/MCS USA": dict(title="Indici Sintetici (USA)", ylabel="Punteggio T (Media=50, DS=10)", figsize=(4, 4),
+                        margins=dict(bottom=0.15, top=0.9, left=0.15, right=0.95), axis='t', scales=sf36_library.SUMMARY_ORDER),
+    "T-Score Età/Sesso ITA": dict(title="Punteggi T (vs Pop. ITA Età/Sesso)", ylabel="Punteggio T (Media=50, DS=10)", figsize=(6, 4.5),
+                                  margins=_CHART_MARGINS, axis='t', scales=CHART_SCALE_ORDER),
+}
+
 
 # -----------------------------------------------------------------------------
 # CLASSE DELLA GUI (Aggiornata per usare sf36_library)
@@ -101,7 +116,17 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
 
 
         self.filepath = tk.StringVar(value="Nessun file selezionato.")
+        self.excel_sheet = tk.StringVar()
+        self.excel_header_row = tk.StringVar()
+        self.batch_status = tk.StringVar(value="Calcola tutte le righe del file e salva i risultati in CSV.")
+        self.batch_thread = None
+        self.batch_queue = None
+        self.batch_cancel = None
         self.manual_entries = []
+        self.live_update = tk.BooleanVar(value=True)
+        self._live_after_id = None
+        self._live_inputs = None
+        self.live_scorer = sf36_library.IncrementalScorer() # Stato dell'inserimento manuale, aggiornato per item
         self.demographic_vars = {
             'age': tk.StringVar(),
             'sex': tk.StringVar()
@@ -122,6 +147,15 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
         file_label.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         calc_file_button = ttk.Button(file_frame, text="Calcola da File", command=self.calculate_from_file)
         calc_file_button.pack(side=tk.LEFT, padx=5)
+        # Opzioni Excel: foglio e riga di intestazione (vuota = rilevamento automatico)
+        ttk.Label(file_frame, text="Foglio:").pack(side=tk.LEFT, padx=(10, 2))
+        self.sheet_combo = ttk.Combobox(file_frame, textvariable=self.excel_sheet, width=12, state=tk.DISABLED)
+        self.sheet_combo.pack(side=tk.LEFT, padx=2)
+        Tooltip(self.sheet_combo, "Foglio Excel da leggere (default: il primo)")
+        ttk.Label(file_frame, text="Riga intest.:").pack(side=tk.LEFT, padx=(10, 2))
+        header_row_entry = ttk.Entry(file_frame, textvariable=self.excel_header_row, width=4, justify=tk.CENTER)
+        header_row_entry.pack(side=tk.LEFT, padx=2)
+        Tooltip(header_row_entry, "Excel: numero della riga di intestazione (0 = nessuna, vuoto = automatico)")
 
         # --- Controlli Demografici (invariato) ---
         demo_frame = ttk.LabelFrame(top_input_frame, text="Dati Demografici (per Standardizzazione)", padding=10)
@@ -130,14 +164,27 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
         age_entry = ttk.Entry(demo_frame, textvariable=self.demographic_vars['age'], width=5, justify=tk.CENTER)
         age_entry.grid(row=0, column=1, padx=5, pady=5, sticky="w")
         Tooltip(age_entry, "Inserire età in anni")
+        age_entry.bind("<KeyRelease>", self._schedule_live_update)
         ttk.Label(demo_frame, text="Sesso:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
         sex_combo = ttk.Combobox(demo_frame, textvariable=self.demographic_vars['sex'], values=["", "Maschio (1)", "Femmina (2)"], width=12, state="readonly")
         sex_combo.grid(row=1, column=1, padx=5, pady=5, sticky="w")
         sex_combo.current(0)
         Tooltip(sex_combo, "Selezionare sesso biologico (1 o 2)")
+        sex_combo.bind("<<ComboboxSelected>>", self._schedule_live_update)
         top_input_frame.columnconfigure(0, weight=1)
         top_input_frame.columnconfigure(1, weight=0)
 
+        # --- Calcolo Batch (tutte le righe del file, in background) ---
+        batch_frame = ttk.LabelFrame(top_input_frame, text="Calcolo Batch (tutte le righe)", padding=10)
+        batch_frame.grid(row=1, column=0, columnspan=2, pady=5, sticky="ew")
+        self.batch_button = ttk.Button(batch_frame, text="Calcola Tutte le Righe...", command=self.calculate_batch_from_file)
+        self.batch_button.pack(side=tk.LEFT, padx=5)
+        self.batch_progress = ttk.Progressbar(batch_frame, orient=tk.HORIZONTAL, length=250, mode='determinate', maximum=100)
+        self.batch_progress.pack(side=tk.LEFT, padx=5)
+        self.batch_cancel_button = ttk.Button(batch_frame, text="Annulla", command=self.cancel_batch, state=tk.DISABLED)
+        self.batch_cancel_button.pack(side=tk.LEFT, padx=5)
+        ttk.Label(batch_frame, textvariable=self.batch_status).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+
         # --- Inserimento Manuale (invariato nella struttura) ---
         manual_outer_frame = ttk.LabelFrame(master, text="Inserimento Manuale Risposte (1-36)", padding=10)
         manual_outer_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=10, pady=5)
@@ -156,7 +203,10 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
 
         # --- Bottone Calcolo Manuale (invariato) ---
         calc_manual_button = ttk.Button(master, text="Calcola da Inserimento Manuale", command=self.calculate_from_manual)
-        calc_manual_button.pack(side=tk.TOP, pady=(0, 10))
+        calc_manual_button.pack(side=tk.TOP, pady=(0, 2))
+        live_check = ttk.Checkbutton(master, text="Aggiorna mentre si digita", variable=self.live_update)
+        live_check.pack(side=tk.TOP, pady=(0, 8))
+        Tooltip(live_check, "Ricalcola automaticamente i punteggi durante l'inserimento manuale")
 
         # --- Output Frame (invariato nella struttura) ---
         result_text_frame = ttk.LabelFrame(bottom_output_frame, text="Risultati Numerici", padding=10)
@@ -164,63 +214,27 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
         self.result_text = scrolledtext.ScrolledText(result_text_frame, height=25, width=55, wrap=tk.WORD, state=tk.DISABLED, font=("Consolas", 9))
         self.result_text.pack(fill=tk.BOTH, expand=True)
 
-        plot_notebook = ttk.Notebook(bottom_output_frame)
-        plot_notebook.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+        self.plot_notebook = ttk.Notebook(bottom_output_frame)
+        self.plot_notebook.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         self.plot_frames = {}
-        tab_names = ["Scale 0-100", "Z-Score USA", "PCS/MCS USA", "T-Score Età/Sesso ITA"]
-        for name in tab_names:
-             frame = ttk.Frame(plot_notebook, padding=5)
-             plot_notebook.add(frame, text=name)
+        self.plot_placeholders = {}
+        for name in CHART_SPECS:
+             frame = ttk.Frame(self.plot_notebook, padding=5)
+             self.plot_notebook.add(frame, text=name)
              self.plot_frames[name] = frame
+             placeholder = ttk.Label(frame, text="Dati non disponibili", foreground="gray", anchor=tk.CENTER)
+             placeholder.pack(fill=tk.BOTH, expand=True)
+             self.plot_placeholders[name] = placeholder
 
-        plt.style.use('seaborn-v0_8-whitegrid')
+        # Figure matplotlib create alla prima visualizzazione della scheda con dati (vedi _create_chart):
+        # matplotlib non viene importato all'avvio.
         self.figs_axes = {}
         self.canvases = {}
         self.toolbars = {}
-
-        # Grafico Scale 0-100
-        fig0100, ax0100 = plt.subplots(figsize=(6, 4.5), dpi=90)
-        fig0100.subplots_adjust(bottom=0.25, top=0.9, left=0.12, right=0.95)
-        self.figs_axes["Scale 0-100"] = (fig0100, ax0100)
-        canvas0100 = FigureCanvasTkAgg(fig0100, master=self.plot_frames["Scale 0-100"])
-        self.canvases["Scale 0-100"] = canvas0100
-        toolbar0100 = NavigationToolbar2Tk(canvas0100, self.plot_frames["Scale 0-100"], pack_toolbar=False)
-        self.toolbars["Scale 0-100"] = toolbar0100
-        toolbar0100.pack(side=tk.BOTTOM, fill=tk.X)
-        canvas0100.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-
-        # Grafico Z-Score USA
-        figZ, axZ = plt.subplots(figsize=(6, 4.5), dpi=90)
-        figZ.subplots_adjust(bottom=0.25, top=0.9, left=0.12, right=0.95)
-        self.figs_axes["Z-Score USA"] = (figZ, axZ)
-        canvasZ = FigureCanvasTkAgg(figZ, master=self.plot_frames["Z-Score USA"])
-        self.canvases["Z-Score USA"] = canvasZ
-        toolbarZ = NavigationToolbar2Tk(canvasZ, self.plot_frames["Z-Score USA"], pack_toolbar=False)
-        self.toolbars["Z-Score USA"] = toolbarZ
-        toolbarZ.pack(side=tk.BOTTOM, fill=tk.X)
-        canvasZ.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-
-        # Grafico PCS/MCS USA
-        figSum, axSum = plt.subplots(figsize=(4, 4), dpi=90)
-        figSum.subplots_adjust(bottom=0.15, top=0.9, left=0.15, right=0.95)
-        self.figs_axes["PCS/MCS USA"] = (figSum, axSum)
-        canvasSum = FigureCanvasTkAgg(figSum, master=self.plot_frames["PCS/MCS USA"])
-        self.canvases["PCS/MCS USA"] = canvasSum
-        toolbarSum = NavigationToolbar2Tk(canvasSum, self.plot_frames["PCS/MCS USA"], pack_toolbar=False)
-        self.toolbars["PCS/MCS USA"] = toolbarSum
-        toolbarSum.pack(side=tk.BOTTOM, fill=tk.X)
-        canvasSum.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-
-        # Grafico T-Score Età/Sesso ITA
-        figT, axT = plt.subplots(figsize=(6, 4.5), dpi=90)
-        figT.subplots_adjust(bottom=0.25, top=0.9, left=0.12, right=0.95)
-        self.figs_axes["T-Score Età/Sesso ITA"] = (figT, axT)
-        canvasT = FigureCanvasTkAgg(figT, master=self.plot_frames["T-Score Età/Sesso ITA"])
-        self.canvases["T-Score Età/Sesso ITA"] = canvasT
-        toolbarT = NavigationToolbar2Tk(canvasT, self.plot_frames["T-Score Età/Sesso ITA"], pack_toolbar=False)
-        self.toolbars["T-Score Età/Sesso ITA"] = toolbarT
-        toolbarT.pack(side=tk.BOTTOM, fill=tk.X)
-        canvasT.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.chart_artists = {} # Barre, etichette e messaggio persistenti per grafico (aggiornati in place)
+        self.chart_data = dict.fromkeys(CHART_SPECS) # Ultimi dati per grafico (None = nessun dato)
+        self.stale_charts = set() # Grafici creati ma non aggiornati (scheda nascosta)
+        self.plot_notebook.bind("<<NotebookTabChanged>>", self._on_plot_tab_changed)
 
         self.clear_all_outputs()
 
@@ -272,70 +286,124 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
             self.manual_entries.append({'widget': entry, 'var': entry_var, 'index': idx, 'range': q_range_tuple, 'label': lbl_q})
             Tooltip(widget=lbl_q, text=f"Item {idx+1}: {q_text}\nRange: {q_range_str}")
             Tooltip(widget=entry, text=f"Inserire {q_range_str} o lasciare vuoto")
+            entry.bind("<KeyRelease>", self._schedule_live_update)
         parent_frame.update_idletasks()
         self.on_frame_configure()
 
-    # --- Funzioni Plotting (invariate nella logica) ---
-    def _plot_generic_bar(self, ax, fig, canvas, data, title, ylabel, labels_map, is_t_score=False, is_z_score=False):
-        ax.clear()
-        plot_data = {k: v for k, v in data.items() if v is not None and not (isinstance(v, float) and math.isnan(v))}
-        if not plot_data:
-            ax.text(0.5, 0.5, "Nessun dato valido", ha='center', va='center', transform=ax.transAxes, color='gray')
-            ax.set_title(title, pad=15, fontsize=11); ax.set_ylabel(ylabel, fontsize=9); ax.set_yticks([]); ax.set_xticks([])
-        else:
-            scales_in_plot = list(plot_data.keys()); values = list(plot_data.values())
-            bilingual_x_labels = [labels_map.get(scale, scale).replace('\n', ' ') for scale in scales_in_plot]
-            colors = plt.cm.viridis([i/len(scales_in_plot) for i in range(len(scales_in_plot))])
-            bars = ax.bar(bilingual_x_labels, values, color=colors, width=0.7)
-            ax.set_ylabel(ylabel, fontsize=9); ax.set_title(title, pad=15, fontsize=11)
-            ax.tick_params(axis='x', labelsize=8, rotation=45, ha='right'); ax.tick_params(axis='y', labelsize=8)
-            ax.bar_label(bars, fmt='{:.1f}', padding=3, fontsize=7)
-            if is_t_score:
-                ax.set_ylim(0, 100); ax.axhline(50, color='grey', linestyle='--', linewidth=0.8)
-                ax.text(ax.get_xlim()[0], 50, ' Media Ref.', color='grey', fontsize=7, ha='left', va='bottom')
-            elif is_z_score:
-                max_abs_z = max(abs(v) for v in values) if values else 2; limit = math.ceil(max_abs_z * 1.1)
-                ax.set_ylim(-limit, limit); ax.axhline(0, color='grey', linestyle='--', linewidth=0.8)
-                ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-            else: ax.set_ylim(0, 105)
-        fig.tight_layout(rect=[0, 0.03, 1, 0.95]); canvas.draw()
-
+    # --- Grafici (figure create su richiesta) ---
+    def _visible_chart(self):
+        return self.plot_notebook.tab(self.plot_notebook.select(), "text")
+
+    def _create_chart(self, name):
+        """Crea figura, canvas, toolbar e artisti del grafico; matplotlib è importato alla prima chiamata."""
+        if name in self.canvases: return
+        import matplotlib.style
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        if not self.canvases: matplotlib.style.use('seaborn-v0_8-whitegrid')
+        spec = CHART_SPECS[name]
+        fig = Figure(figsize=spec['figsize'], dpi=90)
+        ax = fig.add_subplot()
+        fig.subplots_adjust(**spec['margins'])
+        frame = self.plot_frames[name]
+        self.plot_placeholders.pop(name).destroy()
+        canvas = FigureCanvasTkAgg(fig, master=frame)
+        toolbar = NavigationToolbar2Tk(canvas, frame, pack_toolbar=False)
+        toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+        canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.figs_axes[name] = (fig, ax)
+        self.canvases[name] = canvas
+        self.toolbars[name] = toolbar
+        self.chart_artists[name] = self._build_chart_artists(fig, ax, spec)
+
+    def _build_chart_artists(self, fig, ax, spec):
+        """Disegna una sola volta assi, barre (una per scala) ed etichette; il layout non si ricalcola a ogni aggiornamento."""
+        import matplotlib
+        from matplotlib.ticker import MaxNLocator
+        n = len(spec['scales'])
+        colors = matplotlib.colormaps['viridis']([i/n for i in range(n)])
+        bars = ax.bar(range(n), [0.0] * n, color=colors, width=0.7)
+        ax.set_xticks(range(n))
+        ax.set_xticklabels([BILINGUAL_LABELS.get(scale, scale).replace('\n', ' ') for scale in spec['scales']], rotation=45, ha='right', fontsize=8)
+        ax.tick_params(axis='y', labelsize=8)
+        ax.set_title(spec['title'], pad=15, fontsize=11); ax.set_ylabel(spec['ylabel'], fontsize=9)
+        if spec['axis'] == 't':
+            ax.set_ylim(0, 100); ax.axhline(50, color='grey', linestyle='--', linewidth=0.8)
+            ax.text(ax.get_xlim()[0], 50, ' Media Ref.', color='grey', fontsize=7, ha='left', va='bottom')
+        elif spec['axis'] == 'z':
+            ax.set_ylim(-3, 3); ax.axhline(0, color='grey', linestyle='--', linewidth=0.8)
+            ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+        else: ax.set_ylim(0, 105)
+        labels = [ax.annotate("", xy=(bar.get_x() + bar.get_width() / 2, 0), xytext=(0, 3), textcoords='offset points',
+                              ha='center', va='bottom', fontsize=7) for bar in bars]
+        message = ax.text(0.5, 0.5, "", ha='center', va='center', transform=ax.transAxes, color='gray')
+        fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+        return {'bars': list(bars), 'labels': labels, 'message': message}
+
+    def _on_plot_tab_changed(self, event=None):
+        name = self._visible_chart()
+        if name not in self.canvases and self.chart_data[name] is not None:
+            self._create_chart(name)
+            self._update_chart(name)
+        elif name in self.stale_charts:
+            self._update_chart(name)
+
+    def _set_chart_data(self, name, data):
+        """Memorizza i dati del grafico; aggiorna subito solo la scheda visibile, le altre alla loro selezione."""
+        if data == self.chart_data[name]: return # Es. aggiornamento live che non tocca queste scale
+        self.chart_data[name] = data
+        if name != self._visible_chart():
+            if name in self.canvases: self.stale_charts.add(name)
+            return
+        if name not in self.canvases:
+            if data is None: return # Resta il segnaposto
+            self._create_chart(name)
+        self._update_chart(name)
+
+    def _update_chart(self, name):
+        """Aggiorna in place altezze, etichette e limiti delle barre, poi ridisegna quando Tk è inattivo (draw_idle)."""
+        spec = CHART_SPECS[name]; artists = self.chart_artists[name]
+        fig, ax = self.figs_axes[name]
+        data = self.chart_data[name] or {}
+        values = [data.get(scale) for scale in spec['scales']]
+        values = [None if v is None or (isinstance(v, float) and math.isnan(v)) else v for v in values]
+        valid = [v for v in values if v is not None]
+        for bar, label, v in zip(artists['bars'], artists['labels'], values):
+            bar.set_visible(v is not None); label.set_visible(v is not None)
+            if v is None: continue
+            bar.set_height(v)
+            label.set_text(f"{v:.1f}"); label.xy = (bar.get_x() + bar.get_width() / 2, v)
+            label.xyann = (0, 3 if v >= 0 else -3); label.set_va('bottom' if v >= 0 else 'top')
+        if valid: artists['message'].set_text("")
+        else: artists['message'].set_text("Dati non disponibili" if self.chart_data[name] is None else "Nessun dato valido")
+        if spec['axis'] == 'z':
+            limit = max(1, math.ceil(max((abs(v) for v in valid), default=2) * 1.1))
+            if ax.get_ylim() != (-limit, limit): ax.set_ylim(-limit, limit)
+        self.stale_charts.discard(name)
+        self.canvases[name].draw_idle()
+
+    # --- Funzioni Plotting ---
     def plot_scores_0_100(self, scores):
-        fig, ax = self.figs_axes["Scale 0-100"]; canvas = self.canvases["Scale 0-100"]
         data_to_plot = {k: v for k, v in scores.items() if k in SCALES_ORDER} # SCALES_ORDER from library
-        self._plot_generic_bar(ax, fig, canvas, data_to_plot, "Punteggi Scale (0-100)", "Punteggio (0-100)", BILINGUAL_LABELS)
+        self._set_chart_data("Scale 0-100", data_to_plot)
 
     def plot_z_scores(self, z_scores):
-        fig, ax = self.figs_axes["Z-Score USA"]; canvas = self.canvases["Z-Score USA"]
-        self._plot_generic_bar(ax, fig, canvas, z_scores, "Punteggi Z (vs Pop. USA)", "Z-Score (Media=0, DS=1)", BILINGUAL_LABELS, is_z_score=True)
+        self._set_chart_data("Z-Score USA", z_scores)
 
     def plot_summaries(self, summaries):
-        fig, ax = self.figs_axes["PCS/MCS USA"]; canvas = self.canvases["PCS/MCS USA"]
-        self._plot_generic_bar(ax, fig, canvas, summaries, "Indici Sintetici (USA)", "Punteggio T (Media=50, DS=10)", BILINGUAL_LABELS, is_t_score=True)
+        self._set_chart_data("PCS/MCS USA", summaries)
 
     def plot_age_sex_t_scores(self, t_scores):
-        fig, ax = self.figs_axes["T-Score Età/Sesso ITA"]; canvas = self.canvases["T-Score Età/Sesso ITA"]
-        self._plot_generic_bar(ax, fig, canvas, t_scores, "Punteggi T (vs Pop. ITA Età/Sesso)", "Punteggio T (Media=50, DS=10)", BILINGUAL_LABELS, is_t_score=True)
+        self._set_chart_data("T-Score Età/Sesso ITA", t_scores)
 
-    # --- Metodo clear_all_outputs (invariato) ---
+    # --- Metodo clear_all_outputs ---
     def clear_all_outputs(self):
          self.result_text.config(state=tk.NORMAL)
          self.result_text.delete('1.0', tk.END)
          self.result_text.insert(tk.END, "Inserire o caricare i dati per calcolare i punteggi.")
          self.result_text.config(state=tk.DISABLED)
-         for name, (fig, ax) in self.figs_axes.items():
-             ax.clear(); title = ""; ylabel = ""; is_t = "T-Score" in name or "PCS/MCS" in name; is_z = "Z-Score" in name
-             if name == "Scale 0-100": title, ylabel = "Punteggi Scale (0-100)", "Punteggio (0-100)"
-             elif name == "Z-Score USA": title, ylabel = "Punteggi Z (vs Pop. USA)", "Z-Score (Media=0, DS=1)"
-             elif name == "PCS/MCS USA": title, ylabel = "Indici Sintetici (USA)", "Punteggio T (Media=50, DS=10)"
-             elif name == "T-Score Età/Sesso ITA": title, ylabel = "Punteggi T (vs Pop. ITA Età/Sesso)", "Punteggio T (Media=50, DS=10)"
-             ax.set_title(title, pad=15, fontsize=11); ax.set_ylabel(ylabel, fontsize=9)
-             ax.text(0.5, 0.5, "Dati non disponibili", ha='center', va='center', transform=ax.transAxes, color='gray')
-             if is_t: ax.set_ylim(0, 100)
-             elif is_z: ax.set_ylim(-3, 3)
-             else: ax.set_ylim(0, 105)
-             ax.set_xticks([]); ax.set_yticks([])
-             canvas = self.canvases[name]; fig.tight_layout(rect=[0, 0.03, 1, 0.95]); canvas.draw()
+         for name in CHART_SPECS:
+             self._set_chart_data(name, None)
 
     # --- Metodo browse_file (invariato) ---
     def browse_file(self):
@@ -345,6 +413,7 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
         )
         if filename:
             self.filepath.set(filename); self.clear_all_outputs()
+            self._load_excel_sheets(filename)
             for entry_info in self.manual_entries: entry_info['var'].set("")
             self.demographic_vars['age'].set(""); self.demographic_vars['sex'].set("")
             self.result_text.config(state=tk.NORMAL)
@@ -353,6 +422,23 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
             self.result_text.config(state=tk.DISABLED)
         else:
             self.filepath.set("Nessun file selezionato.")
+            self._load_excel_sheets("")
+
+    def _load_excel_sheets(self, fpath):
+        # Popola la scelta del foglio per i file Excel (solo i nomi, senza leggere i dati)
+        sheets = []
+        if fpath.lower().endswith(('.xlsx', '.xls')):
+            try: sheets = sf36_batch.list_excel_sheets(fpath)
+            except Exception: sheets = []
+        self.sheet_combo.configure(values=sheets, state="readonly" if sheets else tk.DISABLED)
+        self.excel_sheet.set(sheets[0] if sheets else "")
+
+    def _excel_options(self):
+        # Foglio e riga di intestazione scelti per i file Excel (ValueError se la riga non è valida)
+        header_row = self.excel_header_row.get().strip()
+        if header_row and not header_row.isdigit():
+            raise ValueError("La riga di intestazione deve essere un numero intero >= 0 (vuoto = automatico).")
+        return {'sheet': self.excel_sheet.get() or None, 'header_row': int(header_row) if header_row else None}
 
     # --- Metodo display_results (Aggiornato per usare struttura risultati libreria) ---
     def display_results(self, results, source_info=""):
@@ -445,6 +531,39 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
         except ValueError:
             return None, False # Non numerico
 
+    # --- Aggiornamento live: ricalcolo con debounce dopo l'ultimo tasto ---
+    def _schedule_live_update(self, event=None):
+        if not self.live_update.get(): return
+        if self._live_after_id is not None: self.master.after_cancel(self._live_after_id)
+        self._live_after_id = self.master.after(LIVE_UPDATE_DELAY_MS, self._live_update)
+
+    def _live_update(self):
+        """Passa i campi al calcolatore incrementale: solo le scale degli item modificati vengono ricalcolate."""
+        self._live_after_id = None
+        answers = [entry_info['var'].get().strip() or None for entry_info in self.manual_entries]
+        age_str, sex_str = self.demographic_vars['age'].get().strip(), self._selected_sex()
+        if (answers, age_str, sex_str) == self._live_inputs: return # Tasti senza modifiche (frecce, Tab, ...)
+        self._live_inputs = (answers, age_str, sex_str)
+        scorer = self.live_scorer
+        for entry_info, value in zip(self.manual_entries, answers):
+            _, is_valid_format = self.validate_input(value or "", allow_empty=True)
+            style = "Valid.TEntry" if is_valid_format else "Error.TEntry"
+            if entry_info['widget'].cget("style") != style: entry_info['widget'].configure(style=style)
+            scorer.set_answer(entry_info['index'], value) # Nessun ricalcolo se il valore non è cambiato
+        scorer.set_demographics(age_str, sex_str)
+        results = scorer.result()
+        self.display_results(results, "Inserimento Manuale") # I grafici con dati invariati non vengono ridisegnati
+        age_had_warning = any("Age" in w for w in results['input_data']['warnings'])
+        age_entry_widget = self.master.nametowidget('.!frame.!labelframe2.!entry')
+        age_entry_widget.configure(style="Error.TEntry" if age_had_warning else "Valid.TEntry")
+
+    def _selected_sex(self):
+        """'1' o '2' dalla selezione del combobox sesso, None se vuota."""
+        sex_str_raw = self.demographic_vars['sex'].get().strip()
+        if not sex_str_raw: return None
+        try: return sex_str_raw.split("(")[1].split(")")[0]
+        except IndexError: return None # Formato inatteso
+
     # --- Metodo calculate_from_manual (Aggiornato per chiamare libreria) ---
     def calculate_from_manual(self):
         answers_raw = [] # Raccoglie le stringhe dalle entry
@@ -482,11 +601,7 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
 
         # 2. Raccolta Dati Demografici (stringhe)
         age_str = self.demographic_vars['age'].get().strip()
-        sex_str_raw = self.demographic_vars['sex'].get().strip()
-        sex_str = None
-        if sex_str_raw: # Estrai '1' o '2' se selezionato
-             try: sex_str = sex_str_raw.split("(")[1].split(")")[0]
-             except IndexError: pass # Lascia None se formato inatteso
+        sex_str = self._selected_sex() # Estrai '1' o '2' se selezionato
 
         # 3. Chiama la Libreria (che farà validazione range e calcolo)
         try:
@@ -531,22 +646,29 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
 
         file_basename = os.path.basename(fpath)
         try:
+            import pandas as pd # Importata al primo file letto, non all'avvio
             df = None
+            decimal_comma = False
+            row_label = "Riga 1"
             if fpath.lower().endswith('.csv'):
-                try: df = pd.read_csv(fpath, header=None, dtype=object, sep=',', low_memory=False); assert df.shape[1] >= 36
-                except Exception: df = None
-                if df is None:
-                     try: df = pd.read_csv(fpath, header=None, dtype=object, sep=';', low_memory=False); assert df.shape[1] >= 36
-                     except Exception: df = None
-                if df is None:
-                    try: df = pd.read_csv(fpath, header=None, dtype=object, sep=None, engine='python', on_bad_lines='warn'); assert df.shape[1] >= 36
-                    except Exception as e: raise ValueError(f"Impossibile leggere CSV: {e}")
+                # Rileva separatore/decimali/encoding/intestazione da un campione, poi una sola lettura (motore C)
+                try:
+                    dialect = sf36_batch.sniff_csv(fpath)
+                    decimal_comma = dialect['decimal'] == ','
+                    df = sf36_batch.read_csv_dataframe(fpath, dialect, nrows=1)
+                except FileNotFoundError: raise
+                except Exception as e: raise ValueError(f"Impossibile leggere CSV: {e}")
             elif fpath.lower().endswith(('.xlsx', '.xls')):
+                # Lettura in streaming della sola prima riga di dati (memoria indipendente dalla dimensione del file)
+                excel_options = self._excel_options()
                 try:
-                    engine = 'openpyxl' if fpath.lower().endswith('.xlsx') else None
-                    df = pd.read_excel(fpath, header=None, dtype=object, engine=engine)
+                    line, row = next(sf36_batch.iter_excel_rows(fpath, **excel_options), (None, None))
                 except ImportError: messagebox.showerror("Libreria Mancante", "'openpyxl' necessaria per .xlsx. Installala con: pip install openpyxl"); return
+                except (FileNotFoundError, ValueError): raise
                 except Exception as e: raise ValueError(f"Errore lettura Excel: {e}")
+                if row is not None:
+                    df = pd.DataFrame([[cell.strip() or None for cell in row]], dtype=object)
+                    row_label = f"Riga {line}"
             else:
                 messagebox.showerror("Formato Non Supportato", "Selezionare file .csv, .xls o .xlsx"); return
 
@@ -558,12 +680,13 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
             answers_raw = [str(df.iloc[0, i]).strip() if not pd.isna(df.iloc[0, i]) else None for i in range(36)]
             age_str = str(df.iloc[0, 36]).strip() if df.shape[1] > 36 and not pd.isna(df.iloc[0, 36]) else None
             sex_str = str(df.iloc[0, 37]).strip() if df.shape[1] > 37 and not pd.isna(df.iloc[0, 37]) else None
+            if decimal_comma and age_str: age_str = age_str.replace(',', '.') # Es. export italiani "45,0"
 
             # Chiama la libreria per calcolo e validazione interna
             results = sf36_library.calculate_sf36_all_scores(answers_raw, age=age_str, sex=sex_str)
 
             # Aggiorna GUI con risultati e warnings
-            self.display_results(results, f"File: {file_basename} (Riga 1)")
+            self.display_results(results, f"File: {file_basename} ({row_label})")
 
             # Aggiorna campi Age/Sex nella GUI in base a cosa è stato effettivamente usato/validato dalla libreria
             used_input = results.get('input_data', {})
@@ -590,6 +713,96 @@ class SF36_GUI_V6: # Aggiornato nome classe per chiarezza
             import traceback; traceback.print_exc(); self.display_results(None, f"File: {file_basename} (Errore)")
 
 
+    # --- Calcolo batch di tutte le righe del file (thread in background + polling con after) ---
+    def calculate_batch_from_file(self):
+        fpath = self.filepath.get()
+        if not fpath or fpath == "Nessun file selezionato.":
+            messagebox.showwarning("File Mancante", "Selezionare prima un file CSV o XLSX/XLS.")
+            return
+        if not fpath.lower().endswith(('.csv', '.xlsx', '.xls')):
+            messagebox.showerror("Formato Non Supportato", "Selezionare file .csv, .xls o .xlsx"); return
+        if self.batch_thread is not None and self.batch_thread.is_alive():
+            return # Calcolo già in corso
+        options = {}
+        if fpath.lower().endswith(('.xlsx', '.xls')):
+            try: options = self._excel_options()
+            except ValueError as ve: messagebox.showerror("Opzioni Excel", str(ve)); return
+
+        file_stem = os.path.splitext(os.path.basename(fpath))[0]
+        out_path = filedialog.asksaveasfilename(
+            title="Salva Risultati Batch", defaultextension=".csv", initialfile=f"{file_stem}_sf36.csv",
+            filetypes=(("CSV files", "*.csv"), ("All files", "*.*"))
+        )
+        if not out_path: return
+
+        self.batch_queue = queue.Queue()
+        self.batch_cancel = threading.Event()
+        self.batch_thread = threading.Thread(target=self._batch_worker, args=(fpath, out_path, options), daemon=True)
+        self.batch_button.configure(state=tk.DISABLED)
+        self.batch_cancel_button.configure(state=tk.NORMAL)
+        self.batch_progress.configure(mode='determinate', value=0)
+        self.batch_status.set(f"Calcolo in corso: {os.path.basename(fpath)}...")
+        self.batch_thread.start()
+        self.master.after(100, self._poll_batch)
+
+    def _batch_worker(self, fpath, out_path, options):
+        # Eseguito nel thread di background: comunica con la GUI solo tramite batch_queue
+        try:
+            n_rows = sf36_batch.score_file( # Separatore/intestazione rilevati automaticamente (Excel: foglio/riga scelti)
+                fpath, out_path, chunk_size=2000,
+                progress=lambda done, total: self.batch_queue.put(('progress', done, total)),
+                cancel_event=self.batch_cancel, **options
+            )
+            self.batch_queue.put(('done', n_rows, out_path))
+        except Exception as e:
+            self.batch_queue.put(('error', e, None))
+
+    def _poll_batch(self):
+        finished = None
+        try:
+            while True:
+                message = self.batch_queue.get_nowait()
+                if message[0] == 'progress':
+                    _, done, total = message
+                    if total:
+                        self.batch_progress.configure(mode='determinate', value=min(100.0, 100.0 * done / total))
+                        self.batch_status.set(f"{done} / ~{total} righe elaborate...")
+                    else:
+                        self.batch_progress.configure(mode='indeterminate'); self.batch_progress.step(5)
+                        self.batch_status.set(f"{done} righe elaborate...")
+                else:
+                    finished = message
+        except queue.Empty:
+            pass
+
+        if finished is None:
+            self.master.after(100, self._poll_batch)
+            return
+
+        self.batch_button.configure(state=tk.NORMAL)
+        self.batch_cancel_button.configure(state=tk.DISABLED)
+        kind, value, out_path = finished
+        if kind == 'error':
+            self.batch_progress.configure(mode='determinate', value=0)
+            self.batch_status.set("Calcolo batch fallito.")
+            messagebox.showerror("Errore Calcolo Batch", f"Errore durante il calcolo batch:\n{type(value).__name__}: {value}")
+        elif self.batch_cancel.is_set():
+            self.batch_status.set(f"Annullato dopo {value} righe (risultati parziali in {os.path.basename(out_path)}).")
+        else:
+            self.batch_progress.configure(mode='determinate', value=100)
+            self.batch_status.set(f"Completato: {value} righe salvate in {os.path.basename(out_path)}.")
+            self.result_text.config(state=tk.NORMAL)
+            self.result_text.delete('1.0', tk.END)
+            self.result_text.insert(tk.END, f"Calcolo batch completato.\nRighe elaborate: {value}\nRisultati salvati in:\n{out_path}")
+            self.result_text.config(state=tk.DISABLED)
+
+    def cancel_batch(self):
+        if self.batch_cancel is not None and self.batch_thread is not None and self.batch_thread.is_alive():
+            self.batch_cancel.set()
+            self.batch_cancel_button.configure(state=tk.DISABLED)
+            self.batch_status.set("Annullamento in corso...")
+
+
 # -----------------------------------------------------------------------------
 # CLASSE HELPER PER TOOLTIP (Invariata)
 # -----------------------------------------------------------------------------
@@ -0,0 +1,800 @@
+# sf36_batch.py
+# Batch scoring of SF-36 files for sf36_library.py
+# Streams CSV and Excel rows in fixed-size chunks through calculate_sf36_batch and writes
+# the results incrementally (CSV, Parquet, Feather or Arrow IPC), so memory stays
+# flat regardless of file size.
+# Chunks can be spread over a process pool; output keeps the input row order.
+# Cohort statistics (sf36_cohort) can be accumulated in the same pass, and extra norm sets
+# (sf36_norms) add their own Z, PCS/MCS and T columns without rescoring.
+
+import codecs
+import collections
+import concurrent.futures
+import csv
+import functools
+import io
+import math
+import os
+import re
+import struct
+import sys
+import time
+
+import sf36_library
+from sf36_library import SCALES_ORDER, SCALES_FOR_STD, SUMMARY_ORDER, MISSING_TOKENS
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Colonne di output nell'ordine delle matrici restituite da calculate_sf36_batch
+RESULT_COLUMNS = (
+    list(SCALES_ORDER)
+    + [f"Z_{scale}" for scale in SCALES_FOR_STD]
+    + list(SUMMARY_ORDER)
+    + [f"T_{scale}" for scale in SCALES_FOR_STD]
+)
+
+def result_columns(norm_sets=None):
+    """RESULT_COLUMNS seguite dalle colonne dei norm set aggiuntivi (sf36_norms.norm_columns)."""
+    if not norm_sets:
+        return list(RESULT_COLUMNS)
+    import sf36_norms
+    return list(RESULT_COLUMNS) + sf36_norms.norm_columns(norm_sets)
+
+
+# -----------------------------------------------------------------------------
+# RILEVAMENTO FORMATO CSV
+# -----------------------------------------------------------------------------
+
+CSV_DELIMITER_CANDIDATES = (',', ';', '\t', '|')
+SNIFF_SAMPLE_BYTES = 64 * 1024
+_DECIMAL_COMMA_RE = re.compile(r'^\s*-?\d+,\d+\s*$')
+
+def _is_answer_like(cell):
+    """True se la cella è vuota/mancante o numerica (anche con virgola decimale)."""
+    stripped = cell.strip()
+    if stripped.lower() in MISSING_TOKENS:
+        return True
+    try:
+        float(stripped.replace(',', '.'))
+        return True
+    except ValueError:
+        return False
+
+
+def sniff_csv(path, sample_bytes=SNIFF_SAMPLE_BYTES):
+    """
+    Rileva encoding, separatore, separatore decimale e riga di intestazione di un CSV
+    leggendo solo un campione iniziale, così il file viene poi letto una volta sola.
+
+    Returns:
+        dict: 'encoding' (str), 'delimiter' (str), 'decimal' ('.' o ','), 'header' (bool).
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(sample_bytes)
+        truncated = bool(f.read(1))
+    if truncated and b'\n' in sample:
+        sample = sample[:sample.rindex(b'\n')] # Scarta l'ultima riga incompleta
+
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding, text = 'utf-8-sig', sample[len(codecs.BOM_UTF8):].decode('utf-8', errors='replace')
+    else:
+        for encoding in ('utf-8', 'cp1252', 'latin-1'):
+            try:
+                text = sample.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+    lines = [line for line in text.splitlines() if line.strip()][:200]
+
+    # Separatore: quello che produce più righe con almeno 36 campi (a parità, l'ordine dei candidati)
+    delimiter, best_rows, best_score = ',', [], (-1, -1)
+    for candidate in CSV_DELIMITER_CANDIDATES:
+        rows = list(csv.reader(lines, delimiter=candidate))
+        field_counts = sorted(len(row) for row in rows)
+        score = (sum(1 for n in field_counts if n >= 36), field_counts[len(field_counts) // 2] if field_counts else 0)
+        if score > best_score:
+            delimiter, best_rows, best_score = candidate, rows, score
+
+    # Intestazione: almeno metà delle prime 36 celle della prima riga non sono risposte
+    header = bool(best_rows) and sum(1 for cell in best_rows[0][:36] if not _is_answer_like(cell)) >= 18
+
+    # Virgola decimale: solo se non è il separatore e compare in celle numeriche
+    decimal = '.'
+    if delimiter != ',':
+        data_rows = best_rows[1:] if header else best_rows
+        if any(_DECIMAL_COMMA_RE.match(cell) for row in data_rows for cell in row):
+            decimal = ','
+
+    return {'encoding': encoding, 'delimiter': delimiter, 'decimal': decimal, 'header': header}
+
+
+def read_csv_dataframe(path, dialect=None, nrows=None):
+    """Legge un CSV in un DataFrame pandas (celle come stringhe) con un solo passaggio del motore C."""
+    import pandas as pd
+    if dialect is None:
+        dialect = sniff_csv(path)
+    return pd.read_csv(path, sep=dialect['delimiter'], decimal=dialect['decimal'], encoding=dialect['encoding'],
+                       header=0 if dialect['header'] else None, dtype=object, engine='c', nrows=nrows)
+
+
+# -----------------------------------------------------------------------------
+# LETTURA A BLOCCHI
+# -----------------------------------------------------------------------------
+
+_ANSWER_TOKEN_CACHE = {}
+
+def _parse_answer_token(token):
+    """Converte una cella risposta in float (NaN se mancante/non numerica), come calculate_sf36_all_scores."""
+    value = _ANSWER_TOKEN_CACHE.get(token)
+    if value is None:
+        stripped = token.strip()
+        if stripped.lower() in MISSING_TOKENS:
+            value = math.nan
+        else:
+            try:
+                value = float(stripped.replace(',', '.'))
+            except ValueError:
+                value = math.nan
+        if len(_ANSWER_TOKEN_CACHE) < 4096: # Le risposte SF-36 hanno pochi valori distinti
+            _ANSWER_TOKEN_CACHE[token] = value
+    return value
+
+def _parse_demographic_token(token, decimal='.'):
+    """Converte una cella età/sesso in float (NaN se mancante/non numerica)."""
+    try:
+        return float(token.strip().replace(',', '.') if decimal == ',' else token.strip())
+    except ValueError:
+        return math.nan
+
+
+def _rows_to_arrays(rows, first_line, decimal='.'):
+    """Converte righe di stringhe (>= 36 colonne) nelle matrici attese da calculate_sf36_batch."""
+    np = sf36_library.np
+    answers = np.empty((len(rows), 36))
+    ages = np.full(len(rows), np.nan)
+    sexes = np.full(len(rows), np.nan)
+    for n, row in enumerate(rows):
+        if len(row) < 36:
+            raise ValueError(f"Row {first_line + n} has {len(row)} columns (at least 36 required).")
+        answers[n] = [_parse_answer_token(token) for token in row[:36]]
+        if len(row) > 36:
+            ages[n] = _parse_demographic_token(row[36], decimal)
+        if len(row) > 37:
+            sexes[n] = _parse_demographic_token(row[37], decimal)
+    return answers, ages, sexes
+
+
+def _resolve_dialect(path, delimiter=None, header=None):
+    """Rileva il formato del CSV e applica eventuali valori forzati dall'utente (None = automatico)."""
+    dialect = sniff_csv(path)
+    if delimiter is not None:
+        dialect['delimiter'] = delimiter
+    if header is not None:
+        dialect['header'] = header
+    return dialect
+
+
+def _iter_csv_row_chunks(path, chunk_size, dialect):
+    """Legge un CSV a blocchi di righe grezze; yields (rows, numero riga iniziale, separatore decimale)."""
+    with open(path, newline='', encoding=dialect['encoding'], errors='replace') as f:
+        reader = csv.reader(f, delimiter=dialect['delimiter'])
+        if dialect['header']:
+            next(reader, None)
+        rows = []
+        first_line = reader.line_num + 1
+        for row in reader:
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield rows, first_line, dialect['decimal']
+                rows = []
+                first_line = reader.line_num + 1
+        if rows:
+            yield rows, first_line, dialect['decimal']
+
+
+def iter_csv_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, delimiter=None, header=None):
+    """
+    Legge un CSV di risposte SF-36 a blocchi di chunk_size righe.
+
+    Ogni riga contiene 36 risposte seguite opzionalmente da età e sesso.
+    Le righe completamente vuote vengono ignorate. Separatore, intestazione,
+    encoding e virgola decimale sono rilevati con sniff_csv se non forzati.
+
+    Yields:
+        tuple: (answers N x 36, ages N, sexes N) come array NumPy float (NaN = mancante).
+    """
+    if sf36_library.np is None:
+        raise ImportError("Batch scoring requires numpy. Install it with: pip install numpy")
+    for chunk in _iter_csv_row_chunks(path, chunk_size, _resolve_dialect(path, delimiter, header)):
+        yield _rows_to_arrays(*chunk)
+
+
+# -----------------------------------------------------------------------------
+# LETTURA EXCEL (STREAMING)
+# -----------------------------------------------------------------------------
+# I file .xlsx sono letti con openpyxl in modalità read-only: le righe arrivano
+# una alla volta dall'XML del foglio, quindi la memoria non dipende dalla
+# dimensione della cartella di lavoro. I vecchi .xls (xlrd) passano da pandas.
+
+EXCEL_MAX_COLUMNS = 38 # 36 risposte + età + sesso: le colonne successive non vengono lette
+EXCEL_MAX_TITLE_ROWS = 10 # Righe incomplete (titoli, note) cercate sopra un'intestazione rilevata
+
+def _looks_like_header(row):
+    """Intestazione se almeno metà delle prime 36 celle non vuote non sono risposte (come per i CSV)."""
+    return sum(1 for cell in row[:36] if cell.strip() and not _is_answer_like(cell)) >= 18
+
+
+def _resolve_sheet_name(sheet_names, sheet=None):
+    """Nome del foglio da leggere: None = primo, altrimenti nome esatto o indice (0 = primo)."""
+    if sheet is None:
+        return sheet_names[0]
+    if sheet in sheet_names:
+        return sheet
+    try:
+        index = int(sheet)
+    except (TypeError, ValueError):
+        index = None
+    if index is None or not 0 <= index < len(sheet_names):
+        raise ValueError(f"Sheet '{sheet}' not found. Available sheets: {', '.join(sheet_names)}.")
+    return sheet_names[index]
+
+
+def _open_xlsx(path):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("Reading .xlsx files requires openpyxl. Install it with: pip install openpyxl")
+    return openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+
+def list_excel_sheets(path):
+    """Nomi dei fogli di un file Excel, senza leggerne il contenuto."""
+    if path.lower().endswith('.xls'):
+        import pandas as pd
+        with pd.ExcelFile(path) as workbook:
+            return list(workbook.sheet_names)
+    workbook = _open_xlsx(path)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def excel_row_count(path, sheet=None):
+    """Numero di righe dichiarato dal foglio .xlsx (stima per le barre di avanzamento), None se ignoto."""
+    if path.lower().endswith('.xls'):
+        return None
+    workbook = _open_xlsx(path)
+    try:
+        return workbook[_resolve_sheet_name(workbook.sheetnames, sheet)].max_row
+    finally:
+        workbook.close()
+
+
+def _iter_raw_excel_rows(path, sheet=None):
+    """Righe grezze del foglio: yields (numero riga 1-based, celle come stringhe, '' se vuote)."""
+    if path.lower().endswith('.xls'):
+        import pandas as pd
+        with pd.ExcelFile(path) as workbook:
+            df = pd.read_excel(workbook, sheet_name=_resolve_sheet_name(workbook.sheet_names, sheet), header=None,
+                               dtype=object)
+        for line, values in enumerate(df.iloc[:, :EXCEL_MAX_COLUMNS].itertuples(index=False), start=1):
+            yield line, ['' if pd.isna(value) else str(value) for value in values]
+        return
+    workbook = _open_xlsx(path)
+    try:
+        worksheet = workbook[_resolve_sheet_name(workbook.sheetnames, sheet)]
+        worksheet.reset_dimensions() # Non fidarsi delle dimensioni dichiarate (spesso errate negli export)
+        for line, values in enumerate(worksheet.iter_rows(max_col=EXCEL_MAX_COLUMNS, values_only=True), start=1):
+            yield line, ['' if value is None else str(value) for value in values]
+    finally:
+        workbook.close()
+
+
+def iter_excel_rows(path, sheet=None, header=None, header_row=None):
+    """
+    Legge le righe di dati di un file Excel in streaming.
+
+    Args:
+        path (str): File .xlsx (openpyxl, memoria costante) o .xls (pandas/xlrd).
+        sheet (str or int, optional): Nome o indice (0 = primo) del foglio. Default None (primo foglio).
+        header (bool, optional): True se la prima riga non vuota è un'intestazione. Default None (rilevata:
+                                 le righe con meno di 36 celle piene che la precedono, fino a
+                                 EXCEL_MAX_TITLE_ROWS, sono trattate come titoli e saltate).
+        header_row (int, optional): Numero (1-based) della riga di intestazione: le righe fino a questa
+                                    sono saltate (es. titoli sopra la tabella). 0 = nessuna intestazione.
+                                    Ha precedenza su header. Default None.
+
+    Yields:
+        tuple: (numero riga nel foglio, lista di celle stringa; '' = vuota). Le righe vuote sono saltate.
+    """
+    if header_row is not None and header_row < 0:
+        raise ValueError("Header row must be >= 0.")
+    check_header = header_row is None
+    leading = [] # Righe incomplete prima dell'intestazione: titoli se segue un'intestazione, dati altrimenti
+    for line, row in _iter_raw_excel_rows(path, sheet):
+        if header_row is not None and line <= header_row:
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        if check_header:
+            if header:
+                check_header = False
+                continue
+            if header is not None:
+                check_header = False
+            elif _looks_like_header(row):
+                check_header = False
+                leading = []
+                continue
+            elif sum(1 for cell in row[:36] if cell.strip()) < 36 and len(leading) < EXCEL_MAX_TITLE_ROWS:
+                leading.append((line, row))
+                continue
+            else:
+                check_header = False
+            yield from leading
+            leading = []
+        yield line, row
+    yield from leading # Solo righe incomplete: sono dati
+
+
+def _iter_excel_row_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, header=None, sheet=None, header_row=None):
+    """Raggruppa le righe di iter_excel_rows in blocchi; yields (rows, numero riga iniziale)."""
+    rows = []
+    first_line = None
+    for line, row in iter_excel_rows(path, sheet, header, header_row):
+        if not rows:
+            first_line = line
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield rows, first_line
+            rows = []
+    if rows:
+        yield rows, first_line
+
+
+def iter_excel_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, sheet=None, header=None, header_row=None):
+    """
+    Come iter_csv_chunks, per file Excel letti in streaming (opzioni come iter_excel_rows).
+
+    Yields:
+        tuple: (answers N x 36, ages N, sexes N) come array NumPy float (NaN = mancante).
+    """
+    if sf36_library.np is None:
+        raise ImportError("Batch scoring requires numpy. Install it with: pip install numpy")
+    for chunk in _iter_excel_row_chunks(path, chunk_size, header, sheet, header_row):
+        yield _rows_to_arrays(*chunk)
+
+
+def count_csv_lines(path):
+    """Conta le righe di un file leggendolo a blocchi binari (stima del totale per le barre di avanzamento)."""
+    n_lines = 0
+    last_block = b''
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            n_lines += block.count(b'\n')
+            last_block = block
+    if last_block and not last_block.endswith(b'\n'):
+        n_lines += 1
+    return n_lines
+
+
+# -----------------------------------------------------------------------------
+# ESECUZIONE PARALLELA
+# -----------------------------------------------------------------------------
+
+def resolve_workers(workers):
+    """Numero effettivo di processi: 0 o None -> tutti i core disponibili."""
+    if not workers:
+        return os.cpu_count() or 1
+    if workers < 0:
+        raise ValueError("Number of workers must be >= 0.")
+    return workers
+
+
+def map_chunks_ordered(func, chunks, workers=1):
+    """
+    Applica func(*chunk) a ogni blocco, restituendo i risultati nell'ordine di input.
+
+    Con workers > 1 i blocchi sono distribuiti su un pool di processi; al massimo
+    2 * workers blocchi sono in volo contemporaneamente, così la memoria resta
+    limitata anche su input arbitrariamente grandi. func deve essere definita a
+    livello di modulo (picklable).
+    """
+    workers = resolve_workers(workers)
+    if workers == 1:
+        for chunk in chunks:
+            yield func(*chunk)
+        return
+
+    max_pending = 2 * workers
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        try:
+            for chunk in chunks:
+                pending.append(executor.submit(func, *chunk))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending: # Interruzione anticipata (errore o annullamento)
+                future.cancel()
+
+
+# -----------------------------------------------------------------------------
+# SCRITTURA RISULTATI
+# -----------------------------------------------------------------------------
+
+def batch_results_to_matrix(results):
+    """Affianca le matrici di calculate_sf36_batch in un'unica matrice N x len(RESULT_COLUMNS)."""
+    np = sf36_library.np
+    return np.hstack([
+        results['scores_0_100'],
+        results['z_scores_usa'],
+        results['summary_scores_usa'],
+        results['t_scores_ita_age_sex'],
+    ])
+
+def _format_value(value):
+    return '' if value != value else repr(float(value)) # NaN -> cella vuota (N/D)
+
+
+def _matrix_to_csv_text(matrix):
+    """Formatta una matrice di risultati come righe CSV (celle vuote per N/D)."""
+    block = io.StringIO()
+    csv.writer(block).writerows([_format_value(v) for v in row] for row in matrix.tolist())
+    return block.getvalue()
+
+
+def _score_chunk(load, encode, worker_profile, cohort_columns, norm_sets, *chunk):
+    """
+    Worker generico: load(*chunk) -> (answers, ages, sexes), calcolo batch e,
+    se encode non è None, codifica della matrice dei risultati (es. testo CSV).
+
+    Con worker_profile=True (esecuzione parallela con profiling attivo) le fasi del
+    blocco sono raccolte in un profilo locale al processo e restituite come snapshot,
+    da unire al profilo del processo principale. I norm set (sf36_norms.NormSet) sono
+    applicati ai punteggi 0-100 già calcolati e aggiungono le loro colonne. Se
+    cohort_columns non è None restituisce anche le statistiche di coorte del blocco
+    (snapshot di sf36_cohort.CohortAggregator su quelle colonne).
+    """
+    profiler = sf36_library.enable_profiling() if worker_profile else sf36_library.get_profiler()
+    if profiler is not None:
+        lap = time.perf_counter_ns()
+    answers, ages, sexes = load(*chunk)
+    if profiler is not None:
+        profiler.lap('load', lap)
+    results = sf36_library.calculate_sf36_batch(answers, ages, sexes)
+    if profiler is not None:
+        lap = time.perf_counter_ns()
+    matrix = batch_results_to_matrix(results)
+    if norm_sets:
+        import sf36_norms
+        matrix = sf36_library.np.hstack([
+            matrix, sf36_norms.score_norm_sets(results['scores_0_100'], ages, sexes, norm_sets)])
+        if profiler is not None:
+            lap = profiler.lap('norms', lap)
+    payload = encode(matrix) if encode is not None else matrix
+    if profiler is not None:
+        lap = profiler.lap('encode', lap)
+    cohort_snapshot = None
+    if cohort_columns is not None:
+        import sf36_cohort
+        aggregator = sf36_cohort.CohortAggregator(cohort_columns)
+        aggregator.add(matrix, ages, sexes)
+        cohort_snapshot = aggregator.snapshot()
+        if profiler is not None:
+            profiler.lap('aggregate', lap)
+    return len(answers), payload, (profiler.snapshot() if worker_profile else None), cohort_snapshot
+
+
+def _profiled_chunks(chunks, profiler):
+    """Itera i blocchi registrando il tempo di lettura di ciascuno come fase 'read'."""
+    iterator = iter(chunks)
+    while True:
+        lap = time.perf_counter_ns()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        profiler.lap('read', lap)
+        yield chunk
+
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'feather', 'arrow')
+_OUTPUT_EXTENSIONS = {'.parquet': 'parquet', '.pq': 'parquet', '.feather': 'feather',
+                      '.arrow': 'arrow', '.arrows': 'arrow', '.ipc': 'arrow'}
+
+def infer_output_format(output_path):
+    """Formato di output dedotto dall'estensione del file (default 'csv')."""
+    return _OUTPUT_EXTENSIONS.get(os.path.splitext(output_path)[1].lower(), 'csv')
+
+
+class CsvResultWriter:
+    """Scrive i risultati come CSV (celle vuote per N/D); riceve blocchi di testo già formattati dai worker."""
+    encode = staticmethod(_matrix_to_csv_text)
+
+    def __init__(self, output_path, columns=RESULT_COLUMNS):
+        self._out = sys.stdout if output_path == '-' else open(output_path, 'w', newline='', encoding='utf-8')
+        csv.writer(self._out).writerow(columns)
+
+    def write(self, block):
+        self._out.write(block)
+
+    def close(self):
+        if self._out is not sys.stdout:
+            self._out.close()
+
+
+class ColumnarResultWriter:
+    """
+    Scrive i risultati in formato colonnare con pyarrow: una colonna float64 nullable
+    per valore (null = N/D), un row group (Parquet) o record batch (Feather/Arrow IPC)
+    per ogni blocco calcolato, così il file cresce man mano che i blocchi terminano.
+    """
+    encode = None # I worker restituiscono direttamente la matrice dei risultati
+
+    def __init__(self, output_path, output_format, columns=RESULT_COLUMNS):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError(f"'{output_format}' output requires pyarrow. Install it with: pip install pyarrow")
+        if output_path == '-':
+            raise ValueError(f"'{output_format}' output cannot be written to stdout; use --output FILE.")
+        self._pa = pa
+        self.schema = pa.schema([pa.field(column, pa.float64(), nullable=True) for column in columns])
+        self._parquet = output_format == 'parquet'
+        if self._parquet:
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(output_path, self.schema)
+        elif output_format == 'feather': # Feather v2 = formato file Arrow IPC
+            self._writer = pa.ipc.new_file(output_path, self.schema)
+        else:
+            self._writer = pa.ipc.new_stream(output_path, self.schema)
+
+    def write(self, matrix):
+        np = sf36_library.np
+        pa = self._pa
+        arrays = [pa.array(column, mask=np.isnan(column)) for column in matrix.T]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self._parquet:
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+
+
+def open_result_writer(output_path, output_format=None, columns=RESULT_COLUMNS):
+    """Crea lo writer dei risultati per il formato richiesto (None = dedotto dall'estensione)."""
+    output_format = output_format or infer_output_format(output_path)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{output_format}'. Choose one of: {', '.join(OUTPUT_FORMATS)}.")
+    if output_format == 'csv':
+        return CsvResultWriter(output_path, columns)
+    return ColumnarResultWriter(output_path, output_format, columns)
+
+
+def _write_scored_chunks(load, chunks, output_path, workers=1, progress=None, rows_total=None, cancel_event=None,
+                         output_format=None, cohort_stats=None, norm_sets=None):
+    """
+    Carica con load(*chunk) e calcola ogni blocco (in parallelo se workers > 1), scrivendo i risultati in ordine.
+    Se cohort_stats (sf36_cohort.CohortAggregator) è dato, vi unisce le statistiche di ogni blocco.
+    """
+    if sf36_library.np is None:
+        raise ImportError("Batch scoring requires numpy. Install it with: pip install numpy")
+    columns = result_columns(norm_sets)
+    cohort_columns = None
+    if cohort_stats is not None:
+        cohort_columns = cohort_stats.columns
+        if list(cohort_columns) != columns:
+            raise ValueError("Cohort statistics columns do not match the scored columns "
+                             "(create the aggregator with result_columns(norm_sets)).")
+    writer = open_result_writer(output_path, output_format, columns)
+    profiler = sf36_library.get_profiler()
+    if profiler is not None:
+        chunks = _profiled_chunks(chunks, profiler)
+    try:
+        n_rows = 0
+        worker_profile = profiler is not None and resolve_workers(workers) > 1
+        worker = functools.partial(_score_chunk, load, writer.encode, worker_profile, cohort_columns, norm_sets)
+        for chunk_rows, payload, snapshot, cohort_snapshot in map_chunks_ordered(worker, chunks, workers):
+            if cohort_snapshot is not None:
+                cohort_stats.merge(cohort_snapshot)
+            if profiler is not None:
+                if snapshot is not None:
+                    profiler.merge(snapshot)
+                lap = time.perf_counter_ns()
+            writer.write(payload)
+            if profiler is not None:
+                profiler.lap('write', lap)
+            n_rows += chunk_rows
+            if progress is not None:
+                progress(n_rows, rows_total)
+            if cancel_event is not None and cancel_event.is_set():
+                break
+        return n_rows
+    finally:
+        writer.close()
+
+
+def score_csv_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, delimiter=None, header=None, workers=1,
+                   progress=None, cancel_event=None, output_format=None, cohort_stats=None, norm_sets=None):
+    """
+    Calcola i punteggi SF-36 di ogni riga di un CSV scrivendo i risultati a blocchi.
+
+    Args:
+        input_path (str): CSV di input (36 risposte, età e sesso opzionali).
+        output_path (str): File di output ('-' per stdout, solo CSV). Una riga per riga di input,
+                           nello stesso ordine, colonne result_columns(norm_sets), N/D come cella vuota/null.
+        chunk_size (int): Righe lette e calcolate per blocco. Default DEFAULT_CHUNK_SIZE.
+        delimiter (str, optional): Separatore di campo del CSV di input. Default None (rilevato).
+        header (bool, optional): True se la prima riga dell'input è un'intestazione. Default None (rilevata).
+        workers (int): Processi di calcolo (1 = nel processo corrente, 0 = tutti i core). Default 1.
+        progress (callable, optional): Chiamata dopo ogni blocco come progress(righe_fatte, righe_totali_stimate).
+        cancel_event (threading.Event, optional): Se impostato, il calcolo si ferma dopo il blocco corrente.
+        output_format (str, optional): Uno di OUTPUT_FORMATS. Default None (dedotto dall'estensione di output_path).
+        cohort_stats (sf36_cohort.CohortAggregator, optional): Aggregatore in cui accumulare le statistiche
+                                                              di coorte (per sesso e classe d'età) durante il calcolo,
+                                                              creato con le colonne result_columns(norm_sets).
+        norm_sets (list, optional): sf36_norms.NormSet aggiuntivi: ognuno aggiunge colonne Z, PCS/MCS e T
+                                    con prefisso '<nome>.' calcolate dagli stessi punteggi 0-100.
+
+    Returns:
+        int: Numero di righe calcolate (e scritte).
+    """
+    dialect = _resolve_dialect(input_path, delimiter, header)
+    rows_total = count_csv_lines(input_path) - (1 if dialect['header'] else 0) if progress is not None else None
+    chunks = _iter_csv_row_chunks(input_path, chunk_size, dialect)
+    return _write_scored_chunks(_rows_to_arrays, chunks, output_path, workers, progress, rows_total, cancel_event,
+                                output_format, cohort_stats, norm_sets)
+
+
+def score_excel_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, header=None, workers=1,
+                     progress=None, cancel_event=None, output_format=None, sheet=None, header_row=None, cohort_stats=None,
+                     norm_sets=None):
+    """
+    Come score_csv_file, per file Excel letti in streaming (.xlsx con openpyxl; .xls con pandas).
+
+    sheet e header_row selezionano foglio e riga di intestazione come in iter_excel_rows.
+    """
+    rows_total = excel_row_count(input_path, sheet) if progress is not None else None
+    chunks = _iter_excel_row_chunks(input_path, chunk_size, header, sheet, header_row)
+    return _write_scored_chunks(_rows_to_arrays, chunks, output_path, workers, progress, rows_total, cancel_event,
+                                output_format, cohort_stats, norm_sets)
+
+
+# -----------------------------------------------------------------------------
+# FORMATO BINARIO A RECORD FISSI (MEMORY-MAPPED)
+# -----------------------------------------------------------------------------
+# Header di 16 byte (magic, dimensione record, riservato) seguito da record di
+# 38 byte: 36 risposte uint8, età uint8, sesso uint8. BINARY_MISSING = mancante.
+
+BINARY_MAGIC = b'SF36REC1'
+BINARY_HEADER = struct.Struct('<8sII')
+BINARY_MISSING = 255
+
+def _binary_record_dtype():
+    np = sf36_library.np
+    return np.dtype([('answers', np.uint8, (36,)), ('age', np.uint8), ('sex', np.uint8)])
+
+
+def encode_binary_records(answers, ages=None, sexes=None):
+    """
+    Codifica risposte/età/sesso (array float, NaN = mancante) in record binari.
+
+    Valori non interi o non rappresentabili diventano BINARY_MISSING (trattati comunque
+    come mancanti dal calcolo); gli interi fuori range restano tali e vengono scartati
+    dalla validazione. Le età oltre 254 sono limitate a 254 (stessa classe d'età).
+    """
+    np = sf36_library.np
+    answers = np.asarray(answers, dtype=float)
+    records = np.empty(answers.shape[0], dtype=_binary_record_dtype())
+    with np.errstate(invalid='ignore'):
+        ok = np.isfinite(answers) & (answers == np.floor(answers)) & (answers >= 0) & (answers < BINARY_MISSING)
+        records['answers'] = np.where(ok, answers, BINARY_MISSING)
+        if ages is None:
+            records['age'] = BINARY_MISSING
+        else:
+            ages = np.trunc(np.asarray(ages, dtype=float))
+            records['age'] = np.where(np.isfinite(ages), np.clip(ages, 0, BINARY_MISSING - 1), BINARY_MISSING)
+        if sexes is None:
+            records['sex'] = BINARY_MISSING
+        else:
+            sexes = np.trunc(np.asarray(sexes, dtype=float))
+            records['sex'] = np.where(np.isfinite(sexes) & (sexes >= 0) & (sexes < BINARY_MISSING), sexes, BINARY_MISSING)
+    return records
+
+
+def decode_binary_records(records):
+    """Converte record binari in (answers N x 36, ages N, sexes N) float con NaN per i mancanti."""
+    np = sf36_library.np
+    def as_float(codes):
+        return np.where(codes == BINARY_MISSING, np.nan, codes.astype(float))
+    return as_float(records['answers']), as_float(records['age']), as_float(records['sex'])
+
+
+def is_binary_answers_file(path):
+    """True se il file inizia con l'header del formato binario SF-36."""
+    with open(path, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def open_binary_answers(path):
+    """Apre un file binario di risposte come numpy.memmap di record (sola lettura, nessuna copia)."""
+    np = sf36_library.np
+    record_dtype = _binary_record_dtype()
+    with open(path, 'rb') as f:
+        magic, record_size, _ = BINARY_HEADER.unpack(f.read(BINARY_HEADER.size))
+    if magic != BINARY_MAGIC or record_size != record_dtype.itemsize:
+        raise ValueError(f"'{path}' is not an SF-36 binary answers file.")
+    n_records = (os.path.getsize(path) - BINARY_HEADER.size) // record_dtype.itemsize
+    if n_records == 0:
+        return np.empty(0, dtype=record_dtype)
+    return np.memmap(path, dtype=record_dtype, mode='r', offset=BINARY_HEADER.size, shape=(n_records,))
+
+
+def convert_to_binary(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, delimiter=None, header=None,
+                      sheet=None, header_row=None):
+    """
+    Converte un file CSV/Excel di risposte nel formato binario a record fissi, a blocchi.
+
+    Returns:
+        int: Numero di record scritti.
+    """
+    if sf36_library.np is None:
+        raise ImportError("Batch scoring requires numpy. Install it with: pip install numpy")
+    if input_path.lower().endswith(('.xlsx', '.xls')):
+        chunks = _iter_excel_row_chunks(input_path, chunk_size, header, sheet, header_row)
+    elif sheet is not None or header_row is not None:
+        raise ValueError("Sheet and header row selection apply only to Excel input.")
+    else:
+        chunks = _iter_csv_row_chunks(input_path, chunk_size, _resolve_dialect(input_path, delimiter, header))
+    n_records = 0
+    with open(output_path, 'wb') as out:
+        out.write(BINARY_HEADER.pack(BINARY_MAGIC, _binary_record_dtype().itemsize, 0))
+        for chunk in chunks:
+            records = encode_binary_records(*_rows_to_arrays(*chunk))
+            out.write(records.tobytes())
+            n_records += len(records)
+    return n_records
+
+
+def _load_binary_slice(path, start, stop):
+    """Loader per i worker: decodifica i record [start, stop) leggendoli dal memmap."""
+    return decode_binary_records(open_binary_answers(path)[start:stop])
+
+
+def score_binary_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                      progress=None, cancel_event=None, output_format=None, cohort_stats=None, norm_sets=None):
+    """
+    Calcola un file binario di risposte a fette del memmap (opzioni come score_csv_file).
+
+    Ai worker viene passato solo (percorso, inizio, fine): ogni processo mappa il file
+    per conto proprio, quindi i dati non vengono mai copiati tra processi.
+    """
+    n_records = len(open_binary_answers(input_path))
+    chunks = ((input_path, start, min(start + chunk_size, n_records)) for start in range(0, n_records, chunk_size))
+    return _write_scored_chunks(_load_binary_slice, chunks, output_path, workers, progress, n_records, cancel_event,
+                                output_format, cohort_stats, norm_sets)
+
+
+def score_file(input_path, output_path, **options):
+    """
+    Calcola un file CSV, Excel o binario scegliendo il lettore in base al contenuto/estensione
+    (opzioni come score_csv_file; sheet/header_row come score_excel_file, solo per Excel).
+    """
+    if input_path.lower().endswith(('.xlsx', '.xls')):
+        options.pop('delimiter', None)
+        return score_excel_file(input_path, output_path, **options)
+    if options.pop('sheet', None) is not None or options.pop('header_row', None) is not None:
+        raise ValueError("Sheet and header row selection apply only to Excel input.")
+    if is_binary_answers_file(input_path):
+        options.pop('delimiter', None)
+        options.pop('header', None)
+        return score_binary_file(input_path, output_path, **options)
+    return score_csv_file(input_path, output_path, **options)
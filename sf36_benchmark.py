@@ -0,0 +1,303 @@
+# sf36_benchmark.py
+# Benchmark suite for sf36_library.py / sf36_batch.py
+# Misura latenza del singolo record, throughput su coorti sintetiche (sf36_synth)
+# con dati mancanti, ingestione CSV/XLSX (pipeline batch e percorso della GUI) e
+# formattazione JSON/testo, avvio a freddo di script_gui. Risultati in JSON; confronto opzionale con una
+# baseline salvata (exit code 1 se una misura peggiora oltre la soglia).
+#
+# Uso:
+#   python sf36_benchmark.py                                    # suite completa, JSON su stdout
+#   python sf36_benchmark.py --quick --output bench.json        # coorti ridotte
+#   python sf36_benchmark.py --save-baseline bench_baseline.json
+#   python sf36_benchmark.py --baseline bench_baseline.json --threshold 0.2
+#   python sf36_benchmark.py --only startup                     # avvio a freddo di script_gui
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import sf36_library
+import sf36_synth
+from sf36_library import np
+
+BENCH_FORMAT_VERSION = 1
+DEFAULT_THRESHOLD = 0.20 # +20% di tempo per operazione = regressione
+DEFAULT_REPEAT = 5
+DEFAULT_COHORT_ROWS = (10000, 1000000)
+QUICK_COHORT_ROWS = (10000, 100000)
+INGEST_ROWS = 20000
+QUICK_INGEST_ROWS = 5000
+XLSX_ROWS = 2000
+STARTUP_BUDGET_SECONDS = 1.0 # La finestra della GUI deve comparire entro questo tempo
+
+SAMPLE_ANSWERS = [3, 2, 1, 1, 2, 3, 3, 2, 1, 2, 2, 1, 2, 1, 2, 1, 2, 1, 2, 5, 1, 3, 4, 6, 2, 3, 5, 6, 1, 5, 2, 4, 3, 5, 1, 2]
+SAMPLE_ANSWERS_STR = ','.join(str(a) for a in SAMPLE_ANSWERS)
+
+
+# -----------------------------------------------------------------------------
+# COORTI SINTETICHE
+# -----------------------------------------------------------------------------
+
+# Missingness realistica: item sparsi, pagine saltate (9 item consecutivi), età/sesso assenti
+COHORT_RATES = {'missing_rate': 0.03, 'skipped_page_rate': 0.01, 'missing_demographics_rate': 0.05}
+
+def _cohort_rows(answers, ages, sexes):
+    """Converte la coorte in righe Python (None = mancante) come le passerebbe un chiamante scalare."""
+    def cell(v):
+        return None if v != v else int(v)
+    return [([cell(v) for v in row], cell(age), cell(sex)) for row, age, sex in zip(answers.tolist(), ages.tolist(), sexes.tolist())]
+
+
+# -----------------------------------------------------------------------------
+# MISURA
+# -----------------------------------------------------------------------------
+
+def measure(func, repeat=DEFAULT_REPEAT, number=1, ops=1):
+    """
+    Esegue func() number volte per ciascuna delle repeat ripetizioni.
+
+    Returns:
+        dict: tempi per operazione (ops operazioni per chiamata) come mediana/min/max in secondi.
+    """
+    func() # Riscaldamento (cache, tabelle di lookup, import pigri)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / (number * ops))
+    median = statistics.median(samples)
+    return {'seconds_per_op': median, 'min': min(samples), 'max': max(samples),
+            'ops_per_s': 1.0 / median if median > 0 else None, 'repeat': repeat, 'number': number, 'ops': ops}
+
+
+def _calibrate_number(func, target_seconds=0.2):
+    """Numero di chiamate per ripetizione affinché ognuna duri circa target_seconds."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    return max(1, int(target_seconds / elapsed)) if elapsed > 0 else 1000
+
+
+# -----------------------------------------------------------------------------
+# SUITE
+# -----------------------------------------------------------------------------
+
+def _bench_single_record(repeat):
+    results = {}
+    cases = {
+        'single.latency_list': lambda: sf36_library.calculate_sf36_all_scores(SAMPLE_ANSWERS, age=45, sex=1),
+        'single.latency_strings': lambda: sf36_library.calculate_sf36_all_scores(SAMPLE_ANSWERS_STR.split(','), age='45', sex='1'),
+        'single.latency_lean': lambda: sf36_library.calculate_sf36_all_scores(SAMPLE_ANSWERS, age=45, sex=1, lean=True),
+        'single.parse_answers': lambda: sf36_library.parse_answers(SAMPLE_ANSWERS_STR),
+    }
+    for name, func in cases.items():
+        results[name] = measure(func, repeat, _calibrate_number(func))
+    return results
+
+
+def _bench_formatting(repeat):
+    scores = sf36_library.calculate_sf36_all_scores(SAMPLE_ANSWERS, age=45, sex=1)
+    cases = {
+        'format.json': lambda: json.dumps(scores, indent=2),
+        'format.text': lambda: sf36_library.format_results_text(scores),
+    }
+    return {name: measure(func, repeat, _calibrate_number(func)) for name, func in cases.items()}
+
+
+def _bench_throughput(repeat, cohort_rows):
+    results = {}
+    for n_rows in cohort_rows:
+        answers, ages, sexes = sf36_synth.generate_cohort(n_rows, **COHORT_RATES)
+        results[f"throughput.batch_{n_rows}"] = dict(
+            measure(lambda: sf36_library.calculate_sf36_batch(answers, ages, sexes), repeat, ops=n_rows), rows=n_rows)
+    # Percorso scalare solo sulla coorte più piccola (su 1M righe richiederebbe minuti)
+    n_rows = min(cohort_rows)
+    rows = _cohort_rows(*sf36_synth.generate_cohort(n_rows, **COHORT_RATES))
+    def scalar():
+        for answers_row, age, sex in rows:
+            sf36_library.calculate_sf36_all_scores(answers_row, age=age, sex=sex)
+    results[f"throughput.scalar_{n_rows}"] = dict(measure(scalar, max(1, repeat // 2), ops=n_rows), rows=n_rows)
+    return results
+
+
+def _bench_ingestion(repeat, ingest_rows, workdir):
+    import sf36_batch
+    results = {}
+    csv_path = os.path.join(workdir, 'cohort.csv')
+    sf36_synth.write_cohort(csv_path, ingest_rows, seed=1, **COHORT_RATES)
+    out_path = os.path.join(workdir, 'scores.csv')
+    results['ingest.csv_score_file'] = dict(
+        measure(lambda: sf36_batch.score_file(csv_path, out_path), repeat, ops=ingest_rows), rows=ingest_rows)
+    # Percorso di script_gui.calculate_from_file: rilevamento dialetto + lettura della prima riga
+    gui_csv = lambda: sf36_batch.read_csv_dataframe(csv_path, sf36_batch.sniff_csv(csv_path), nrows=1)
+    results['ingest.csv_gui_first_row'] = measure(gui_csv, repeat, _calibrate_number(gui_csv))
+
+    try:
+        import pandas as pd
+        import openpyxl # noqa: F401 (necessario per .xlsx)
+    except ImportError as e:
+        results['ingest.xlsx_score_file'] = {'skipped': f"{e}"}
+        return results
+    n_xlsx = min(XLSX_ROWS, ingest_rows)
+    xlsx_path = os.path.join(workdir, 'cohort.xlsx')
+    answers, ages, sexes = sf36_synth.generate_cohort(n_xlsx, seed=1, **COHORT_RATES)
+    pd.DataFrame(answers[:n_xlsx]).assign(age=ages[:n_xlsx], sex=sexes[:n_xlsx]).to_excel(xlsx_path, index=False, header=False)
+    results['ingest.xlsx_score_file'] = dict(
+        measure(lambda: sf36_batch.score_file(xlsx_path, out_path), repeat, ops=n_xlsx), rows=n_xlsx)
+    # script_gui.calculate_from_file legge in streaming solo la prima riga di dati
+    gui_xlsx = lambda: next(sf36_batch.iter_excel_rows(xlsx_path))
+    results['ingest.xlsx_gui_first_row'] = measure(gui_xlsx, repeat, _calibrate_number(gui_xlsx))
+    return results
+
+
+# Processo figlio per l'avvio a freddo: 'import' importa solo script_gui, 'window' costruisce e disegna la finestra
+_STARTUP_CHILD = """
+import sys
+import script_gui
+if sys.argv[1] == 'window':
+    root = script_gui.tk.Tk()
+    script_gui.SF36_GUI_V6(root)
+    root.update()
+    root.destroy()
+print(','.join(sorted(m for m in ('pandas', 'matplotlib') if m in sys.modules)))
+"""
+
+
+def _bench_startup(repeat):
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def run_child(mode):
+        return subprocess.run([sys.executable, '-c', _STARTUP_CHILD, mode], cwd=here, check=True,
+                              capture_output=True, text=True).stdout.strip()
+
+    results = {}
+    for mode in ('import', 'window'):
+        name = f'startup.gui_{mode}'
+        try:
+            preloaded = run_child(mode)
+        except subprocess.CalledProcessError as e:
+            reason = (e.stderr.strip().splitlines() or ["child process failed"])[-1]
+            results[name] = {'skipped': reason} # Es. tkinter assente o nessun display
+            continue
+        entry = measure(lambda: run_child(mode), repeat)
+        # Processo completo (interprete incluso), come lo percepisce l'utente
+        entry.update(budget_seconds=STARTUP_BUDGET_SECONDS, within_budget=entry['seconds_per_op'] < STARTUP_BUDGET_SECONDS,
+                     preloaded_modules=preloaded.split(',') if preloaded else [])
+        results[name] = entry
+    return results
+
+
+def run_suite(quick=False, repeat=DEFAULT_REPEAT, only=None):
+    """
+    Esegue la suite e ritorna il documento dei risultati (serializzabile in JSON).
+
+    Args:
+        quick (bool): Coorti e file più piccoli. Default False.
+        repeat (int): Ripetizioni per misura (si riporta la mediana). Default DEFAULT_REPEAT.
+        only (list, optional): Gruppi da eseguire tra 'single', 'format', 'throughput', 'ingest', 'startup'. Default tutti.
+    """
+    groups = only or ['single', 'format', 'throughput', 'ingest', 'startup']
+    benchmarks = {}
+    if 'single' in groups:
+        benchmarks.update(_bench_single_record(repeat))
+    if 'format' in groups:
+        benchmarks.update(_bench_formatting(repeat))
+    if np is None and ('throughput' in groups or 'ingest' in groups):
+        benchmarks['throughput'] = {'skipped': "numpy not installed"}
+    else:
+        if 'throughput' in groups:
+            benchmarks.update(_bench_throughput(repeat, QUICK_COHORT_ROWS if quick else DEFAULT_COHORT_ROWS))
+        if 'ingest' in groups:
+            with tempfile.TemporaryDirectory(prefix='sf36_bench_') as workdir:
+                benchmarks.update(_bench_ingestion(repeat, QUICK_INGEST_ROWS if quick else INGEST_ROWS, workdir))
+    if 'startup' in groups:
+        benchmarks.update(_bench_startup(repeat))
+    return {
+        'format_version': BENCH_FORMAT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'numpy': getattr(np, '__version__', None), 'cpu_count': os.cpu_count(), 'quick': quick,
+        },
+        'benchmarks': benchmarks,
+    }
+
+
+def compare_to_baseline(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Confronta le misure presenti in entrambi i documenti sul tempo migliore per
+    operazione ('min'), meno sensibile al rumore della mediana per i microbenchmark.
+
+    Returns:
+        list: Un dict per misura ('name', 'baseline', 'current', 'ratio', 'regression'), ordinati per nome.
+    """
+    rows = []
+    for name, entry in sorted(current['benchmarks'].items()):
+        base = baseline.get('benchmarks', {}).get(name)
+        if not base or 'min' not in entry or 'min' not in base:
+            continue
+        ratio = entry['min'] / base['min'] if base['min'] > 0 else float('inf')
+        rows.append({'name': name, 'baseline': base['min'], 'current': entry['min'],
+                     'ratio': ratio, 'regression': ratio > 1.0 + threshold})
+    return rows
+
+
+def format_comparison_text(rows, threshold):
+    lines = [f"{'Benchmark':<32} {'Baseline':>12} {'Current':>12} {'Ratio':>7}"]
+    for row in rows:
+        flag = "  REGRESSION" if row['regression'] else ""
+        lines.append(f"{row['name']:<32} {row['baseline']:>12.3e} {row['current']:>12.3e} {row['ratio']:>7.2f}{flag}")
+    n_regressions = sum(row['regression'] for row in rows)
+    lines.append(f"{n_regressions} regression(s) above +{threshold:.0%} threshold.")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SF-36 scoring, ingestion and formatting.")
+    parser.add_argument("--quick", action="store_true", help="Use smaller cohorts and files.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"Repetitions per measure (median reported). Default: {DEFAULT_REPEAT}.")
+    parser.add_argument("--only", nargs='+', choices=['single', 'format', 'throughput', 'ingest', 'startup'], help="Run only these groups.")
+    parser.add_argument("--output", default='-', help="Write the JSON results to this file ('-' = stdout). Default: '-'.")
+    parser.add_argument("--baseline", help="Compare against this stored results file; exit code 1 on regression.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Allowed slowdown as a fraction of the baseline time. Default: {DEFAULT_THRESHOLD}.")
+    parser.add_argument("--save-baseline", help="Also store the results as a new baseline file.")
+    args = parser.parse_args()
+
+    if args.repeat <= 0:
+        parser.error("--repeat must be a positive integer.")
+    results = run_suite(quick=args.quick, repeat=args.repeat, only=args.only)
+
+    text = json.dumps(results, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare_to_baseline(results, baseline, args.threshold)
+        print(format_comparison_text(rows, args.threshold), file=sys.stderr)
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+# Example Usage from command line:
+# python sf36_benchmark.py --quick --save-baseline bench_baseline.json --output /dev/null
+# python sf36_benchmark.py --quick --baseline bench_baseline.json --output bench.json
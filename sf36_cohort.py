@@ -0,0 +1,247 @@
+# sf36_cohort.py
+# Streaming cohort statistics for sf36_batch.py
+# Per ogni punteggio (scale 0-100, Z, PCS/MCS, T) calcola N, media, DS, minimo, massimo
+# e percentili, per l'intera coorte, per sesso, per classe d'età delle norme italiane
+# (AGE_SEX_NORMS) e per sesso x classe d'età, in un solo passaggio sui blocchi del
+# calcolo batch: nessuna riga di risultati viene conservata in memoria.
+#
+# Media e varianza usano accumulatori di Welford combinati blocco per blocco con la
+# formula di Chan; i percentili un istogramma a griglia fissa per colonna (precisione
+# pari a mezzo passo della griglia). Aggregati di processi diversi si uniscono con
+# merge(snapshot()), con lo stesso risultato del calcolo in un unico processo.
+#
+# Uso: python sf36_library.py --input answers.csv --output scores.csv --summary cohort_summary.csv
+
+import csv
+import math
+import sys
+
+import sf36_library
+from sf36_library import AGE_CLASS_UPPER_BOUNDS, SUMMARY_ORDER
+from sf36_batch import RESULT_COLUMNS
+
+# Griglie degli istogrammi: (minimo, massimo, passo). I valori fuori griglia cadono nei
+# bin estremi; i percentili restano comunque limitati a minimo/massimo esatti.
+GRID_SCORES = (0.0, 100.0, 0.25)
+GRID_Z = (-10.0, 10.0, 0.05)
+GRID_T = (-100.0, 150.0, 0.25) # PCS/MCS e T per età/sesso (T molto bassi con DS normative piccole)
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+N_SEX_INDICES = 3 # 0 = mancante/non valido, 1 = maschio, 2 = femmina
+N_AGE_CLASSES = 3 + len(AGE_CLASS_UPPER_BOUNDS) # 0 = mancante/non valida, 2..8 come AGE_SEX_NORMS
+SEX_LABELS = {0: 'N/D', 1: '1', 2: '2'}
+SUMMARY_GROUPS = ('all', 'sex', 'age_class', 'sex_age_class')
+
+
+def _age_class_labels():
+    labels = {0: 'N/D', 2: f"<={AGE_CLASS_UPPER_BOUNDS[0]}"}
+    for offset, (lower, upper) in enumerate(zip(AGE_CLASS_UPPER_BOUNDS, AGE_CLASS_UPPER_BOUNDS[1:])):
+        labels[3 + offset] = f"{lower + 1}-{upper}"
+    labels[2 + len(AGE_CLASS_UPPER_BOUNDS)] = f">{AGE_CLASS_UPPER_BOUNDS[-1]}"
+    return labels
+
+AGE_CLASS_LABELS = _age_class_labels()
+
+
+def column_grid(column):
+    """Griglia dell'istogramma per una colonna di RESULT_COLUMNS (anche con prefisso di norm set '<nome>.')."""
+    column = column.rsplit('.', 1)[-1]
+    if column.startswith('Z_'):
+        return GRID_Z
+    if column.startswith('T_') or column in SUMMARY_ORDER:
+        return GRID_T
+    return GRID_SCORES
+
+
+class CohortAggregator:
+    """
+    Accumulatori per cella (sesso, classe d'età) e colonna dei risultati.
+
+    Stato: conteggio, media, somma dei quadrati degli scarti (M2), minimo, massimo e
+    istogramma. Le celle sono combinate solo in summary_rows() per ottenere i gruppi
+    (coorte intera, sesso, classe d'età, sesso x classe d'età).
+    """
+
+    def __init__(self, columns=RESULT_COLUMNS):
+        np = sf36_library.np
+        if np is None:
+            raise ImportError("Cohort statistics require numpy. Install it with: pip install numpy")
+        self.columns = tuple(columns)
+        n_cols = len(self.columns)
+        grids = [column_grid(column) for column in self.columns]
+        self._lo = np.array([lo for lo, _, _ in grids])
+        self._step = np.array([step for _, _, step in grids])
+        self._n_bins = np.array([int(round((hi - lo) / step)) + 1 for lo, hi, step in grids], dtype=np.intp)
+        self._bin_offsets = np.concatenate(([0], np.cumsum(self._n_bins)[:-1])).astype(np.intp)
+        self.total_bins = int(self._n_bins.sum())
+        shape = (N_SEX_INDICES, N_AGE_CLASSES, n_cols)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.hist = np.zeros((N_SEX_INDICES, N_AGE_CLASSES, self.total_bins), dtype=np.int64)
+        self.rows = np.zeros((N_SEX_INDICES, N_AGE_CLASSES), dtype=np.int64) # Righe per cella, anche senza punteggi
+
+    @property
+    def n_rows(self):
+        return int(self.rows.sum())
+
+    def add(self, matrix, ages=None, sexes=None):
+        """
+        Aggiunge un blocco di risultati (matrice N x len(columns), NaN = N/D) con età e sesso.
+
+        Età e sesso mancanti o non validi finiscono nella classe 'N/D'.
+        """
+        np = sf36_library.np
+        matrix = np.asarray(matrix, dtype=float)
+        n_rows, n_cols = matrix.shape
+        if n_cols != len(self.columns):
+            raise ValueError(f"Result matrix has {n_cols} columns, expected {len(self.columns)}.")
+        if ages is None or sexes is None:
+            sex_index = np.zeros(n_rows, dtype=np.intp)
+            age_class = np.zeros(n_rows, dtype=np.intp)
+            if ages is not None:
+                age_class = sf36_library.age_sex_classes(ages, np.ones(n_rows))[1]
+            if sexes is not None:
+                sex_index = sf36_library.age_sex_classes(np.ones(n_rows), sexes)[0]
+        else:
+            sex_index, age_class = sf36_library.age_sex_classes(ages, sexes)
+        cell = sex_index * N_AGE_CLASSES + age_class
+        self.rows += np.bincount(cell, minlength=self.rows.size).reshape(self.rows.shape)
+
+        valid = ~np.isnan(matrix)
+        rows, cols = np.nonzero(valid)
+        values = matrix[rows, cols]
+        n_cells = N_SEX_INDICES * N_AGE_CLASSES
+        key = cell[rows] * n_cols + cols # (cella, colonna) appiattite
+
+        # Welford sul blocco (due passaggi: media, poi scarti), poi combinazione con lo stato
+        count = np.bincount(key, minlength=n_cells * n_cols)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(key, weights=values, minlength=n_cells * n_cols) / count
+        m2 = np.bincount(key, weights=(values - mean[key]) ** 2, minlength=n_cells * n_cols)
+        low = np.full(n_cells * n_cols, np.inf)
+        high = np.full(n_cells * n_cols, -np.inf)
+        np.minimum.at(low, key, values)
+        np.maximum.at(high, key, values)
+        shape = self.count.shape
+        self._combine(count.reshape(shape), np.nan_to_num(mean).reshape(shape), m2.reshape(shape),
+                      low.reshape(shape), high.reshape(shape))
+
+        bins = np.clip(np.rint((values - self._lo[cols]) / self._step[cols]), 0, self._n_bins[cols] - 1).astype(np.intp)
+        flat_bins = cell[rows] * self.total_bins + self._bin_offsets[cols] + bins
+        self.hist += np.bincount(flat_bins, minlength=n_cells * self.total_bins).reshape(self.hist.shape)
+        return n_rows
+
+    def _combine(self, count, mean, m2, low, high):
+        """Formula di Chan: unisce (count, mean, m2) allo stato; min/max/istogramma si sommano a parte."""
+        np = sf36_library.np
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, count / total, 0.0)
+            self.m2 = self.m2 + m2 + np.where(total > 0, delta ** 2 * self.count * weight, 0.0)
+        self.mean = self.mean + delta * weight
+        self.count = total
+        self.min = np.minimum(self.min, low)
+        self.max = np.maximum(self.max, high)
+
+    def snapshot(self):
+        """Stato serializzabile (da un processo worker), da unire con merge()."""
+        return {'columns': self.columns, 'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min, 'max': self.max, 'hist': self.hist, 'rows': self.rows}
+
+    def merge(self, snapshot):
+        """Unisce un aggregato prodotto altrove (es. da un worker) con snapshot()."""
+        if tuple(snapshot['columns']) != self.columns:
+            raise ValueError("Cannot merge cohort statistics computed on different columns.")
+        self._combine(snapshot['count'], snapshot['mean'], snapshot['m2'], snapshot['min'], snapshot['max'])
+        self.hist += snapshot['hist']
+        self.rows += snapshot['rows']
+
+    @staticmethod
+    def _reduce(count, mean, m2, low, high, hist, axes):
+        """Combina le celle lungo gli assi indicati (stessa formula di _combine, su più celle)."""
+        np = sf36_library.np
+        total = count.sum(axis=axes)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grand_mean = np.where(total > 0, (count * mean).sum(axis=axes) / total, np.nan)
+        centered = np.expand_dims(np.nan_to_num(grand_mean), axes)
+        m2_total = (m2 + count * (mean - centered) ** 2).sum(axis=axes)
+        return total, grand_mean, m2_total, low.min(axis=axes), high.max(axis=axes), hist.sum(axis=axes)
+
+    def _quantiles(self, hist, column, low, high, quantiles):
+        """Quantile inferiore (primo valore della griglia con frequenza cumulata >= q * N), limitato a min/max."""
+        np = sf36_library.np
+        j = self.columns.index(column)
+        offset = self._bin_offsets[j]
+        cumulative = np.cumsum(hist[offset:offset + self._n_bins[j]])
+        n = cumulative[-1]
+        out = []
+        for q in quantiles:
+            rank = max(1, math.ceil(q * n))
+            index = int(np.searchsorted(cumulative, rank))
+            out.append(min(max(self._lo[j] + index * self._step[j], low), high))
+        return out
+
+    def summary_rows(self, quantiles=DEFAULT_QUANTILES, groups=SUMMARY_GROUPS):
+        """
+        Tabella riassuntiva, una riga per gruppo e colonna con almeno un valore.
+
+        Yields:
+            dict: 'group', 'sex', 'age_class' (etichette; '' se il gruppo non le distingue),
+                  'variable', 'n', 'mean', 'sd' (campionaria, N-1), 'min', 'p<q>', 'max'.
+        """
+        np = sf36_library.np
+        state = (self.count, self.mean, self.m2, self.min, self.max)
+        layouts = {
+            'all': ((0, 1), lambda index: ('', '')),
+            'sex': ((1,), lambda index: (SEX_LABELS[index[0]], '')),
+            'age_class': ((0,), lambda index: ('', AGE_CLASS_LABELS.get(index[0], ''))),
+            'sex_age_class': ((), lambda index: (SEX_LABELS[index[0]], AGE_CLASS_LABELS.get(index[1], ''))),
+        }
+        for group in groups:
+            axes, labels = layouts[group]
+            count, mean, m2, low, high, hist = self._reduce(*state, self.hist, axes) if axes else (*state, self.hist)
+            for index in np.ndindex(count.shape[:-1]):
+                if group in ('age_class', 'sex_age_class') and index[-1] == 1:
+                    continue # Classe 1 non usata dalle norme
+                if not count[index].any():
+                    continue
+                sex_label, age_label = labels(index)
+                for j, column in enumerate(self.columns):
+                    n = int(count[index][j])
+                    if n == 0:
+                        continue
+                    row = {'group': group, 'sex': sex_label, 'age_class': age_label, 'variable': column, 'n': n,
+                           'mean': float(mean[index][j]),
+                           'sd': math.sqrt(m2[index][j] / (n - 1)) if n > 1 else math.nan,
+                           'min': float(low[index][j])}
+                    values = self._quantiles(hist[index], column, low[index][j], high[index][j], quantiles)
+                    row.update((quantile_label(q), float(v)) for q, v in zip(quantiles, values))
+                    row['max'] = float(high[index][j])
+                    yield row
+
+    def write_summary_csv(self, output_path, quantiles=DEFAULT_QUANTILES):
+        """Scrive summary_rows() come CSV ('-' = stdout); N/D come cella vuota. Ritorna le righe scritte."""
+        fields = ['group', 'sex', 'age_class', 'variable', 'n', 'mean', 'sd', 'min'] + \
+                 [quantile_label(q) for q in quantiles] + ['max']
+        out = sys.stdout if output_path == '-' else open(output_path, 'w', newline='', encoding='utf-8')
+        try:
+            writer = csv.DictWriter(out, fieldnames=fields)
+            writer.writeheader()
+            n_rows = 0
+            for row in self.summary_rows(quantiles):
+                writer.writerow({k: ('' if isinstance(v, float) and math.isnan(v) else
+                                     round(v, 4) if isinstance(v, float) else v) for k, v in row.items()})
+                n_rows += 1
+            return n_rows
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+def quantile_label(q):
+    """Nome della colonna di un quantile: 0.5 -> 'p50', 0.025 -> 'p2.5'."""
+    return f"p{q * 100:g}"
@@ -5,7 +5,19 @@
 
 import math
 import argparse
+import array
+import collections
+import hashlib
 import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import numpy as np # Necessario solo per il calcolo batch vettoriale
+except ImportError:
+    np = None
 
 # -----------------------------------------------------------------------------
 # COSTANTI E DATI DI RIFERIMENTO (da index.html Ver6)
@@ -90,211 +102,956 @@ ITEM_RECODE_MAP = {
 }
 
 
+# -----------------------------------------------------------------------------
+# PIANO DI CALCOLO PRECOMPILATO
+# -----------------------------------------------------------------------------
+
+SUMMARY_ORDER = ['PCS', 'MCS']
+AGE_CLASS_UPPER_BOUNDS = [24, 34, 44, 54, 64, 74] # Classi 2..7, oltre -> 8
+
+class ScoringPlan:
+    """
+    Tabelle di calcolo compilate una sola volta dalle costanti del modulo.
+
+    Le ricodifiche sono appiattite in tabelle dense per item (indice = risposta grezza),
+    le scale in tuple (nome, indici, minimo item validi), le medie/DS USA e i pesi
+    PCS/MCS in coefficienti lineari (intercetta + un coefficiente per scala) e le norme
+    italiane in una tabella [sesso][classe età] -> ((media, DS), ...) per scala.
+    Usato sia dal calcolo scalare che da quello batch.
+    """
+
+    def __init__(self):
+        self.item_min = tuple(ITEM_VALID_RANGES[i][0] for i in range(36))
+        self.item_max = tuple(ITEM_VALID_RANGES[i][1] for i in range(36))
+        # item_recode[item][raw] -> punteggio 0-100 dell'item (None se raw non valido)
+        self.item_recode = tuple(
+            tuple(ITEM_RECODE_MAP[i].get(raw) for raw in range(7)) for i in range(36)
+        )
+        self.ht_index = SCALE_INDICES['HT'][0]
+        # Scale multi-item nell'ordine SCALES_FOR_STD: (nome, indici, minimo validi)
+        self.scale_specs = tuple(
+            (scale, tuple(SCALE_INDICES[scale]),
+             math.ceil(len(SCALE_INDICES[scale]) / 2.0) if len(SCALE_INDICES[scale]) > 1 else 1)
+            for scale in SCALES_FOR_STD
+        )
+        self.us_means = tuple(US_MEANS[s] for s in SCALES_FOR_STD)
+        self.us_sds = tuple(US_SDS[s] for s in SCALES_FOR_STD)
+        # PCS/MCS = 50 + 10 * sum(w * (score - mean) / sd) = intercept + sum(coef * score)
+        self.summary_coefs = tuple(
+            (50 - 10 * sum(WEIGHTS[summary][s] * US_MEANS[s] / US_SDS[s] for s in SCALES_FOR_STD),
+             tuple(10 * WEIGHTS[summary][s] / US_SDS[s] for s in SCALES_FOR_STD))
+            for summary in SUMMARY_ORDER
+        )
+        # age_sex_norms[sex][age_class] -> ((media, DS), ...) per scala, None se assente
+        self.age_sex_norms = tuple(
+            tuple(
+                tuple((AGE_SEX_NORMS[sex][age_class][s]['mean'], AGE_SEX_NORMS[sex][age_class][s]['sd'])
+                      for s in SCALES_FOR_STD)
+                if sex in AGE_SEX_NORMS and age_class in AGE_SEX_NORMS[sex] else None
+                for age_class in range(9)
+            )
+            for sex in range(3)
+        )
+        self._batch_tables = None
+        self._lookup_tables = None
+
+    @staticmethod
+    def age_class(age_num):
+        """Classe di età delle norme italiane (2..8) per un'età > 0."""
+        for offset, upper in enumerate(AGE_CLASS_UPPER_BOUNDS):
+            if age_num <= upper:
+                return 2 + offset
+        return 2 + len(AGE_CLASS_UPPER_BOUNDS)
+
+    def score(self, answers, age_num=None, sex_num=None):
+        """
+        Calcola i punteggi da risposte già validate (int nel range o None).
+
+        Returns:
+            tuple: (scores 0-100 in ordine SCALES_ORDER, z-scores in ordine SCALES_FOR_STD,
+                    (PCS, MCS), T-scores in ordine SCALES_FOR_STD). None se non calcolabili.
+        """
+        scores = self.scale_scores(answers)
+        std_scores = scores[:-1]
+        return (scores, self.z_scores(std_scores), self.summary_scores(std_scores),
+                self.t_scores(std_scores, age_num, sex_num))
+
+    # Fasi di score(), separate per la strumentazione (vedi StageProfiler)
+
+    def scale_scores(self, answers):
+        """Punteggi 0-100 delle 9 scale (ordine SCALES_ORDER), None se sotto il minimo di item validi."""
+        item_recode = self.item_recode
+        scores = []
+        if self._lookup_tables is not None:
+            # Tabelle di lookup già costruite: un accesso per scala (NaN = N/D)
+            for indices, strides, _, table_view in self._lookup_tables:
+                code = 0
+                for idx, stride in zip(indices, strides):
+                    raw = answers[idx]
+                    if raw is not None:
+                        code += raw * stride
+                score = table_view[code]
+                scores.append(score if score == score else None)
+        else:
+            for _, indices, min_valid in self.scale_specs:
+                total = 0
+                valid_count = 0
+                for idx in indices:
+                    raw = answers[idx]
+                    if raw is not None:
+                        total += item_recode[idx][raw]
+                        valid_count += 1
+                scores.append(total / valid_count if valid_count >= min_valid else None)
+        ht_raw = answers[self.ht_index]
+        scores.append(item_recode[self.ht_index][ht_raw] if ht_raw is not None else None)
+        return scores
+
+    def scale_score(self, position, answers):
+        """Punteggio 0-100 di una sola scala (posizione in SCALES_ORDER), identico a scale_scores()."""
+        item_recode = self.item_recode
+        if position == len(self.scale_specs): # HT, item singolo
+            ht_raw = answers[self.ht_index]
+            return item_recode[self.ht_index][ht_raw] if ht_raw is not None else None
+        _, indices, min_valid = self.scale_specs[position]
+        total = 0
+        valid_count = 0
+        for idx in indices:
+            raw = answers[idx]
+            if raw is not None:
+                total += item_recode[idx][raw]
+                valid_count += 1
+        return total / valid_count if valid_count >= min_valid else None
+
+    def z_scores(self, std_scores):
+        """Z-scores USA delle 8 scale standardizzabili."""
+        return [(score - mean) / sd if score is not None else None
+                for score, mean, sd in zip(std_scores, self.us_means, self.us_sds)]
+
+    def summary_scores(self, std_scores):
+        """(PCS, MCS) USA; None se manca anche una sola scala."""
+        summaries = [None, None]
+        if None not in std_scores:
+            for k, (intercept, coefs) in enumerate(self.summary_coefs):
+                value = intercept
+                for coef, score in zip(coefs, std_scores):
+                    value += coef * score
+                summaries[k] = value
+        return summaries
+
+    def t_scores(self, std_scores, age_num=None, sex_num=None):
+        """T-scores italiani per età/sesso; None se età/sesso non validi o norme assenti."""
+        if age_num is not None and sex_num is not None:
+            norms = self.age_sex_norms[sex_num][self.age_class(age_num)]
+            if norms is not None:
+                return [(((score - mean) / sd) * 10) + 50 if score is not None and sd else None
+                        for score, (mean, sd) in zip(std_scores, norms)]
+        return [None] * len(std_scores)
+
+    def _definition_digest(self):
+        """Impronta delle definizioni di scale/ricodifiche (invalida le tabelle su disco se cambiano)."""
+        definition = repr((self.scale_specs, self.item_min, self.item_max, self.item_recode))
+        return hashlib.sha1(definition.encode('utf-8')).hexdigest()[:16]
+
+    def _build_scale_table(self, indices, min_valid):
+        """Tabella esaustiva di una scala: codice a base mista degli stati degli item -> punteggio (NaN = N/D)."""
+        n_codes = 1
+        for idx in indices:
+            n_codes *= self.item_max[idx] + 1
+        codes = np.arange(n_codes)
+        total = np.zeros(n_codes)
+        valid_count = np.zeros(n_codes, dtype=np.int64)
+        stride = 1
+        for idx in indices:
+            radix = self.item_max[idx] + 1 # Stato 0 = mancante, 1..max = risposta
+            state = (codes // stride) % radix
+            recode_row = np.array([np.nan if v is None else v for v in self.item_recode[idx][:radix]])
+            state_value = recode_row[state]
+            valid = ~np.isnan(state_value)
+            total += np.where(valid, state_value, 0.0)
+            valid_count += valid
+            stride *= radix
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(valid_count >= min_valid, total / valid_count, np.nan)
+
+    def build_lookup_tables(self, cache_dir=None):
+        """
+        Costruisce (o carica dalla cache su disco) le tabelle di lookup per scala.
+
+        Ogni punteggio 0-100 dipende solo dagli item della sua scala, ognuno con al più
+        sette stati (mancante o risposta valida): codificando gli stati in base mista
+        il punteggio diventa un singolo accesso a tabella (PF: 4^10 voci, circa 8 MB).
+        Una volta costruite vengono usate sia dal calcolo scalare che da quello batch.
+
+        Args:
+            cache_dir (str, optional): Cartella della cache su disco. Default: $SF36_CACHE_DIR
+                                       o ~/.cache/sf36. La cache è facoltativa: errori di
+                                       scrittura vengono ignorati.
+
+        Returns:
+            list: (indici, stride, tabella NumPy, memoryview) per scala, ordine SCALES_FOR_STD.
+        """
+        if self._lookup_tables is not None:
+            return self._lookup_tables
+        if np is None:
+            raise ImportError("Lookup tables require numpy. Install it with: pip install numpy")
+        if cache_dir is None:
+            cache_dir = os.environ.get('SF36_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'sf36')
+        cache_path = os.path.join(cache_dir, f"scale_luts_{self._definition_digest()}.npz")
+
+        tables = None
+        try:
+            with np.load(cache_path) as cached:
+                tables = {scale: cached[scale] for scale, _, _ in self.scale_specs}
+        except (OSError, KeyError, ValueError):
+            tables = None
+        if tables is None:
+            tables = {scale: self._build_scale_table(indices, min_valid) for scale, indices, min_valid in self.scale_specs}
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, **tables)
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                pass
+
+        lookup_tables = []
+        for scale, indices, _ in self.scale_specs:
+            strides = []
+            stride = 1
+            for idx in indices:
+                strides.append(stride)
+                stride *= self.item_max[idx] + 1
+            table = np.ascontiguousarray(tables[scale], dtype=np.float64)
+            lookup_tables.append((indices, tuple(strides), table, memoryview(table)))
+        self._lookup_tables = lookup_tables
+        return lookup_tables
+
+    def batch_tables(self):
+        """Versioni NumPy (costruite al primo uso) delle tabelle per il calcolo batch."""
+        if self._batch_tables is None:
+            recode = np.full((36, 7), np.nan)
+            for item, row in enumerate(self.item_recode):
+                for raw, value in enumerate(row):
+                    if value is not None:
+                        recode[item, raw] = value
+            norm_means = np.full((3, 9, len(SCALES_FOR_STD)), np.nan)
+            norm_sds = np.full((3, 9, len(SCALES_FOR_STD)), np.nan)
+            for sex_num, by_age in enumerate(self.age_sex_norms):
+                for age_class, norms in enumerate(by_age):
+                    if norms is not None:
+                        norm_means[sex_num, age_class] = [mean for mean, _ in norms]
+                        norm_sds[sex_num, age_class] = [sd for _, sd in norms]
+            self._batch_tables = {
+                'valid_min': np.array(self.item_min, dtype=float),
+                'valid_max': np.array(self.item_max, dtype=float),
+                'recode': recode,
+                'us_means': np.array(self.us_means),
+                'us_sds': np.array(self.us_sds),
+                'norm_means': norm_means,
+                'norm_sds': norm_sds,
+            }
+        return self._batch_tables
+
+
+_SCORING_PLAN = None
+
+def get_scoring_plan(rebuild=False):
+    """
+    Ritorna lo ScoringPlan condiviso, costruendolo al primo uso (o se rebuild=True,
+    es. dopo aver modificato le tabelle normative; svuota anche la cache dei risultati).
+    """
+    global _SCORING_PLAN
+    if _SCORING_PLAN is None or rebuild:
+        _SCORING_PLAN = ScoringPlan()
+        if _SCORE_CACHE is not None:
+            _SCORE_CACHE.clear()
+    return _SCORING_PLAN
+
+
+# -----------------------------------------------------------------------------
+# CACHE LRU DEI RISULTATI
+# -----------------------------------------------------------------------------
+
+class ScoreCache:
+    """
+    Cache LRU limitata dei punteggi calcolati da ScoringPlan.score.
+
+    La chiave è la rappresentazione compatta (bytes) delle 36 risposte validate più
+    classe d'età e sesso, quindi questionari identici (anche con età diverse nella
+    stessa classe) vengono calcolati una sola volta. Avvisi ed eco dell'input non
+    sono in cache: dipendono dai valori grezzi e vengono sempre ricostruiti.
+    """
+
+    def __init__(self, maxsize=100000):
+        if maxsize <= 0:
+            raise ValueError("Cache maxsize must be a positive integer.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def score(self, plan, answers, age_num=None, sex_num=None):
+        """Come plan.score(...), ma ritorna il risultato in cache se già calcolato (tuple)."""
+        if age_num is None or sex_num is None:
+            age_class, sex_key = 0, 0 # T-Scores non calcolabili: età/sesso irrilevanti
+        else:
+            age_class, sex_key = plan.age_class(age_num), sex_num
+        key = bytes([0 if raw is None else raw for raw in answers] + [age_class, sex_key])
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        result = tuple(tuple(values) for values in plan.score(answers, age_num, sex_num))
+        with self._lock:
+            self._entries[key] = result
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        """Svuota la cache e azzera i contatori (da chiamare se cambiano le tabelle normative)."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Contatori della cache: hits, misses, evictions, size, maxsize."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+_SCORE_CACHE = None
+
+def enable_score_cache(maxsize=100000):
+    """Attiva (o ridimensiona, svuotandola) la cache LRU usata da calculate_sf36_all_scores."""
+    global _SCORE_CACHE
+    _SCORE_CACHE = ScoreCache(maxsize)
+    return _SCORE_CACHE
+
+def disable_score_cache():
+    """Disattiva la cache dei risultati."""
+    global _SCORE_CACHE
+    _SCORE_CACHE = None
+
+def get_score_cache():
+    """Ritorna la ScoreCache attiva, o None se disattivata (default)."""
+    return _SCORE_CACHE
+
+
+# -----------------------------------------------------------------------------
+# STRUMENTAZIONE (PROFILING PER FASE)
+# -----------------------------------------------------------------------------
+
+PROFILE_HISTOGRAM_BUCKETS = 64 # Bucket k: durate in [2^(k-1), 2^k) ns
+
+class StageProfiler:
+    """
+    Contatori cumulativi e istogrammi (bucket logaritmici in base 2) dei tempi per fase.
+
+    Le fasi sono registrate da calculate_sf36_all_scores, calculate_sf36_batch, dal
+    batch di sf36_batch e dalla CLI solo quando il profiling è attivo: disattivato
+    costa un solo controllo per chiamata. snapshot()/merge() permettono di sommare i
+    profili raccolti nei processi worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Azzera fasi e righe."""
+        self.rows = 0
+        self._stages = {} # fase -> [chiamate, totale_ns, min_ns, max_ns, istogramma]
+
+    def record(self, stage, elapsed_ns):
+        """Registra una durata (ns) per la fase indicata."""
+        bucket = min(elapsed_ns.bit_length(), PROFILE_HISTOGRAM_BUCKETS - 1)
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = [0, 0, elapsed_ns, elapsed_ns, [0] * PROFILE_HISTOGRAM_BUCKETS]
+            stats[0] += 1
+            stats[1] += elapsed_ns
+            if elapsed_ns < stats[2]:
+                stats[2] = elapsed_ns
+            if elapsed_ns > stats[3]:
+                stats[3] = elapsed_ns
+            stats[4][bucket] += 1
+
+    def lap(self, stage, since_ns):
+        """Registra il tempo trascorso da since_ns per la fase e ritorna l'istante attuale (ns)."""
+        now = time.perf_counter_ns()
+        self.record(stage, now - since_ns)
+        return now
+
+    def add_rows(self, n_rows):
+        """Conta le righe (questionari) calcolate."""
+        with self._lock:
+            self.rows += n_rows
+
+    def snapshot(self):
+        """Copia dei contatori come dict semplice (serializzabile/picklable)."""
+        with self._lock:
+            return {'rows': self.rows,
+                    'stages': {stage: {'calls': calls, 'total_ns': total, 'min_ns': low, 'max_ns': high,
+                                       'histogram': list(histogram)}
+                               for stage, (calls, total, low, high, histogram) in self._stages.items()}}
+
+    def merge(self, snapshot):
+        """Somma a questo profilo uno snapshot (es. raccolto in un processo worker)."""
+        with self._lock:
+            self.rows += snapshot['rows']
+            for stage, other in snapshot['stages'].items():
+                stats = self._stages.get(stage)
+                if stats is None:
+                    self._stages[stage] = [other['calls'], other['total_ns'], other['min_ns'], other['max_ns'],
+                                           list(other['histogram'])]
+                    continue
+                stats[0] += other['calls']
+                stats[1] += other['total_ns']
+                stats[2] = min(stats[2], other['min_ns'])
+                stats[3] = max(stats[3], other['max_ns'])
+                stats[4] = [a + b for a, b in zip(stats[4], other['histogram'])]
+
+    @staticmethod
+    def percentile_ns(histogram, q):
+        """Percentile approssimato (limite superiore del bucket) da un istogramma di snapshot()."""
+        target = q * sum(histogram)
+        seen = 0
+        for bucket, count in enumerate(histogram):
+            seen += count
+            if count and seen >= target:
+                return 2 ** bucket
+        return 0
+
+    def format_report(self, wall_seconds=None):
+        """Tabella testuale per fase (totale, quota, media, p50/p99) con righe/secondo."""
+        snapshot = self.snapshot()
+        stages = snapshot['stages']
+        grand_total = sum(stats['total_ns'] for stats in stages.values()) or 1
+        lines = ["--- SF-36 Profile ---",
+                 f"{'Stage':<14} {'Calls':>10} {'Total (s)':>10} {'Share':>7} {'Mean (us)':>10} {'p50 (us)':>9} {'p99 (us)':>9}"]
+        for stage, stats in sorted(stages.items(), key=lambda item: -item[1]['total_ns']):
+            lines.append(f"{stage:<14} {stats['calls']:>10} {stats['total_ns'] / 1e9:>10.3f} "
+                         f"{stats['total_ns'] / grand_total:>7.1%} {stats['total_ns'] / stats['calls'] / 1e3:>10.2f} "
+                         f"{self.percentile_ns(stats['histogram'], 0.5) / 1e3:>9.1f} "
+                         f"{self.percentile_ns(stats['histogram'], 0.99) / 1e3:>9.1f}")
+        rows = snapshot['rows']
+        elapsed = wall_seconds if wall_seconds is not None else grand_total / 1e9
+        rate = f"{rows / elapsed:,.0f} rows/s" if elapsed > 0 else "n/a"
+        lines.append(f"Rows: {rows} in {elapsed:.3f} s ({'wall' if wall_seconds is not None else 'sum of stages'}) -> {rate}")
+        if wall_seconds is not None and grand_total / 1e9 > wall_seconds:
+            lines.append("(Stage time exceeds wall time: stages ran concurrently in worker processes.)")
+        return "\n".join(lines)
+
+
+_PROFILER = None
+
+def enable_profiling(profiler=None):
+    """Attiva il profiling per fase (con un nuovo StageProfiler o quello indicato) e lo ritorna."""
+    global _PROFILER
+    _PROFILER = profiler if profiler is not None else StageProfiler()
+    return _PROFILER
+
+def disable_profiling():
+    """Disattiva il profiling (default): nessun costo sui calcoli."""
+    global _PROFILER
+    _PROFILER = None
+
+def get_profiler():
+    """Ritorna lo StageProfiler attivo, o None se il profiling è disattivato."""
+    return _PROFILER
+
+
 # -----------------------------------------------------------------------------
 # FUNZIONE DI CALCOLO PRINCIPALE
 # -----------------------------------------------------------------------------
 
-def calculate_sf36_all_scores(answers, age=None, sex=None):
+MISSING_TOKENS = ('none', 'null', 'na', '')
+INTEGER_ARRAY_TYPECODES = 'bBhHiIlLqQ'
+
+# --- Codici di avviso per età/sesso (testo generato solo quando richiesto) ---
+WARN_AGE_NOT_POSITIVE = 1
+WARN_AGE_INVALID = 2
+WARN_SEX_OUT_OF_RANGE = 3
+WARN_SEX_INVALID = 4
+
+DEMOGRAPHIC_WARNING_TEXTS = {
+    WARN_AGE_NOT_POSITIVE: "Age '{age}' is not positive. Age/Sex T-Scores not calculated.",
+    WARN_AGE_INVALID: "Age '{age}' is not a valid integer. Age/Sex T-Scores not calculated.",
+    WARN_SEX_OUT_OF_RANGE: "Sex '{sex}' is not 1 (Male) or 2 (Female). Age/Sex T-Scores not calculated.",
+    WARN_SEX_INVALID: "Sex '{sex}' is not a valid integer (1 or 2). Age/Sex T-Scores not calculated.",
+}
+
+ANSWER_OK = 0
+ANSWER_OUT_OF_RANGE = 1
+ANSWER_INVALID = 2
+
+def _parse_answer(ans, item_min, item_max):
+    """
+    Valida una singola risposta come il percorso generale di calculate_sf36_all_scores
+    (lì resta in linea nel ciclo, per non pagare una chiamata per item); ritorna (int o None, ANSWER_*).
+    """
+    if ans is None or (isinstance(ans, str) and ans.strip().lower() in MISSING_TOKENS):
+        return None, ANSWER_OK
+    try:
+        val_num = float(str(ans).replace(',', '.')) # Handle potential float/comma input first
+        if val_num != math.floor(val_num):
+             raise ValueError("Not an integer") # Consider non-integer as invalid
+        val_int = int(val_num)
+    except (ValueError, TypeError):
+        return None, ANSWER_INVALID
+    if not (item_min <= val_int <= item_max):
+        return None, ANSWER_OUT_OF_RANGE
+    return val_int, ANSWER_OK
+
+
+def _answer_warning(i, ans, status, item_min, item_max):
+    if status == ANSWER_OUT_OF_RANGE:
+        return f"Answer {i+1} ('{ans}') out of range ({item_min}-{item_max}). Treated as missing."
+    return f"Invalid answer {i+1} ('{ans}'). Must be integer or None. Treated as missing."
+
+
+def _validate_age_sex(age, sex):
+    """Valida età/sesso forniti; ritorna (age_num, sex_num, codici avviso) con None se non validi."""
+    age_num = None
+    sex_num = None
+    warning_codes = []
+    if age is not None and str(age).strip() != "":
+        try:
+            age_num = int(float(str(age).strip()))
+            if age_num <= 0:
+                 warning_codes.append(WARN_AGE_NOT_POSITIVE)
+                 age_num = None
+        except (ValueError, TypeError):
+            warning_codes.append(WARN_AGE_INVALID)
+    if sex is not None and str(sex).strip() != "":
+        try:
+            sex_num = int(float(str(sex).strip()))
+            if sex_num not in [1, 2]:
+                warning_codes.append(WARN_SEX_OUT_OF_RANGE)
+                sex_num = None
+        except (ValueError, TypeError):
+            warning_codes.append(WARN_SEX_INVALID)
+    return age_num, sex_num, warning_codes
+
+
+class SF36Result:
+    """
+    Risultato compatto di calculate_sf36_all_scores(..., lean=True).
+
+    I punteggi sono liste nell'ordine di SCALES_ORDER / SCALES_FOR_STD / SUMMARY_ORDER
+    (None se non calcolabili). Le risposte scartate sono registrate come bitmask
+    per item (bit i = item i+1) e gli avvisi su età/sesso come codici WARN_*;
+    il testo degli avvisi viene generato solo da warnings / to_dict().
+    """
+    __slots__ = ('scores_0_100', 'z_scores_usa', 'summary_scores_usa', 't_scores_ita_age_sex',
+                 'out_of_range_mask', 'invalid_mask', 'demographic_warnings', 'age_provided', 'sex_provided')
+
+    def __init__(self, scores_0_100, z_scores_usa, summary_scores_usa, t_scores_ita_age_sex,
+                 out_of_range_mask=0, invalid_mask=0, demographic_warnings=(), age_provided=None, sex_provided=None):
+        self.scores_0_100 = scores_0_100
+        self.z_scores_usa = z_scores_usa
+        self.summary_scores_usa = summary_scores_usa
+        self.t_scores_ita_age_sex = t_scores_ita_age_sex
+        self.out_of_range_mask = out_of_range_mask
+        self.invalid_mask = invalid_mask
+        self.demographic_warnings = demographic_warnings
+        self.age_provided = age_provided
+        self.sex_provided = sex_provided
+
+    @property
+    def has_warnings(self):
+        return bool(self.out_of_range_mask or self.invalid_mask or self.demographic_warnings)
+
+    @property
+    def warnings(self):
+        """Testo degli avvisi (senza i valori grezzi delle risposte, non conservati in modalità lean)."""
+        plan = get_scoring_plan()
+        texts = []
+        for i in range(36):
+            if self.out_of_range_mask >> i & 1:
+                texts.append(f"Answer {i+1} out of range ({plan.item_min[i]}-{plan.item_max[i]}). Treated as missing.")
+            elif self.invalid_mask >> i & 1:
+                texts.append(f"Invalid answer {i+1}. Must be integer or None. Treated as missing.")
+        texts.extend(DEMOGRAPHIC_WARNING_TEXTS[code].format(age=self.age_provided, sex=self.sex_provided)
+                     for code in self.demographic_warnings)
+        return texts
+
+    def to_dict(self):
+        """Struttura dict di calculate_sf36_all_scores (con 'answers' = None: non riportate in modalità lean)."""
+        return {
+            'input_data': {
+                'answers': None,
+                'age_provided': self.age_provided,
+                'sex_provided': self.sex_provided,
+                'warnings': self.warnings
+            },
+            'scores_0_100': dict(zip(SCALES_ORDER, self.scores_0_100)),
+            'z_scores_usa': dict(zip(SCALES_FOR_STD, self.z_scores_usa)),
+            'summary_scores_usa': dict(zip(SUMMARY_ORDER, self.summary_scores_usa)),
+            't_scores_ita_age_sex': dict(zip(SCALES_FOR_STD, self.t_scores_ita_age_sex))
+        }
+
+
+def calculate_sf36_all_scores(answers, age=None, sex=None, lean=False):
     """
     Calcola punteggi SF-36 (0-100), Z-Scores (USA), PCS/MCS (USA),
     e T-Scores per Età/Sesso (ITA).
 
     Args:
         answers (list): Lista di 36 risposte (int, float, str convertibile a int, o None).
+                        Accetta anche tuple, array.array e array NumPy 1-D; liste/tuple di
+                        soli int/None e array interi usano un percorso di validazione veloce.
         age (int, str, optional): Età del paziente. Default None.
         sex (int, str, optional): Sesso del paziente (1='Male', 2='Female'). Default None.
+        lean (bool, optional): Se True ritorna un SF36Result compatto, senza eco delle
+                               risposte e con avvisi come bitmask/codici. Default False.
 
     Returns:
         dict: Contiene 'scores_0_100', 'z_scores_usa', 'summary_scores_usa' (PCS/MCS),
               't_scores_ita_age_sex'. Valori sono float o None se non calcolabili.
               Include anche 'input_data' con i valori usati e eventuali 'warnings'.
+              Con lean=True: SF36Result.
     """
+    profiler = _PROFILER
+    if profiler is not None:
+        lap = time.perf_counter_ns()
+
+    # Input già tipizzati (array di interi) -> lista di int Python per il percorso veloce
+    typed_input = False
+    if isinstance(answers, array.array) and answers.typecode in INTEGER_ARRAY_TYPECODES:
+        answers, typed_input = answers.tolist(), True
+    elif np is not None and isinstance(answers, np.ndarray) and answers.ndim == 1:
+        typed_input = answers.dtype.kind in 'iu'
+        answers = answers.tolist()
+    elif isinstance(answers, tuple):
+        answers = list(answers)
     if not isinstance(answers, list) or len(answers) != 36:
-        raise ValueError("Input 'answers' must be a list of 36 elements.")
+        raise ValueError("Input 'answers' must be a list (or tuple/array) of 36 elements.")
 
+    plan = get_scoring_plan()
+    item_min = plan.item_min
+    item_max = plan.item_max
     processed_answers = [None] * 36
     input_warnings = []
+    out_of_range_mask = 0
+    invalid_mask = 0
 
     # 1. Process and Validate Answers
-    for i, ans in enumerate(answers):
-        item_range = ITEM_VALID_RANGES.get(i)
-        min_val, max_val = item_range if item_range else (None, None)
+    if typed_input or all(type(ans) is int or ans is None for ans in answers):
+        # Percorso veloce: int già puliti, validati con le tabelle dei range (nessuna conversione stringa)
+        for i, ans in enumerate(answers):
+            if ans is None:
+                continue
+            if item_min[i] <= ans <= item_max[i]:
+                processed_answers[i] = ans
+            else:
+                out_of_range_mask |= 1 << i
+                if not lean:
+                    input_warnings.append(f"Answer {i+1} ('{ans}') out of range ({item_min[i]}-{item_max[i]}). Treated as missing.")
+    else:
+        # Percorso generale tollerante a stringhe (GUI, CSV)
+        for i, ans in enumerate(answers):
+            if ans is None or (isinstance(ans, str) and ans.strip().lower() in MISSING_TOKENS):
+                continue
 
-        if ans is None or (isinstance(ans, str) and ans.strip().lower() in ['none', 'null', 'na', '']):
-            processed_answers[i] = None
-            continue
+            try:
+                val_num = float(str(ans).replace(',', '.')) # Handle potential float/comma input first
+                if val_num != math.floor(val_num):
+                     raise ValueError("Not an integer") # Consider non-integer as invalid
+                val_int = int(val_num)
 
-        try:
-            val_num = float(str(ans).replace(',', '.')) # Handle potential float/comma input first
-            if val_num != math.floor(val_num):
-                 raise ValueError("Not an integer") # Consider non-integer as invalid
-            val_int = int(val_num)
-
-            if min_val is not None and max_val is not None:
-                if not (min_val <= val_int <= max_val):
-                     input_warnings.append(f"Answer {i+1} ('{ans}') out of range ({min_val}-{max_val}). Treated as missing.")
-                     processed_answers[i] = None
+                if not (item_min[i] <= val_int <= item_max[i]):
+                     out_of_range_mask |= 1 << i
+                     if not lean:
+                         input_warnings.append(f"Answer {i+1} ('{ans}') out of range ({item_min[i]}-{item_max[i]}). Treated as missing.")
                 else:
                      processed_answers[i] = val_int
-            else: # Should not happen with ITEM_VALID_RANGES defined
-                 processed_answers[i] = val_int # Store if no range check possible
 
-        except (ValueError, TypeError):
-            input_warnings.append(f"Invalid answer {i+1} ('{ans}'). Must be integer or None. Treated as missing.")
-            processed_answers[i] = None
-
-    answers = processed_answers # Use validated & processed answers
+            except (ValueError, TypeError):
+                invalid_mask |= 1 << i
+                if not lean:
+                    input_warnings.append(f"Invalid answer {i+1} ('{ans}'). Must be integer or None. Treated as missing.")
 
     # 2. Process and Validate Age/Sex
-    age_num = None
-    sex_num = None
-    if age is not None and str(age).strip() != "":
-        try:
-            age_num = int(float(str(age).strip()))
-            if age_num <= 0:
-                 input_warnings.append(f"Age '{age}' is not positive. Age/Sex T-Scores not calculated.")
-                 age_num = None
-        except (ValueError, TypeError):
-            input_warnings.append(f"Age '{age}' is not a valid integer. Age/Sex T-Scores not calculated.")
-    if sex is not None and str(sex).strip() != "":
-        try:
-            sex_num = int(float(str(sex).strip()))
-            if sex_num not in [1, 2]:
-                input_warnings.append(f"Sex '{sex}' is not 1 (Male) or 2 (Female). Age/Sex T-Scores not calculated.")
-                sex_num = None
-        except (ValueError, TypeError):
-            input_warnings.append(f"Sex '{sex}' is not a valid integer (1 or 2). Age/Sex T-Scores not calculated.")
+    age_num, sex_num, demographic_warnings = _validate_age_sex(age, sex)
 
+    # 3-6. Scale 0-100, Z-Scores USA, PCS/MCS USA, T-Scores ITA (tramite ScoringPlan)
+    cache = _SCORE_CACHE
+    if profiler is not None:
+        lap = profiler.lap('validate', lap)
+        if cache is not None:
+            scores, z_scores, summaries, t_scores = cache.score(plan, processed_answers, age_num, sex_num)
+            lap = profiler.lap('cached_score', lap)
+        else:
+            scores = plan.scale_scores(processed_answers)
+            lap = profiler.lap('scales', lap)
+            z_scores = plan.z_scores(scores[:-1])
+            lap = profiler.lap('z_scores', lap)
+            summaries = plan.summary_scores(scores[:-1])
+            lap = profiler.lap('pcs_mcs', lap)
+            t_scores = plan.t_scores(scores[:-1], age_num, sex_num)
+            lap = profiler.lap('t_scores', lap)
+    elif cache is not None:
+        scores, z_scores, summaries, t_scores = cache.score(plan, processed_answers, age_num, sex_num)
+    else:
+        scores, z_scores, summaries, t_scores = plan.score(processed_answers, age_num, sex_num)
 
-    results = {
+    if lean:
+        result = SF36Result(scores, z_scores, summaries, t_scores, out_of_range_mask, invalid_mask,
+                            demographic_warnings, age, sex)
+        if profiler is not None:
+            profiler.lap('assemble', lap)
+            profiler.add_rows(1)
+        return result
+
+    input_warnings.extend(DEMOGRAPHIC_WARNING_TEXTS[code].format(age=age, sex=sex) for code in demographic_warnings)
+    result = {
         'input_data': {
-            'answers': answers, # Le risposte effettivamente usate
+            'answers': processed_answers, # Le risposte effettivamente usate
             'age_provided': age,
             'sex_provided': sex,
             'warnings': input_warnings
         },
-        'scores_0_100': {scale: None for scale in SCALES_ORDER},
-        'z_scores_usa': {scale: None for scale in SCALES_FOR_STD},
-        'summary_scores_usa': {'PCS': None, 'MCS': None},
-        't_scores_ita_age_sex': {scale: None for scale in SCALES_FOR_STD}
+        'scores_0_100': dict(zip(SCALES_ORDER, scores)),
+        'z_scores_usa': dict(zip(SCALES_FOR_STD, z_scores)),
+        'summary_scores_usa': dict(zip(SUMMARY_ORDER, summaries)),
+        't_scores_ita_age_sex': dict(zip(SCALES_FOR_STD, t_scores))
     }
+    if profiler is not None:
+        profiler.lap('assemble', lap)
+        profiler.add_rows(1)
+    return result
 
-    # 3. --- Calcolo Punteggi Scale 0-100 ---
-    # Uses the method of averaging the 0-100 recoded scores of valid items
-    for scale, indices in SCALE_INDICES.items():
-        if scale == 'HT': continue # HT calculated separately
-
-        num_items_in_scale = len(indices)
-        raw_answers_for_scale = [answers[idx] for idx in indices] # Use already validated answers
-
-        recoded_scores = []
-        valid_item_count = 0
-
-        for i, raw_answer in enumerate(raw_answers_for_scale):
-            item_index = indices[i]
-            recode_map_for_item = ITEM_RECODE_MAP.get(item_index)
-
-            # Check if raw_answer is valid (not None after initial validation)
-            if raw_answer is not None and recode_map_for_item:
-                recoded_value = recode_map_for_item.get(raw_answer)
-                # Check if recode value exists (should always if range check passed)
-                if recoded_value is not None:
-                     recoded_scores.append(recoded_value)
-                     valid_item_count += 1
-            # else: treat None or value not in recode map (due to earlier range error) as missing
-
-        # Calculate score if enough valid items
-        min_valid = math.ceil(num_items_in_scale / 2.0) if num_items_in_scale > 1 else 1
-        if valid_item_count >= min_valid:
-            # Score is the average of the 0-100 contributions of the valid items
-            results['scores_0_100'][scale] = sum(recoded_scores) / valid_item_count
-        else:
-            results['scores_0_100'][scale] = None
-
-    # Calcolo HT (0-100)
-    ht_index = SCALE_INDICES['HT'][0]
-    ht_raw = answers[ht_index] # Already validated
-    recode_map_ht = ITEM_RECODE_MAP.get(ht_index)
-    if ht_raw is not None and recode_map_ht:
-        results['scores_0_100']['HT'] = recode_map_ht.get(ht_raw)
-    else:
-        results['scores_0_100']['HT'] = None
 
-    # 4. --- Calcolo Z-Scores (Standardizzazione USA) ---
-    all_scores_valid_for_summaries = True
-    for scale in SCALES_FOR_STD:
-        score = results['scores_0_100'].get(scale)
-        if score is not None and not math.isnan(score) and scale in US_MEANS and scale in US_SDS:
-            try:
-                if US_SDS[scale] == 0: raise ZeroDivisionError
-                results['z_scores_usa'][scale] = (score - US_MEANS[scale]) / US_SDS[scale]
-            except ZeroDivisionError:
-                results['z_scores_usa'][scale] = None
-                all_scores_valid_for_summaries = False
+# -----------------------------------------------------------------------------
+# CALCOLO INCREMENTALE (INSERIMENTO LIVE)
+# -----------------------------------------------------------------------------
+
+class IncrementalScorer:
+    """
+    Stato di un questionario in compilazione, ricalcolato solo dove serve.
+
+    Quando cambia una risposta si ricalcola solo la scala che la contiene e, se il
+    suo punteggio cambia, il relativo Z, PCS/MCS e il relativo T; età/sesso
+    ricalcolano solo i T. result() restituisce lo stesso dict di
+    calculate_sf36_all_scores(answers, age, sex) per lo stato corrente.
+    """
+
+    def __init__(self):
+        plan = get_scoring_plan()
+        self.plan = plan
+        # item -> posizione della scala in SCALES_ORDER (HT = ultima)
+        self.item_scale = [None] * 36
+        for position, (_, indices, _) in enumerate(plan.scale_specs):
+            for idx in indices:
+                self.item_scale[idx] = position
+        self.item_scale[plan.ht_index] = len(plan.scale_specs)
+        self.raw = [None] * 36 # Valori come forniti
+        self.answers = [None] * 36 # Valori validati (int o None)
+        self.item_warnings = {} # indice item -> testo dell'avviso
+        self.age = None
+        self.sex = None
+        self.age_num = None
+        self.sex_num = None
+        self.demographic_warnings = []
+        self.scores = plan.scale_scores(self.answers)
+        self.z_scores = plan.z_scores(self.scores[:-1])
+        self.summaries = plan.summary_scores(self.scores[:-1])
+        self.t_scores = plan.t_scores(self.scores[:-1])
+
+    def set_answer(self, index, value):
+        """
+        Aggiorna la risposta dell'item index (0-35) e i soli punteggi che ne dipendono.
+
+        Returns:
+            list: Nomi delle scale il cui punteggio è cambiato (vuota se nessun effetto).
+        """
+        if value == self.raw[index] and type(value) is type(self.raw[index]):
+            return []
+        self.raw[index] = value
+        plan = self.plan
+        parsed, status = _parse_answer(value, plan.item_min[index], plan.item_max[index])
+        if status == ANSWER_OK:
+            self.item_warnings.pop(index, None)
         else:
-            results['z_scores_usa'][scale] = None
-            all_scores_valid_for_summaries = False
+            self.item_warnings[index] = _answer_warning(index, value, status, plan.item_min[index], plan.item_max[index])
+        if parsed == self.answers[index]:
+            return []
+        self.answers[index] = parsed
+        position = self.item_scale[index]
+        score = plan.scale_score(position, self.answers)
+        if score == self.scores[position]:
+            return []
+        self.scores[position] = score
+        if position < len(plan.scale_specs): # Scala standardizzabile: Z, PCS/MCS e T della scala
+            std_scores = self.scores[:-1]
+            self.z_scores[position] = (score - plan.us_means[position]) / plan.us_sds[position] if score is not None else None
+            self.summaries = plan.summary_scores(std_scores)
+            self.t_scores[position] = self._t_score(position, score)
+        return [SCALES_ORDER[position]]
+
+    def set_demographics(self, age=None, sex=None):
+        """Aggiorna età/sesso; ritorna le scale i cui T sono cambiati."""
+        if (age, sex) == (self.age, self.sex):
+            return []
+        self.age, self.sex = age, sex
+        age_num, sex_num, self.demographic_warnings = _validate_age_sex(age, sex)
+        if (age_num, sex_num) == (self.age_num, self.sex_num):
+            return []
+        self.age_num, self.sex_num = age_num, sex_num
+        t_scores = self.plan.t_scores(self.scores[:-1], age_num, sex_num)
+        changed = [scale for scale, old, new in zip(SCALES_FOR_STD, self.t_scores, t_scores) if old != new]
+        self.t_scores = t_scores
+        return changed
+
+    def _t_score(self, position, score):
+        """T per età/sesso di una sola scala, come ScoringPlan.t_scores()."""
+        if score is None or self.age_num is None or self.sex_num is None:
+            return None
+        norms = self.plan.age_sex_norms[self.sex_num][self.plan.age_class(self.age_num)]
+        if norms is None:
+            return None
+        mean, sd = norms[position]
+        return (((score - mean) / sd) * 10) + 50 if sd else None
+
+    def result(self):
+        """Dict dei risultati come calculate_sf36_all_scores per le risposte ed età/sesso correnti."""
+        warnings = [self.item_warnings[i] for i in sorted(self.item_warnings)]
+        warnings.extend(DEMOGRAPHIC_WARNING_TEXTS[code].format(age=self.age, sex=self.sex)
+                        for code in self.demographic_warnings)
+        return {
+            'input_data': {
+                'answers': list(self.answers),
+                'age_provided': self.age,
+                'sex_provided': self.sex,
+                'warnings': warnings
+            },
+            'scores_0_100': dict(zip(SCALES_ORDER, self.scores)),
+            'z_scores_usa': dict(zip(SCALES_FOR_STD, self.z_scores)),
+            'summary_scores_usa': dict(zip(SUMMARY_ORDER, self.summaries)),
+            't_scores_ita_age_sex': dict(zip(SCALES_FOR_STD, self.t_scores))
+        }
+
+
+# -----------------------------------------------------------------------------
+# CALCOLO VETTORIALE (BATCH NUMPY)
+# -----------------------------------------------------------------------------
+
+def age_sex_classes(ages, sexes, upper_bounds=AGE_CLASS_UPPER_BOUNDS):
+    """
+    Indici vettoriali di sesso e classe d'età delle norme italiane.
+
+    Args:
+        upper_bounds (sequence, optional): Limiti superiori delle classi (altri norm set,
+                                           vedi sf36_norms). Default AGE_CLASS_UPPER_BOUNDS.
+
+    Returns:
+        tuple: (sex_index, age_class) array intp di N elementi: sesso 1/2 e classe 2..8,
+               0 se il valore è mancante o non valido (età troncata, come nel calcolo scalare).
+    """
+    ages = np.asarray(ages, dtype=float).reshape(-1)
+    sexes = np.asarray(sexes, dtype=float).reshape(-1)
+    with np.errstate(invalid='ignore'):
+        age_num = np.trunc(ages)
+        sex_num = np.trunc(sexes)
+        age_ok = np.isfinite(age_num) & (age_num > 0)
+        sex_ok = (sex_num == 1) | (sex_num == 2)
+    age_class = np.where(age_ok, 2 + np.searchsorted(upper_bounds, np.where(age_ok, age_num, 0)), 0)
+    return np.where(sex_ok, sex_num, 0).astype(np.intp), age_class.astype(np.intp)
 
-    # 5. --- Calcolo Indici Sintetici USA (PCS/MCS) ---
-    if all_scores_valid_for_summaries:
-        try:
-            pcs_raw = sum(results['z_scores_usa'][scale] * WEIGHTS['PCS'][scale] for scale in SCALES_FOR_STD)
-            mcs_raw = sum(results['z_scores_usa'][scale] * WEIGHTS['MCS'][scale] for scale in SCALES_FOR_STD)
-            results['summary_scores_usa']['PCS'] = (pcs_raw * 10) + 50
-            results['summary_scores_usa']['MCS'] = (mcs_raw * 10) + 50
-        except Exception: # Catch any potential issues during calculation
-            results['summary_scores_usa']['PCS'] = None
-            results['summary_scores_usa']['MCS'] = None
-    else:
-        results['summary_scores_usa']['PCS'] = None
-        results['summary_scores_usa']['MCS'] = None
-
-    # 6. --- Calcolo Punteggi T Standardizzati per Età/Sesso (ITA) ---
-    # Uses age_num and sex_num validated in step 2
-    age_class = 0
-    can_calculate_age_sex = False
-
-    if age_num is not None: # Already validated > 0
-        if age_num <= 24: age_class = 2
-        elif age_num <= 34: age_class = 3
-        elif age_num <= 44: age_class = 4
-        elif age_num <= 54: age_class = 5
-        elif age_num <= 64: age_class = 6
-        elif age_num <= 74: age_class = 7
-        else: age_class = 8 # > 74
-
-    if sex_num is not None and age_class > 0: # Sex already validated as 1 or 2
-         can_calculate_age_sex = True
-
-    if can_calculate_age_sex:
-        for scale in SCALES_FOR_STD:
-            score_0100 = results['scores_0_100'].get(scale)
-            try:
-                # Ensure keys exist before accessing
-                if sex_num in AGE_SEX_NORMS and \
-                   age_class in AGE_SEX_NORMS[sex_num] and \
-                   scale in AGE_SEX_NORMS[sex_num][age_class]:
-
-                    norms = AGE_SEX_NORMS[sex_num][age_class][scale]
-                    mean = norms.get('mean')
-                    sd = norms.get('sd')
-
-                    if score_0100 is not None and not math.isnan(score_0100) and \
-                       mean is not None and sd is not None and sd != 0:
-                        t_score = (((score_0100 - mean) / sd) * 10) + 50
-                        results['t_scores_ita_age_sex'][scale] = t_score
-                    else:
-                        # Score missing, norms missing, or SD is zero
-                        results['t_scores_ita_age_sex'][scale] = None
-                else:
-                    # Norms not found for this specific sex/age/scale combination
-                     results['t_scores_ita_age_sex'][scale] = None
 
-            except Exception: # Catch potential errors during calculation
-                results['t_scores_ita_age_sex'][scale] = None
-    # else: T-scores remain None if age/sex not valid or missing
+def calculate_sf36_batch(answers, ages=None, sexes=None):
+    """
+    Versione vettoriale di calculate_sf36_all_scores per N questionari.
 
-    return results
+    Applica la stessa validazione (valori non interi o fuori range trattati come
+    mancanti), la stessa regola della metà degli item validi per scala e produce
+    esattamente gli stessi numeri della funzione scalare.
+
+    Args:
+        answers (array-like): Matrice N x 36 di risposte numeriche. NaN o None = mancante.
+        ages (array-like, optional): N età in anni. NaN = mancante. Default None.
+        sexes (array-like, optional): N valori di sesso (1='Male', 2='Female'). NaN = mancante. Default None.
+
+    Returns:
+        dict: 'scores_0_100' (N x 9, ordine SCALES_ORDER), 'z_scores_usa' (N x 8, ordine
+              SCALES_FOR_STD), 'summary_scores_usa' (N x 2, ordine SUMMARY_ORDER),
+              't_scores_ita_age_sex' (N x 8, ordine SCALES_FOR_STD). NaN se non calcolabili.
+    """
+    if np is None:
+        raise ImportError("Batch scoring requires numpy. Install it with: pip install numpy")
+    profiler = _PROFILER
+    if profiler is not None:
+        lap = time.perf_counter_ns()
+
+    raw = np.asarray(answers, dtype=float)
+    if raw.ndim != 2 or raw.shape[1] != 36:
+        raise ValueError("Input 'answers' must be an N x 36 array.")
+    n_rows = raw.shape[0]
+    plan = get_scoring_plan()
+    tables = plan.batch_tables()
+
+    # 1. Validazione risposte (interi nel range dell'item, altrimenti mancanti)
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(raw) & (raw == np.floor(raw)) & \
+                (raw >= tables['valid_min']) & (raw <= tables['valid_max'])
+    codes = np.where(valid, raw, 0).astype(np.intp) # 0 = mancante
+    if profiler is not None:
+        lap = profiler.lap('validate', lap)
+
+    # 2. Punteggi scale 0-100 (tabelle di lookup per scala: codice a base mista -> punteggio o NaN)
+    scores = np.empty((n_rows, len(SCALES_ORDER)))
+    for j, (indices, strides, table, _) in enumerate(plan.build_lookup_tables()):
+        scores[:, j] = table[codes[:, list(indices)] @ np.array(strides, dtype=np.intp)]
+    scores[:, -1] = tables['recode'][plan.ht_index, codes[:, plan.ht_index]]
+    if profiler is not None:
+        lap = profiler.lap('scales', lap)
+
+    # 3. Z-Scores USA
+    std_scores = scores[:, :len(SCALES_FOR_STD)]
+    z_scores = (std_scores - tables['us_means']) / tables['us_sds']
+    if profiler is not None:
+        lap = profiler.lap('z_scores', lap)
+
+    # 4. PCS/MCS USA (stessi coefficienti e ordine di somma del calcolo scalare; NaN se manca una scala)
+    summaries = np.empty((n_rows, len(SUMMARY_ORDER)))
+    for k, (intercept, coefs) in enumerate(plan.summary_coefs):
+        value = np.full(n_rows, intercept)
+        for j, coef in enumerate(coefs):
+            value = value + coef * std_scores[:, j]
+        summaries[:, k] = value
+    if profiler is not None:
+        lap = profiler.lap('pcs_mcs', lap)
+
+    # 5. T-Scores ITA per Età/Sesso
+    t_scores = np.full((n_rows, len(SCALES_FOR_STD)), np.nan)
+    if ages is not None and sexes is not None:
+        sex_index, age_class = age_sex_classes(ages, sexes)
+        age_class = np.where(sex_index > 0, age_class, 0)
+        means = tables['norm_means'][sex_index, age_class]
+        sds = tables['norm_sds'][sex_index, age_class]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_scores = np.where(sds != 0, (((std_scores - means) / sds) * 10) + 50, np.nan)
+    if profiler is not None:
+        profiler.lap('t_scores', lap)
+        profiler.add_rows(n_rows)
+
+    return {
+        'scores_0_100': scores,
+        'z_scores_usa': z_scores,
+        'summary_scores_usa': summaries,
+        't_scores_ita_age_sex': t_scores,
+    }
 
 
 # -----------------------------------------------------------------------------
@@ -327,18 +1084,24 @@ def parse_answers(answers_str):
     return answers
 
 def format_results_text(results):
-    """Formatta i risultati per output testuale leggibile."""
+    """Formatta i risultati (dict o SF36Result) per output testuale leggibile."""
+    if isinstance(results, SF36Result):
+        results = results.to_dict() # Testo degli avvisi generato solo qui
+
     output = []
     output.append("--- SF-36 Calculation Results ---")
 
     # Input Data Info
     output.append("\nInput Data:")
-    answers_display = [str(a) if a is not None else 'None' for a in results['input_data']['answers']]
-    if len(answers_display) > 10:
-         answers_str = ",".join(answers_display[:5]) + ",...," + ",".join(answers_display[-5:])
+    if results['input_data']['answers'] is None:
+         output.append("  Answers Used: (not echoed, lean result)")
     else:
-         answers_str = ",".join(answers_display)
-    output.append(f"  Answers Used: [{answers_str}]") # Indicate these are validated/used values
+        answers_display = [str(a) if a is not None else 'None' for a in results['input_data']['answers']]
+        if len(answers_display) > 10:
+             answers_str = ",".join(answers_display[:5]) + ",...," + ",".join(answers_display[-5:])
+        else:
+             answers_str = ",".join(answers_display)
+        output.append(f"  Answers Used: [{answers_str}]") # Indicate these are validated/used values
     output.append(f"  Age Provided: {results['input_data']['age_provided']}")
     output.append(f"  Sex Provided: {results['input_data']['sex_provided']}")
     if results['input_data']['warnings']:
@@ -383,14 +1146,39 @@ def format_results_text(results):
 # -----------------------------------------------------------------------------
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        import sf36_server # Servizio HTTP: python sf36_library.py serve [--host --port --workers]
+        sf36_server.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'longitudinal':
+        import sf36_longitudinal # Visite multiple per paziente: variazioni dal basale e flag
+        sf36_longitudinal.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'sqlite':
+        import sf36_sqlite # Calcolo incrementale di una tabella SQLite con high-water mark
+        sf36_sqlite.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        import sf36_watch # Daemon: calcola i file depositati in una cartella
+        sf36_watch.main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
-        description="Calculate SF-36 scores (0-100, Z-USA, PCS/MCS-USA, T-ITA Age/Sex). Version 6.",
+        description="Calculate SF-36 scores (0-100, Z-USA, PCS/MCS-USA, T-ITA Age/Sex). Version 6.\n"
+                    "Run 'sf36_library.py serve --help' for the HTTP scoring service,\n"
+                    "'sf36_library.py longitudinal --help' for multi-visit change scores,\n"
+                    "'sf36_library.py sqlite --help' for incremental scoring of a SQLite table and\n"
+                    "'sf36_library.py watch --help' to score files dropped into a directory.",
         formatter_class=argparse.RawTextHelpFormatter
     )
-    parser.add_argument(
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument(
         "--answers",
-        required=True,
-        help="REQUIRED. 36 comma-separated integer answers.\nUse 'None', 'null', 'na' or empty string for missing values.\nExample: '3,2,1,1,2,3,3,2,1,2,2,1,2,1,2,1,2,1,2,5,1,3,4,6,2,3,5,6,1,5,2,4,3,5,1,2'"
+        help="36 comma-separated integer answers (single questionnaire).\nUse 'None', 'null', 'na' or empty string for missing values.\nExample: '3,2,1,1,2,3,3,2,1,2,2,1,2,1,2,1,2,1,2,5,1,3,4,6,2,3,5,6,1,5,2,4,3,5,1,2'"
+    )
+    mode.add_argument(
+        "--input",
+        help="CSV, Excel or binary answers file to score in batch mode (one questionnaire\nper row: 36 answers, then optional age and sex). Read in chunks."
     )
     parser.add_argument(
         "--age",
@@ -402,22 +1190,147 @@ def main():
     )
     parser.add_argument(
         "--output-format",
-        choices=['text', 'json'],
-        default='text',
-        help="OPTIONAL. Output format ('text' or 'json'). Default: text."
+        choices=['text', 'json', 'csv', 'parquet', 'feather', 'arrow'],
+        help="OPTIONAL. Output format. Single questionnaire: 'text' or 'json' (default: text).\nBatch mode: 'csv', 'parquet', 'feather' or 'arrow' (Arrow IPC stream)\n(default: from the --output extension, else csv)."
+    )
+    parser.add_argument(
+        "--to-binary",
+        action='store_true',
+        help="OPTIONAL (batch mode). Convert --input to the compact binary answer format\n(memory-mapped when scored) at --output instead of scoring it."
+    )
+    parser.add_argument(
+        "--output",
+        default='-',
+        help="OPTIONAL (batch mode). Output file path, '-' for stdout (csv only). Default: stdout."
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=10000,
+        help="OPTIONAL (batch mode). Rows read and scored per chunk. Default: 10000."
+    )
+    parser.add_argument(
+        "--delimiter",
+        help="OPTIONAL (batch mode). Field delimiter of the input CSV. Default: auto-detected."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="OPTIONAL (batch mode). Worker processes for scoring (0 = all cores). Default: 1."
+    )
+    parser.add_argument(
+        "--header",
+        action='store_const',
+        const=True,
+        help="OPTIONAL (batch mode). The first row of the input is a header. Default: auto-detected."
+    )
+    parser.add_argument(
+        "--no-header",
+        dest='header',
+        action='store_const',
+        const=False,
+        help="OPTIONAL (batch mode). The input has no header row. Default: auto-detected."
+    )
+    parser.add_argument(
+        "--sheet",
+        help="OPTIONAL (batch mode, Excel input). Sheet name or 0-based index. Default: first sheet."
+    )
+    parser.add_argument(
+        "--header-row",
+        type=int,
+        help="OPTIONAL (batch mode, Excel input). 1-based row number of the header; rows above it\n"
+             "are skipped and data starts on the next row. 0 = no header. Default: auto-detected."
+    )
+    parser.add_argument(
+        "--summary",
+        help="OPTIONAL (batch mode). Also write cohort statistics (N, mean, SD, percentiles of every\n"
+             "score, overall and by sex and age class) to this CSV file, computed in the same pass."
+    )
+    parser.add_argument(
+        "--norms",
+        nargs='+',
+        metavar='NAME_OR_FILE',
+        help="OPTIONAL (batch mode). Also score against these norm sets (registered names such as\n"
+             "'default', or JSON files, see sf36_norms.py) in the same pass: each adds\n"
+             "'<name>.Z_*', '<name>.PCS', '<name>.MCS' and '<name>.T_*' columns."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="OPTIONAL. Print a per-stage timing breakdown and rows/second to stderr."
     )
 
     args = parser.parse_args()
 
+    profiler = None
+    if args.profile:
+        # Eseguito come script questo modulo è __main__: sf36_batch usa la copia importata come sf36_library
+        import sf36_library as library
+        profiler = library.enable_profiling(enable_profiling())
+        wall_start = time.perf_counter()
+
     try:
+        if args.input:
+            import sf36_batch
+            if args.chunk_size <= 0:
+                raise ValueError("--chunk-size must be a positive integer.")
+            if args.to_binary:
+                if args.summary or args.norms:
+                    raise ValueError("--summary and --norms cannot be combined with --to-binary.")
+                if args.output == '-':
+                    raise ValueError("--to-binary requires --output FILE.")
+                n_rows = sf36_batch.convert_to_binary(args.input, args.output, chunk_size=args.chunk_size,
+                                                      delimiter=args.delimiter, header=args.header,
+                                                      sheet=args.sheet, header_row=args.header_row)
+                print(f"Converted {n_rows} rows from '{args.input}' to '{args.output}'.", file=sys.stderr)
+                return
+            if args.output_format in ('text', 'json'):
+                raise ValueError(f"--output-format {args.output_format} is only available with --answers.")
+            norm_sets = None
+            if args.norms:
+                import sf36_norms
+                norm_sets = sf36_norms.get_registry().resolve(args.norms)
+            cohort_stats = None
+            if args.summary:
+                import sf36_cohort
+                cohort_stats = sf36_cohort.CohortAggregator(sf36_batch.result_columns(norm_sets))
+            n_rows = sf36_batch.score_file(args.input, args.output, chunk_size=args.chunk_size,
+                                           delimiter=args.delimiter, header=args.header,
+                                           workers=args.workers, output_format=args.output_format,
+                                           sheet=args.sheet, header_row=args.header_row, cohort_stats=cohort_stats,
+                                           norm_sets=norm_sets)
+            print(f"Scored {n_rows} rows from '{args.input}'.", file=sys.stderr)
+            if cohort_stats is not None:
+                n_summary = cohort_stats.write_summary_csv(args.summary)
+                print(f"Wrote {n_summary} cohort summary rows to '{args.summary}'.", file=sys.stderr)
+            if profiler is not None:
+                print(profiler.format_report(time.perf_counter() - wall_start), file=sys.stderr)
+            return
+
+        if args.output_format not in (None, 'text', 'json'):
+            raise ValueError(f"--output-format {args.output_format} is only available in batch mode (--input).")
+        if args.summary or args.norms:
+            raise ValueError("--summary and --norms are only available in batch mode (--input).")
+        if profiler is not None:
+            lap = time.perf_counter_ns()
         answers_list = parse_answers(args.answers)
+        if profiler is not None:
+            profiler.lap('parse', lap)
         # Pass age/sex directly as they might be None or strings
         results = calculate_sf36_all_scores(answers_list, age=args.age, sex=args.sex)
 
+        if profiler is not None:
+            lap = time.perf_counter_ns()
         if args.output_format == 'json':
-            print(json.dumps(results, indent=2))
+            text = json.dumps(results, indent=2)
         else:
-            print(format_results_text(results))
+            text = format_results_text(results)
+        if profiler is not None:
+            profiler.lap('format', lap)
+        print(text)
+        if profiler is not None:
+            print(profiler.format_report(time.perf_counter() - wall_start), file=sys.stderr)
 
     except ValueError as e:
         print(f"Input Error: {e}")
@@ -433,4 +1346,14 @@ if __name__ == "__main__":
 
 # Example Usage from command line:
 # python sf36_library.py --answers "3,2,1,1,2,3,3,2,1,2,2,1,2,1,2,1,2,1,2,5,1,3,4,6,2,3,5,6,1,5,2,4,3,5,1,2" --age 45 --sex 1
-# python sf36_library.py --answers "...,None,..." --age 30 --sex 2 --output-format json
\ No newline at end of file
+# python sf36_library.py --answers "...,None,..." --age 30 --sex 2 --output-format json
+# python sf36_library.py --input answers.csv --output scores.csv --chunk-size 50000 --workers 0
+# python sf36_library.py --input answers.csv --output answers.sf36bin --to-binary
+# python sf36_library.py --input export.xlsx --sheet Risposte --header-row 3 --output scores.csv
+# python sf36_library.py --input answers.csv --output scores.parquet --workers 4 --profile
+# python sf36_library.py --input answers.csv --output scores.csv --summary cohort_summary.csv --workers 0
+# python sf36_library.py --input answers.csv --output scores.csv --norms default norms/it2023.json
+# python sf36_library.py longitudinal --input visits.csv --output changes.csv --threshold PCS=2
+# python sf36_library.py sqlite --db trial.sqlite --table questionnaires --age-column age --sex-column sex
+# python sf36_library.py watch --dir /shared/sf36_inbox --output-dir /shared/sf36_scored --max-files 2
+# python sf36_library.py serve --host 0.0.0.0 --port 8036 --workers 4
@@ -0,0 +1,346 @@
+# sf36_longitudinal.py
+# Longitudinal (multi-visit) scoring for sf36_library.py
+# Start with: python sf36_library.py longitudinal --input visits.csv --output changes.csv
+#
+# Input: una riga per visita con patient_id, visit, 36 risposte, età e sesso opzionali
+# (CSV o Excel, stesse regole di lettura di sf36_batch). Output CSV ordinato per paziente
+# e visita: punteggi della visita (RESULT_COLUMNS), variazione dal basale (prima visita
+# del paziente) per ogni scala e PCS/MCS e flag di variazione rilevante rispetto a una
+# soglia (1 = miglioramento, -1 = peggioramento, 0 = stabile, vuoto = N/D).
+#
+# L'input non deve essere ordinato: i blocchi calcolati vengono ordinati in memoria per
+# (paziente, visita) a gruppi di run_rows righe, scritti su disco come run temporanee e
+# poi fusi (merge a k vie, in più passaggi se le run sono molte). La memoria resta quindi
+# limitata da run_rows anche per tabelle di visite di più GB. Con presorted=True l'input,
+# già ordinato, viene elaborato in streaming senza file temporanei.
+
+import argparse
+import csv
+import heapq
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+
+import sf36_library
+import sf36_batch
+from sf36_library import SCALES_FOR_STD, SUMMARY_ORDER
+from sf36_batch import RESULT_COLUMNS, DEFAULT_CHUNK_SIZE
+
+DEFAULT_RUN_ROWS = 200000 # Righe ordinate in memoria per run temporanea
+MAX_MERGE_FAN_IN = 64 # Run aperte contemporaneamente durante la fusione
+SPILL_BATCH_RECORDS = 1000 # Record per pickle nelle run temporanee
+
+# Scale per cui si calcolano variazioni e flag (0-100 e PCS/MCS; più alto = meglio)
+CHANGE_SCALES = list(SCALES_FOR_STD) + list(SUMMARY_ORDER)
+# Soglie indicative di variazione rilevante (punti 0-100 per le scale, punti T per PCS/MCS);
+# da adattare allo studio con --threshold SCALA=VALORE
+DEFAULT_THRESHOLDS = dict({scale: 5.0 for scale in SCALES_FOR_STD}, PCS=3.0, MCS=3.0)
+
+LONGITUDINAL_COLUMNS = (
+    ['patient_id', 'visit', 'visit_index']
+    + list(RESULT_COLUMNS)
+    + [f"CHG_{scale}" for scale in CHANGE_SCALES]
+    + [f"FLAG_{scale}" for scale in CHANGE_SCALES]
+)
+_CHANGE_INDICES = [RESULT_COLUMNS.index(scale) for scale in CHANGE_SCALES]
+
+
+def visit_sort_key(visit):
+    """Chiave di ordinamento di una visita: numerica se possibile (2 < 10), altrimenti testuale."""
+    try:
+        return (0, float(visit.strip().replace(',', '.')), '')
+    except ValueError:
+        return (1, 0.0, visit.strip())
+
+
+def resolve_thresholds(thresholds=None):
+    """DEFAULT_THRESHOLDS aggiornate con thresholds ({scala: punti > 0})."""
+    resolved = dict(DEFAULT_THRESHOLDS)
+    for scale, value in (thresholds or {}).items():
+        if scale not in resolved:
+            raise ValueError(f"Unknown scale '{scale}' for a change threshold. Choose from: {', '.join(CHANGE_SCALES)}.")
+        if not value > 0:
+            raise ValueError(f"Change threshold for {scale} must be greater than 0.")
+        resolved[scale] = float(value)
+    return resolved
+
+
+# -----------------------------------------------------------------------------
+# CALCOLO DEI BLOCCHI
+# -----------------------------------------------------------------------------
+
+def _score_visit_chunk(rows, first_line, decimal='.'):
+    """
+    Worker: calcola un blocco di righe (patient_id, visit, 36 risposte, età, sesso).
+
+    Returns:
+        list: Record (paziente, chiave visita, numero riga, visita, punteggi come bytes float64),
+              ordinabili direttamente (il numero di riga rende unica la chiave).
+    """
+    np = sf36_library.np
+    for n, row in enumerate(rows):
+        if len(row) < 38:
+            raise ValueError(f"Row {first_line + n} has {len(row)} columns (patient_id, visit and 36 answers required).")
+        if not row[0].strip():
+            raise ValueError(f"Row {first_line + n} has an empty patient_id.")
+    answers, ages, sexes = sf36_batch._rows_to_arrays([row[2:] for row in rows], first_line, decimal)
+    matrix = np.ascontiguousarray(sf36_batch.batch_results_to_matrix(
+        sf36_library.calculate_sf36_batch(answers, ages, sexes)))
+    return [(row[0].strip(), visit_sort_key(row[1]), first_line + n, row[1].strip(), values.tobytes())
+            for n, (row, values) in enumerate(zip(rows, matrix))]
+
+
+def _iter_row_chunks(input_path, chunk_size, delimiter=None, header=None, sheet=None, header_row=None):
+    """Blocchi di righe grezze dal CSV o Excel di input, come (rows, prima riga, separatore decimale)."""
+    if input_path.lower().endswith(('.xlsx', '.xls')):
+        for rows, first_line in sf36_batch._iter_excel_row_chunks(input_path, chunk_size, header, sheet, header_row):
+            yield rows, first_line, '.'
+        return
+    if sheet is not None or header_row is not None:
+        raise ValueError("Sheet and header row selection apply only to Excel input.")
+    yield from sf36_batch._iter_csv_row_chunks(input_path, chunk_size,
+                                               sf36_batch._resolve_dialect(input_path, delimiter, header))
+
+
+# -----------------------------------------------------------------------------
+# ORDINAMENTO ESTERNO
+# -----------------------------------------------------------------------------
+
+def _write_run(records, directory):
+    """Scrive una run ordinata di record su un file temporaneo (pickle a lotti); ritorna il percorso."""
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        for start in range(0, len(records), SPILL_BATCH_RECORDS):
+            pickle.dump(records[start:start + SPILL_BATCH_RECORDS], f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path):
+    """Rilegge una run scritta da _write_run, un lotto alla volta."""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _merge_runs(paths, directory):
+    """
+    Fonde le run ordinate in un unico flusso ordinato. Oltre MAX_MERGE_FAN_IN run le
+    fonde prima a gruppi in run intermedie, così i file aperti restano limitati.
+    """
+    paths = list(paths)
+    while len(paths) > MAX_MERGE_FAN_IN:
+        merged = []
+        for start in range(0, len(paths), MAX_MERGE_FAN_IN):
+            group = paths[start:start + MAX_MERGE_FAN_IN]
+            fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                iterator = heapq.merge(*[_read_run(p) for p in group])
+                while True:
+                    batch = list(itertools.islice(iterator, SPILL_BATCH_RECORDS))
+                    if not batch:
+                        break
+                    pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for p in group:
+                os.remove(p)
+            merged.append(path)
+        paths = merged
+    return heapq.merge(*[_read_run(p) for p in paths])
+
+
+def _check_sorted(record_batches):
+    """Flusso dei record di un input già ordinato, con errore alla prima riga fuori ordine."""
+    previous = None
+    for records in record_batches:
+        for record in records:
+            if previous is not None and record[:2] < previous[:2]:
+                raise ValueError(f"Row {record[2]} is not sorted by patient_id and visit; "
+                                 "run without the presorted option.")
+            previous = record
+            yield record
+
+
+def iter_sorted_visits(record_batches, run_rows=DEFAULT_RUN_ROWS, tmp_dir=None, presorted=False):
+    """
+    Ordina per (paziente, visita, riga) i record prodotti da _score_visit_chunk.
+
+    Se tutti i record stanno in una run l'ordinamento avviene in memoria; altrimenti le run
+    ordinate vengono scritte in una cartella temporanea (in tmp_dir) e fuse in streaming.
+    La cartella è rimossa quando il generatore termina o viene chiuso.
+    """
+    if presorted:
+        yield from _check_sorted(record_batches)
+        return
+    with tempfile.TemporaryDirectory(prefix='sf36_longitudinal_', dir=tmp_dir) as directory:
+        run, run_paths = [], []
+        for records in record_batches:
+            run.extend(records)
+            if len(run) >= run_rows:
+                run.sort()
+                run_paths.append(_write_run(run, directory))
+                run = []
+        run.sort()
+        if not run_paths:
+            yield from run
+            return
+        if run:
+            run_paths.append(_write_run(run, directory))
+        del run
+        yield from _merge_runs(run_paths, directory)
+
+
+# -----------------------------------------------------------------------------
+# VARIAZIONI DAL BASALE
+# -----------------------------------------------------------------------------
+
+def patient_changes(matrix, thresholds):
+    """
+    Variazioni dalla prima riga (basale) e flag per le visite di un paziente.
+
+    Args:
+        matrix (numpy.ndarray): Visite x len(RESULT_COLUMNS), in ordine di visita.
+        thresholds (dict): Soglia per scala di CHANGE_SCALES (vedi resolve_thresholds).
+
+    Returns:
+        tuple: (change, flags) matrici visite x len(CHANGE_SCALES); NaN se il valore della
+               visita o del basale è N/D; flag 1 / -1 / 0 per variazione >= soglia, <= -soglia, altrimenti.
+    """
+    np = sf36_library.np
+    values = matrix[:, _CHANGE_INDICES]
+    change = values - values[0]
+    limits = np.array([thresholds[scale] for scale in CHANGE_SCALES])
+    flags = np.where(change >= limits, 1.0, np.where(change <= -limits, -1.0, 0.0))
+    flags[np.isnan(change)] = np.nan
+    return change, flags
+
+
+def _format_flag(value):
+    return '' if value != value else str(int(value))
+
+
+def score_longitudinal_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, thresholds=None,
+                            presorted=False, run_rows=DEFAULT_RUN_ROWS, tmp_dir=None, workers=1,
+                            delimiter=None, header=None, sheet=None, header_row=None):
+    """
+    Calcola un file di visite e scrive punteggi, variazioni dal basale e flag per paziente.
+
+    Args:
+        input_path (str): CSV/Excel con patient_id, visit, 36 risposte, età e sesso opzionali.
+        output_path (str): CSV di output ('-' per stdout), colonne LONGITUDINAL_COLUMNS, una riga
+                           per visita ordinata per paziente e visita (numerica se possibile).
+        chunk_size (int): Righe lette e calcolate per blocco. Default DEFAULT_CHUNK_SIZE.
+        thresholds (dict, optional): Soglie per scala che sostituiscono DEFAULT_THRESHOLDS.
+        presorted (bool): True se l'input è già ordinato per paziente e visita (niente file temporanei;
+                          errore alla prima riga fuori ordine). Default False.
+        run_rows (int): Righe ordinate in memoria prima di scriverle su disco. Default DEFAULT_RUN_ROWS.
+        tmp_dir (str, optional): Cartella per le run temporanee. Default: quella di sistema.
+        workers (int): Processi di calcolo (1 = nel processo corrente, 0 = tutti i core). Default 1.
+        delimiter, header, sheet, header_row: Come in sf36_batch.score_csv_file / score_excel_file.
+
+    Returns:
+        tuple: (righe scritte, numero di pazienti).
+    """
+    np = sf36_library.np
+    if np is None:
+        raise ImportError("Longitudinal scoring requires numpy. Install it with: pip install numpy")
+    if chunk_size <= 0 or run_rows <= 0:
+        raise ValueError("Chunk size and run size must be positive integers.")
+    thresholds = resolve_thresholds(thresholds)
+    chunks = _iter_row_chunks(input_path, chunk_size, delimiter, header, sheet, header_row)
+    record_batches = sf36_batch.map_chunks_ordered(_score_visit_chunk, chunks, workers)
+    records = iter_sorted_visits(record_batches, run_rows, tmp_dir, presorted)
+
+    n_rows = n_patients = 0
+    out = sys.stdout if output_path == '-' else open(output_path, 'w', newline='', encoding='utf-8')
+    try:
+        writer = csv.writer(out)
+        writer.writerow(LONGITUDINAL_COLUMNS)
+        for patient_id, visits in itertools.groupby(records, key=lambda record: record[0]):
+            visits = list(visits)
+            matrix = np.frombuffer(b''.join(record[4] for record in visits), dtype=np.float64)
+            matrix = matrix.reshape(len(visits), len(RESULT_COLUMNS))
+            change, flags = patient_changes(matrix, thresholds)
+            for index, (record, values, deltas, marks) in enumerate(zip(visits, matrix.tolist(),
+                                                                        change.tolist(), flags.tolist())):
+                writer.writerow([patient_id, record[3], index]
+                                + [sf36_batch._format_value(v) for v in values]
+                                + [sf36_batch._format_value(v) for v in deltas]
+                                + [_format_flag(v) for v in marks])
+            n_rows += len(visits)
+            n_patients += 1
+    finally:
+        records.close()
+        if out is not sys.stdout:
+            out.close()
+    return n_rows, n_patients
+
+
+# -----------------------------------------------------------------------------
+# INTERFACCIA COMMAND-LINE
+# -----------------------------------------------------------------------------
+
+def _parse_threshold(text):
+    scale, sep, value = text.partition('=')
+    try:
+        if not sep:
+            raise ValueError
+        return scale.strip().upper(), float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected SCALE=POINTS (e.g. PCS=2.5), got '{text}'") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sf36_library.py longitudinal",
+        description="Score multi-visit SF-36 data: one row per visit with patient_id, visit, 36 answers,\n"
+                    "then optional age and sex. Writes scores, change from baseline (first visit) for\n"
+                    "each scale and PCS/MCS, and change flags (1 improved, -1 worsened, 0 stable).",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--input", required=True, help="CSV or Excel visits file. Does not need to be sorted.")
+    parser.add_argument("--output", default='-', help="OPTIONAL. Output CSV path, '-' for stdout. Default: stdout.")
+    parser.add_argument("--threshold", action='append', type=_parse_threshold, default=[], metavar='SCALE=POINTS',
+                        help="OPTIONAL. Change threshold for a flag, repeatable.\nDefaults: "
+                             + ", ".join(f"{scale}={value:g}" for scale, value in DEFAULT_THRESHOLDS.items()) + ".")
+    parser.add_argument("--presorted", action='store_true',
+                        help="OPTIONAL. The input is already sorted by patient_id and visit (no temporary files).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"OPTIONAL. Rows read and scored per chunk. Default: {DEFAULT_CHUNK_SIZE}.")
+    parser.add_argument("--run-rows", type=int, default=DEFAULT_RUN_ROWS,
+                        help=f"OPTIONAL. Rows sorted in memory before spilling to disk. Default: {DEFAULT_RUN_ROWS}.")
+    parser.add_argument("--tmp-dir", help="OPTIONAL. Directory for temporary sort runs. Default: system temp dir.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="OPTIONAL. Worker processes for scoring (0 = all cores). Default: 1.")
+    parser.add_argument("--delimiter", help="OPTIONAL. Field delimiter of the input CSV. Default: auto-detected.")
+    parser.add_argument("--header", action='store_const', const=True,
+                        help="OPTIONAL. The first row of the input is a header. Default: auto-detected.")
+    parser.add_argument("--no-header", dest='header', action='store_const', const=False,
+                        help="OPTIONAL. The input has no header row. Default: auto-detected.")
+    parser.add_argument("--sheet", help="OPTIONAL (Excel input). Sheet name or 0-based index. Default: first sheet.")
+    parser.add_argument("--header-row", type=int,
+                        help="OPTIONAL (Excel input). 1-based row number of the header. Default: auto-detected.")
+    args = parser.parse_args(argv)
+
+    try:
+        n_rows, n_patients = score_longitudinal_file(
+            args.input, args.output, chunk_size=args.chunk_size, thresholds=dict(args.threshold),
+            presorted=args.presorted, run_rows=args.run_rows, tmp_dir=args.tmp_dir, workers=args.workers,
+            delimiter=args.delimiter, header=args.header, sheet=args.sheet, header_row=args.header_row)
+    except ValueError as e:
+        print(f"Input Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Scored {n_rows} visits of {n_patients} patients from '{args.input}'.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
+
+# Example Usage from command line:
+# python sf36_library.py longitudinal --input visits.csv --output changes.csv
+# python sf36_library.py longitudinal --input visits.xlsx --output changes.csv --threshold PCS=2 --threshold MCS=3
+# python sf36_library.py longitudinal --input huge_visits.csv --output changes.csv --run-rows 500000 --tmp-dir /scratch --workers 0
@@ -0,0 +1,487 @@
+# sf36_norms.py
+# Norm set registry for sf36_library.py
+# Un "norm set" raccoglie tutto ciò che dipende dalla popolazione di riferimento:
+# medie/DS per gli Z-score, pesi PCS/MCS e norme per sesso x classe d'età (T-score).
+# Le costanti del modulo (US_MEANS, US_SDS, WEIGHTS, AGE_SEX_NORMS) sono il set 'default';
+# altri set (norme nazionali, norme USA aggiornate, ...) si caricano da file JSON,
+# vengono validati e compilati in array densi indicizzati per (sesso, classe d'età, scala).
+# I set compilati sono salvati in cache (file binario: una riga JSON di intestazione
+# seguita dagli array float64 contigui) e ricaricati senza rileggere né validare il JSON.
+#
+# Il calcolo batch può applicare più norm set nello stesso passaggio: i punteggi 0-100
+# (la parte costosa) sono calcolati una sola volta e ogni set aggiunge le proprie colonne
+# Z, PCS/MCS e T con prefisso '<nome>.' (es. 'it2023.Z_PF').
+#
+# Uso:
+#   python sf36_norms.py --export-default default_norms.json
+#   python sf36_norms.py --validate my_norms.json
+#   python sf36_library.py --input answers.csv --output scores.csv --norms my_norms.json
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+
+import sf36_library
+from sf36_library import (US_MEANS, US_SDS, WEIGHTS, AGE_SEX_NORMS, AGE_CLASS_UPPER_BOUNDS,
+                          SCALES_FOR_STD, SUMMARY_ORDER)
+
+DEFAULT_NORM_SET_NAME = 'default'
+NORM_SET_EXTENSION = '.json'
+NORMS_CACHE_VERSION = 1 # Da incrementare se cambia il formato dei file compilati
+SEX_KEYS = (1, 2)
+
+# Colonne prodotte da ogni norm set, nell'ordine della matrice restituita da NormSet.score
+NORM_COLUMNS = (
+    [f"Z_{scale}" for scale in SCALES_FOR_STD]
+    + list(SUMMARY_ORDER)
+    + [f"T_{scale}" for scale in SCALES_FOR_STD]
+)
+
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]*$')
+_ARRAY_FIELDS = ('population_means', 'population_sds', 'summary_intercepts', 'summary_coefs',
+                 'age_class_upper_bounds', 'norm_means', 'norm_sds')
+
+
+def _default_cache_dir():
+    return os.environ.get('SF36_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'sf36')
+
+
+def _require_numpy():
+    if sf36_library.np is None:
+        raise ImportError("Norm sets require numpy. Install it with: pip install numpy")
+    return sf36_library.np
+
+
+# -----------------------------------------------------------------------------
+# VALIDAZIONE
+# -----------------------------------------------------------------------------
+
+def _number(value, where, positive=False):
+    """Numero finito (bool esclusi); positive=True richiede un valore > 0 (DS)."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{where} must be a finite number, got {value!r}.")
+    if positive and value <= 0:
+        raise ValueError(f"{where} must be greater than 0, got {value!r}.")
+    return float(value)
+
+
+def _object(value, where):
+    if not isinstance(value, dict):
+        raise ValueError(f"{where} must be an object.")
+    return value
+
+
+def _scale_values(value, where, positive=False):
+    """Oggetto {scala: numero} con esattamente le scale di SCALES_FOR_STD -> tupla in quell'ordine."""
+    value = _object(value, where)
+    missing = [s for s in SCALES_FOR_STD if s not in value]
+    unknown = sorted(set(value) - set(SCALES_FOR_STD))
+    if missing:
+        raise ValueError(f"{where} is missing scales: {', '.join(missing)}.")
+    if unknown:
+        raise ValueError(f"{where} has unknown scales: {', '.join(unknown)}.")
+    return tuple(_number(value[s], f"{where}.{s}", positive) for s in SCALES_FOR_STD)
+
+
+def _int_key(key, where, allowed):
+    try:
+        number = int(key)
+    except (TypeError, ValueError):
+        number = None
+    if number not in allowed or str(number) != str(key):
+        raise ValueError(f"{where}: invalid key {key!r} (expected one of {', '.join(map(str, allowed))}).")
+    return number
+
+
+def validate_norm_data(data, source='<norm set>'):
+    """
+    Valida la struttura di un norm set (dict letto dal JSON).
+
+    Returns:
+        dict: Versione normalizzata: 'name', 'description', 'population_means' e
+              'population_sds' (tuple in ordine SCALES_FOR_STD), 'summary_weights'
+              ({sommario: tupla}), 'age_class_upper_bounds' (tupla di int) e
+              'age_sex_norms' ({sesso: {classe: ((media, DS), ...)}}).
+
+    Raises:
+        ValueError: Con il percorso del campo non valido (prefissato da source).
+    """
+    try:
+        data = _object(data, 'norm set')
+        unknown = sorted(set(data) - {'name', 'description', 'population_means', 'population_sds',
+                                      'summary_weights', 'age_class_upper_bounds', 'age_sex_norms'})
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(unknown)}.")
+        name = data.get('name')
+        if not isinstance(name, str) or not _NAME_PATTERN.match(name):
+            raise ValueError(f"'name' must be letters, digits, '_' or '-', got {name!r}.")
+        description = data.get('description', '')
+        if not isinstance(description, str):
+            raise ValueError("'description' must be a string.")
+        for field in ('population_means', 'population_sds', 'summary_weights'):
+            if field not in data:
+                raise ValueError(f"missing required field '{field}'.")
+
+        means = _scale_values(data['population_means'], 'population_means')
+        sds = _scale_values(data['population_sds'], 'population_sds', positive=True)
+        weights = _object(data['summary_weights'], 'summary_weights')
+        if sorted(weights) != sorted(SUMMARY_ORDER):
+            raise ValueError(f"summary_weights must define exactly: {', '.join(SUMMARY_ORDER)}.")
+        summary_weights = {summary: _scale_values(weights[summary], f"summary_weights.{summary}")
+                           for summary in SUMMARY_ORDER}
+
+        bounds = data.get('age_class_upper_bounds', AGE_CLASS_UPPER_BOUNDS)
+        if (not isinstance(bounds, list) or not bounds
+                or any(isinstance(b, bool) or not isinstance(b, int) or b <= 0 for b in bounds)
+                or any(upper <= lower for lower, upper in zip(bounds, bounds[1:]))):
+            raise ValueError("'age_class_upper_bounds' must be a non-empty list of increasing positive integers.")
+        age_classes = range(2, 3 + len(bounds)) # Classi 2..(2 + len(bounds)) come AGE_SEX_NORMS
+
+        age_sex_norms = {}
+        for sex_key, by_age in _object(data.get('age_sex_norms', {}), 'age_sex_norms').items():
+            sex = _int_key(sex_key, 'age_sex_norms', SEX_KEYS)
+            age_sex_norms[sex] = {}
+            for class_key, norms in _object(by_age, f"age_sex_norms.{sex_key}").items():
+                where = f"age_sex_norms.{sex_key}.{class_key}"
+                age_class = _int_key(class_key, f"age_sex_norms.{sex_key}", age_classes)
+                cells = {s: _object(cell, f"{where}.{s}") for s, cell in _object(norms, where).items()}
+                cell_means = _scale_values({s: cell.get('mean') for s, cell in cells.items()}, f"{where} mean")
+                cell_sds = _scale_values({s: cell.get('sd') for s, cell in cells.items()}, f"{where} sd", positive=True)
+                age_sex_norms[sex][age_class] = tuple(zip(cell_means, cell_sds))
+    except ValueError as e:
+        raise ValueError(f"{source}: {e}") from None
+
+    return {
+        'name': name,
+        'description': description,
+        'population_means': means,
+        'population_sds': sds,
+        'summary_weights': summary_weights,
+        'age_class_upper_bounds': tuple(bounds),
+        'age_sex_norms': age_sex_norms,
+    }
+
+
+def default_norm_data():
+    """Le costanti del modulo sf36_library nel formato JSON dei norm set (set 'default')."""
+    return {
+        'name': DEFAULT_NORM_SET_NAME,
+        'description': "USA (Z, PCS/MCS) and Italian age/sex norms (T) built into sf36_library (index.html Ver6).",
+        'population_means': {s: US_MEANS[s] for s in SCALES_FOR_STD},
+        'population_sds': {s: US_SDS[s] for s in SCALES_FOR_STD},
+        'summary_weights': {summary: {s: WEIGHTS[summary][s] for s in SCALES_FOR_STD} for summary in SUMMARY_ORDER},
+        'age_class_upper_bounds': list(AGE_CLASS_UPPER_BOUNDS),
+        'age_sex_norms': {
+            str(sex): {str(age_class): {s: dict(norms[s]) for s in SCALES_FOR_STD}
+                       for age_class, norms in by_age.items()}
+            for sex, by_age in AGE_SEX_NORMS.items()
+        },
+    }
+
+
+# -----------------------------------------------------------------------------
+# NORM SET COMPILATO
+# -----------------------------------------------------------------------------
+
+class NormSet:
+    """
+    Norm set compilato in array NumPy densi.
+
+    Attributi (ordine delle scale SCALES_FOR_STD):
+        population_means, population_sds: (8,) per gli Z-score.
+        summary_intercepts (2,), summary_coefs (2, 8): PCS/MCS come intercetta + coefficienti
+            (stessa forma e ordine di somma di ScoringPlan.summary_coefs).
+        age_class_upper_bounds: (K,) int, limiti superiori delle classi 2..K+1 (oltre: K+2).
+        norm_means, norm_sds: (3, K+3, 8) indicizzati [sesso, classe d'età, scala];
+            NaN dove la cella non ha norme (T-score N/D), righe 0 = sesso/classe mancante.
+    """
+
+    def __init__(self, name, description, digest, **arrays):
+        self.name = name
+        self.description = description
+        self.digest = digest
+        for field in _ARRAY_FIELDS:
+            setattr(self, field, arrays[field])
+
+    def __repr__(self):
+        return f"NormSet({self.name!r}, digest={self.digest!r})"
+
+    @classmethod
+    def compile(cls, data, source='<norm set>', digest=None):
+        """Valida un dict nel formato JSON dei norm set e lo compila."""
+        np = _require_numpy()
+        norm = validate_norm_data(data, source)
+        means = norm['population_means']
+        sds = norm['population_sds']
+        # Stessa formula (e stesso ordine delle operazioni) di ScoringPlan: risultati identici per il set 'default'
+        intercepts = [50 - 10 * sum(w * m / s for w, m, s in zip(norm['summary_weights'][summary], means, sds))
+                      for summary in SUMMARY_ORDER]
+        coefs = [[10 * w / s for w, s in zip(norm['summary_weights'][summary], sds)] for summary in SUMMARY_ORDER]
+        bounds = norm['age_class_upper_bounds']
+        shape = (1 + len(SEX_KEYS), 3 + len(bounds), len(SCALES_FOR_STD))
+        norm_means = np.full(shape, np.nan)
+        norm_sds = np.full(shape, np.nan)
+        for sex, by_age in norm['age_sex_norms'].items():
+            for age_class, norms in by_age.items():
+                norm_means[sex, age_class] = [mean for mean, _ in norms]
+                norm_sds[sex, age_class] = [sd for _, sd in norms]
+        if digest is None:
+            digest = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return cls(norm['name'], norm['description'], digest,
+                   population_means=np.array(means), population_sds=np.array(sds),
+                   summary_intercepts=np.array(intercepts), summary_coefs=np.array(coefs),
+                   age_class_upper_bounds=np.array(bounds, dtype=np.intp),
+                   norm_means=norm_means, norm_sds=norm_sds)
+
+    def to_bytes(self):
+        """Forma compilata: intestazione JSON su una riga, poi gli array float64 in ordine _ARRAY_FIELDS."""
+        np = _require_numpy()
+        header = {'name': self.name, 'description': self.description, 'n_bounds': len(self.age_class_upper_bounds)}
+        body = np.concatenate([np.asarray(getattr(self, field), dtype=np.float64).ravel() for field in _ARRAY_FIELDS])
+        return json.dumps(header).encode('utf-8') + b'\n' + body.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob, digest):
+        """Inverso di to_bytes (ValueError se il contenuto non è coerente)."""
+        np = _require_numpy()
+        header_bytes, _, body = blob.partition(b'\n')
+        header = json.loads(header_bytes.decode('utf-8'))
+        n_bounds = header['n_bounds']
+        n_std = len(SCALES_FOR_STD)
+        n_summary = len(SUMMARY_ORDER)
+        cube = (1 + len(SEX_KEYS), 3 + n_bounds, n_std)
+        shapes = ((n_std,), (n_std,), (n_summary,), (n_summary, n_std), (n_bounds,), cube, cube)
+        values = np.frombuffer(body, dtype=np.float64)
+        if len(values) != sum(math.prod(shape) for shape in shapes):
+            raise ValueError("Compiled norm set has an unexpected size.")
+        arrays = {}
+        offset = 0
+        for field, shape in zip(_ARRAY_FIELDS, shapes):
+            size = math.prod(shape)
+            arrays[field] = values[offset:offset + size].reshape(shape)
+            offset += size
+        arrays['age_class_upper_bounds'] = arrays['age_class_upper_bounds'].astype(np.intp)
+        return cls(header['name'], header['description'], digest, **arrays)
+
+    @classmethod
+    def load(cls, path, cache_dir=None, refresh=False):
+        """
+        Carica un norm set da file JSON, usando la cache compilata se disponibile.
+
+        La cache (norms_<impronta>.bin in cache_dir, default $SF36_CACHE_DIR o ~/.cache/sf36)
+        è indicizzata dall'impronta del contenuto del file: modificare il JSON la invalida.
+        Con refresh=True la cache viene ignorata: il JSON è sempre validato e compilato e
+        la cache riscritta. Errori di scrittura della cache vengono ignorati.
+        """
+        _require_numpy()
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha1(content + f"v{NORMS_CACHE_VERSION}".encode('ascii')).hexdigest()[:16]
+        cache_dir = _default_cache_dir() if cache_dir is None else cache_dir
+        cache_path = os.path.join(cache_dir, f"norms_{digest}.bin")
+        if not refresh:
+            try:
+                with open(cache_path, 'rb') as f:
+                    return cls.from_bytes(f.read(), digest)
+            except (OSError, ValueError, KeyError):
+                pass
+
+        try:
+            data = json.loads(content.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"{path}: invalid JSON ({e}).") from None
+        norm_set = cls.compile(data, source=path, digest=digest)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(norm_set.to_bytes())
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+        return norm_set
+
+    def age_sex_classes(self, ages, sexes):
+        """Indici (sesso, classe d'età) secondo le classi di questo set (0 = mancante)."""
+        sex_index, age_class = sf36_library.age_sex_classes(ages, sexes, self.age_class_upper_bounds)
+        return sex_index, sf36_library.np.where(sex_index > 0, age_class, 0)
+
+    def score(self, std_scores, ages=None, sexes=None):
+        """
+        Z-score, PCS/MCS e T-score di questo set per N punteggi 0-100 già calcolati.
+
+        Args:
+            std_scores (numpy.ndarray): N x 8 punteggi 0-100 in ordine SCALES_FOR_STD (NaN = N/D).
+            ages, sexes (array-like, optional): N età/sessi come in calculate_sf36_batch.
+
+        Returns:
+            numpy.ndarray: Matrice N x len(NORM_COLUMNS), NaN dove non calcolabile.
+        """
+        np = _require_numpy()
+        n_rows = std_scores.shape[0]
+        out = np.full((n_rows, len(NORM_COLUMNS)), np.nan)
+        n_std = len(SCALES_FOR_STD)
+        out[:, :n_std] = (std_scores - self.population_means) / self.population_sds
+        for k, (intercept, coefs) in enumerate(zip(self.summary_intercepts, self.summary_coefs)):
+            value = np.full(n_rows, intercept)
+            for j, coef in enumerate(coefs):
+                value = value + coef * std_scores[:, j]
+            out[:, n_std + k] = value
+        if ages is not None and sexes is not None:
+            sex_index, age_class = self.age_sex_classes(ages, sexes)
+            means = self.norm_means[sex_index, age_class]
+            sds = self.norm_sds[sex_index, age_class]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[:, n_std + len(SUMMARY_ORDER):] = np.where(sds != 0, (((std_scores - means) / sds) * 10) + 50, np.nan)
+        return out
+
+
+def norm_columns(norm_sets):
+    """Nomi delle colonne aggiuntive per una sequenza di norm set ('<nome>.<colonna>')."""
+    return [f"{norm_set.name}.{column}" for norm_set in norm_sets for column in NORM_COLUMNS]
+
+
+def score_norm_sets(scores_0_100, ages, sexes, norm_sets):
+    """
+    Applica più norm set agli stessi punteggi 0-100 (calcolati una sola volta).
+
+    Returns:
+        numpy.ndarray: N x (len(norm_sets) * len(NORM_COLUMNS)), colonne come norm_columns(norm_sets).
+    """
+    np = _require_numpy()
+    std_scores = scores_0_100[:, :len(SCALES_FOR_STD)]
+    if not norm_sets:
+        return np.empty((std_scores.shape[0], 0))
+    return np.hstack([norm_set.score(std_scores, ages, sexes) for norm_set in norm_sets])
+
+
+# -----------------------------------------------------------------------------
+# REGISTRO
+# -----------------------------------------------------------------------------
+
+class NormRegistry:
+    """
+    Norm set disponibili per nome. Contiene sempre il set 'default' (costanti del modulo);
+    altri set si aggiungono con load_file / load_directory o register.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._norm_sets = {}
+        self.register(NormSet.compile(default_norm_data(), source='sf36_library'))
+
+    def __contains__(self, name):
+        return name in self._norm_sets
+
+    def names(self):
+        return list(self._norm_sets)
+
+    def register(self, norm_set, replace=False):
+        """Aggiunge un norm set compilato; un nome già presente richiede replace=True."""
+        existing = self._norm_sets.get(norm_set.name)
+        if existing is not None and existing.digest != norm_set.digest and not replace:
+            raise ValueError(f"A different norm set named '{norm_set.name}' is already registered.")
+        self._norm_sets[norm_set.name] = norm_set
+        return norm_set
+
+    def load_file(self, path, replace=False):
+        """Carica (validando o dalla cache) e registra un norm set JSON."""
+        return self.register(NormSet.load(path, self.cache_dir), replace)
+
+    def load_directory(self, directory):
+        """Carica tutti i file *.json di una cartella, in ordine alfabetico."""
+        return [self.load_file(os.path.join(directory, entry))
+                for entry in sorted(os.listdir(directory)) if entry.lower().endswith(NORM_SET_EXTENSION)]
+
+    def get(self, name):
+        try:
+            return self._norm_sets[name]
+        except KeyError:
+            raise ValueError(f"Unknown norm set '{name}'. Available: {', '.join(self._norm_sets)}.") from None
+
+    def resolve(self, names_or_paths):
+        """
+        Norm set per una lista di nomi registrati o percorsi di file JSON (caricati al volo),
+        senza duplicati di nome (due set con lo stesso nome produrrebbero colonne uguali).
+        """
+        norm_sets = []
+        for item in names_or_paths:
+            if item in self._norm_sets:
+                norm_set = self._norm_sets[item]
+            elif os.path.isfile(item):
+                norm_set = self.load_file(item)
+            else:
+                raise ValueError(f"Unknown norm set '{item}' (neither a registered name nor a file). "
+                                 f"Available: {', '.join(self._norm_sets)}.")
+            if any(existing.name == norm_set.name for existing in norm_sets):
+                raise ValueError(f"Norm set '{norm_set.name}' was requested more than once.")
+            norm_sets.append(norm_set)
+        return norm_sets
+
+
+_REGISTRY = None
+
+def get_registry():
+    """
+    Registro condiviso, creato al primo uso: set 'default' più i file *.json della
+    cartella $SF36_NORMS_DIR, se impostata.
+    """
+    global _REGISTRY
+    if _REGISTRY is None:
+        registry = NormRegistry()
+        norms_dir = os.environ.get('SF36_NORMS_DIR')
+        if norms_dir:
+            registry.load_directory(norms_dir)
+        _REGISTRY = registry
+    return _REGISTRY
+
+
+# -----------------------------------------------------------------------------
+# INTERFACCIA COMMAND-LINE
+# -----------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage SF-36 norm sets (reference means/SDs, PCS/MCS weights, age/sex norms).")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--export-default", metavar='FILE',
+                        help="Write the built-in norm set as JSON (a template for new norm sets).")
+    action.add_argument("--validate", nargs='+', metavar='FILE',
+                        help="Validate and compile norm set JSON files (refreshes the compiled cache).")
+    action.add_argument("--list", action='store_true',
+                        help="List the registered norm sets (built-in and $SF36_NORMS_DIR).")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.export_default:
+            with open(args.export_default, 'w', encoding='utf-8') as f:
+                json.dump(default_norm_data(), f, indent=2)
+                f.write('\n')
+            print(f"Wrote norm set '{DEFAULT_NORM_SET_NAME}' to '{args.export_default}'.")
+        elif args.validate:
+            registry = NormRegistry()
+            for path in args.validate:
+                norm_set = NormSet.load(path, registry.cache_dir, refresh=True)
+                n_cells = int((~sf36_library.np.isnan(norm_set.norm_means[..., 0])).sum())
+                print(f"{path}: OK - '{norm_set.name}', {len(norm_set.age_class_upper_bounds) + 1} age classes, "
+                      f"{n_cells} sex/age cells with norms.")
+        else:
+            registry = get_registry()
+            for name in registry.names():
+                print(f"{name}\t{registry.get(name).description}")
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+# Example Usage from command line:
+# python sf36_norms.py --export-default default_norms.json
+# python sf36_norms.py --validate norms/it2023.json norms/us2009.json
+# SF36_NORMS_DIR=norms python sf36_norms.py --list
+# python sf36_library.py --input answers.csv --output scores.csv --norms default norms/it2023.json
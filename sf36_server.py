@@ -0,0 +1,315 @@
+# sf36_server.py
+# Asyncio HTTP scoring service for sf36_library.py
+# Start with: python sf36_library.py serve [--host HOST] [--port PORT] [--workers N]
+#
+# Endpoints:
+#   GET  /health       -> {"status": "ok"}
+#   POST /score        -> body {"answers": [36 values], "age": ..., "sex": ...}; risposta JSON dei risultati
+#   POST /score/batch  -> body NDJSON (un oggetto come sopra per riga); risposta NDJSON in streaming,
+#                         una riga per record nello stesso ordine ({"line": n, "error": ...} se non valido)
+#
+# Il calcolo (parsing JSON, scoring, serializzazione) gira in un pool di processi,
+# così l'event loop non si blocca mai. HTTP/1.1 con keep-alive e limite sulla
+# dimensione delle richieste.
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import sys
+
+import sf36_library
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8036
+DEFAULT_MAX_BODY_BYTES = 16 * 1024 * 1024
+KEEPALIVE_TIMEOUT = 15.0
+BATCH_CHUNK_LINES = 256
+MAX_HEADER_LINES = 100
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 408: 'Request Timeout',
+    411: 'Length Required', 413: 'Payload Too Large', 422: 'Unprocessable Entity', 431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+}
+
+
+# -----------------------------------------------------------------------------
+# FUNZIONI DI CALCOLO (eseguite nei processi del pool)
+# -----------------------------------------------------------------------------
+
+class NonFiniteNumber(ValueError):
+    """NaN/Infinity/-Infinity nel JSON: non sono JSON valido e non sono accettati."""
+
+
+def _reject_constant(name):
+    raise NonFiniteNumber(f"Non-finite number '{name}' is not allowed.")
+
+
+def _loads(text):
+    """json.loads che rifiuta NaN/Infinity (NonFiniteNumber) invece di convertirli in float."""
+    return json.loads(text, parse_constant=_reject_constant)
+
+
+def _dumps(payload):
+    """json.dumps stretto: mai NaN/Infinity nelle risposte (illeggibili per i client JSON rigorosi)."""
+    return json.dumps(payload, allow_nan=False)
+
+
+def _score_record(record):
+    """Calcola un record {'answers', 'age', 'sex'}; ritorna (status HTTP, dict risposta)."""
+    if not isinstance(record, dict) or 'answers' not in record:
+        return 400, {'error': "Request body must be a JSON object with an 'answers' list."}
+    try:
+        results = sf36_library.calculate_sf36_all_scores(record['answers'], age=record.get('age'), sex=record.get('sex'))
+    except (ValueError, TypeError, OverflowError) as e: # Es. 1e400 nel JSON -> inf, non convertibile in intero
+        return 422, {'error': str(e)}
+    return 200, results
+
+
+def _score_json_body(body):
+    """Worker per /score: decodifica il JSON, calcola e serializza la risposta."""
+    try:
+        record = _loads(body)
+    except NonFiniteNumber as e:
+        return 422, _dumps({'error': str(e)})
+    except ValueError as e:
+        return 400, _dumps({'error': f"Invalid JSON: {e}"})
+    status, payload = _score_record(record)
+    try:
+        return status, _dumps(payload)
+    except ValueError as e:
+        return 422, _dumps({'error': f"Result is not representable as JSON: {e}"})
+
+
+def _score_ndjson_lines(lines, first_line):
+    """
+    Worker per /score/batch: calcola un blocco di righe NDJSON; ritorna il testo NDJSON dei risultati.
+
+    Ogni riga è isolata: qualsiasi errore diventa {"line": n, "error": ...} per quella riga,
+    così un record non valido non fa fallire il blocco (le intestazioni 200 sono già inviate).
+    """
+    out = []
+    for n, line in enumerate(lines, start=first_line):
+        try:
+            record = _loads(line)
+        except NonFiniteNumber as e:
+            out.append(_dumps({'line': n, 'error': str(e)}))
+            continue
+        except ValueError as e:
+            out.append(_dumps({'line': n, 'error': f"Invalid JSON: {e}"}))
+            continue
+        try:
+            status, payload = _score_record(record)
+            out.append(_dumps(payload if status == 200 else {'line': n, **payload}))
+        except Exception as e:
+            out.append(_dumps({'line': n, 'error': f"{type(e).__name__}: {e}"}))
+    return '\n'.join(out) + '\n'
+
+
+# -----------------------------------------------------------------------------
+# PROTOCOLLO HTTP
+# -----------------------------------------------------------------------------
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class StreamAborted(Exception):
+    """Errore dopo l'invio delle intestazioni di una risposta chunked: si può solo chiudere la connessione."""
+
+
+def _head(status, headers):
+    lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Unknown')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def _send(writer, status, body, keep_alive, content_type='application/json'):
+    data = body.encode('utf-8')
+    writer.write(_head(status, [('Content-Type', content_type), ('Content-Length', len(data)),
+                                ('Connection', 'keep-alive' if keep_alive else 'close')]) + data)
+    await writer.drain()
+
+
+async def _read_request_head(reader):
+    """Legge request line e header; ritorna (method, path, version, headers) o None a connessione chiusa."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise HTTPError(400, "Malformed request line.")
+    method, target, version = parts
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return method, target.split('?', 1)[0], version, headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    raise HTTPError(431, "Too many header lines.")
+
+
+async def _read_body(reader, headers, max_body_bytes):
+    """Legge il corpo della richiesta (Content-Length o chunked) rispettando il limite di dimensione."""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        parts = []
+        size_total = 0
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise HTTPError(400, "Malformed chunked body.")
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''): # Trailer
+                    pass
+                return b''.join(parts)
+            size_total += size
+            if size_total > max_body_bytes:
+                raise HTTPError(413, f"Request body exceeds {max_body_bytes} bytes.")
+            parts.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    if 'content-length' not in headers:
+        raise HTTPError(411, "Content-Length or chunked Transfer-Encoding required.")
+    try:
+        length = int(headers['content-length'])
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length.")
+    if length > max_body_bytes:
+        raise HTTPError(413, f"Request body exceeds {max_body_bytes} bytes.")
+    return await reader.readexactly(length)
+
+
+# -----------------------------------------------------------------------------
+# SERVER
+# -----------------------------------------------------------------------------
+
+class ScoringServer:
+    """Server HTTP asyncio che delega il calcolo a un pool di processi."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=0, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+        import sf36_batch # Per resolve_workers (stessa semantica di --workers in batch)
+        self.host = host
+        self.port = port
+        self.workers = sf36_batch.resolve_workers(workers)
+        self.max_body_bytes = max_body_bytes
+        self.executor = None
+
+    async def _handle_batch(self, writer, body, keep_alive):
+        loop = asyncio.get_running_loop()
+        lines = [line for line in body.decode('utf-8', errors='replace').splitlines() if line.strip()]
+        writer.write(_head(200, [('Content-Type', 'application/x-ndjson'), ('Transfer-Encoding', 'chunked'),
+                                 ('Connection', 'keep-alive' if keep_alive else 'close')]))
+        pending = collections.deque()
+        max_pending = 2 * self.workers
+
+        async def flush_one():
+            data = (await pending.popleft()).encode('utf-8')
+            writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+            await writer.drain()
+
+        try:
+            for start in range(0, len(lines), BATCH_CHUNK_LINES):
+                pending.append(loop.run_in_executor(self.executor, _score_ndjson_lines,
+                                                    lines[start:start + BATCH_CHUNK_LINES], start + 1))
+                if len(pending) >= max_pending:
+                    await flush_one()
+            while pending:
+                await flush_one()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # Intestazioni 200 già inviate: niente risposta 500 dentro il corpo chunked.
+            # Senza il chunk finale il client vede un flusso troncato.
+            raise StreamAborted(f"{type(e).__name__}: {e}") from e
+        finally:
+            for future in pending:
+                future.cancel()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request_head(reader), KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    break
+                method, path, version, headers = request
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+                try:
+                    if path == '/health':
+                        if method != 'GET':
+                            raise HTTPError(405, "Use GET.")
+                        await _send(writer, 200, json.dumps({'status': 'ok', 'workers': self.workers}), keep_alive)
+                    elif path in ('/score', '/score/batch'):
+                        if method != 'POST':
+                            raise HTTPError(405, "Use POST.")
+                        body = await _read_body(reader, headers, self.max_body_bytes)
+                        if path == '/score':
+                            status, payload = await loop.run_in_executor(self.executor, _score_json_body, body)
+                            await _send(writer, status, payload, keep_alive)
+                        else:
+                            await self._handle_batch(writer, body, keep_alive)
+                    else:
+                        raise HTTPError(404, f"Unknown path '{path}'.")
+                except HTTPError as e:
+                    # Il corpo potrebbe non essere stato letto: chiude la connessione dopo la risposta
+                    keep_alive = False
+                    await _send(writer, e.status, json.dumps({'error': str(e)}), keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except StreamAborted as e:
+            print(f"Batch response aborted: {e}", file=sys.stderr, flush=True)
+        except Exception as e:
+            try:
+                await _send(writer, 500, json.dumps({'error': f"{type(e).__name__}: {e}"}), False)
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+            addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+            print(f"SF-36 scoring service listening on {addresses} ({self.workers} workers).", flush=True)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sf36_library.py serve",
+        description="Run the SF-36 HTTP scoring service (POST /score, POST /score/batch with NDJSON, GET /health)."
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"OPTIONAL. Address to bind. Default: {DEFAULT_HOST}.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"OPTIONAL. Port to listen on. Default: {DEFAULT_PORT}.")
+    parser.add_argument("--workers", type=int, default=0, help="OPTIONAL. Scoring worker processes (0 = all cores). Default: 0.")
+    parser.add_argument("--max-body-bytes", type=int, default=DEFAULT_MAX_BODY_BYTES,
+                        help=f"OPTIONAL. Maximum request body size in bytes. Default: {DEFAULT_MAX_BODY_BYTES}.")
+    args = parser.parse_args(argv)
+
+    server = ScoringServer(args.host, args.port, args.workers, args.max_body_bytes)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# sf36_sqlite.py
+# Incremental SQLite scoring for sf36_library.py
+# Start with: python sf36_library.py sqlite --db trial.sqlite --table questionnaires
+#
+# Legge le righe della tabella sorgente con un cursore a blocchi (fetchmany), le calcola
+# con calculate_sf36_batch e scrive i risultati in una tabella dedicata con executemany,
+# una transazione per blocco. Nella stessa transazione aggiorna un high-water mark
+# (ultimo id calcolato) nella tabella sf36_watermarks: le esecuzioni successive leggono
+# solo le righe con id maggiore, e un'interruzione non lascia mai risultati senza il
+# corrispondente mark (o viceversa).
+#
+# La colonna id deve essere un intero crescente per le nuove righe (default: rowid).
+# Righe modificate dopo il calcolo non vengono ricalcolate: usare --full per ripartire da zero.
+
+import argparse
+import datetime
+import sqlite3
+import sys
+
+import sf36_library
+import sf36_batch
+from sf36_batch import RESULT_COLUMNS, DEFAULT_CHUNK_SIZE
+
+DEFAULT_ID_COLUMN = 'rowid'
+DEFAULT_ANSWER_TEMPLATE = 'Q{}' # Colonne Q1..Q36
+DEFAULT_WATERMARK_TABLE = 'sf36_watermarks'
+RESULTS_KEY_COLUMN = 'source_id'
+ROWID_ALIASES = {'rowid', 'oid', '_rowid_'} # Sempre disponibili (tabelle non WITHOUT ROWID)
+
+
+def quote_identifier(name):
+    """Nome SQL tra doppi apici (tabelle/colonne fornite dall'utente)."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def resolve_answer_columns(spec=DEFAULT_ANSWER_TEMPLATE):
+    """
+    Colonne delle 36 risposte da un modello con '{}' (numerato 1..36, es. 'Q{}')
+    o da una lista/stringa di 36 nomi separati da virgole.
+    """
+    if isinstance(spec, str):
+        spec = [spec.format(n) for n in range(1, 37)] if '{}' in spec else [c.strip() for c in spec.split(',')]
+    columns = list(spec)
+    if len(columns) != 36:
+        raise ValueError(f"Expected 36 answer columns, but got {len(columns)}.")
+    return columns
+
+
+def _rows_to_arrays(rows):
+    """
+    Converte righe (id, 36 risposte, età, sesso) nelle matrici di calculate_sf36_batch.
+
+    Colonne numeriche e NULL (il caso tipico) sono convertite in un'unica operazione NumPy;
+    solo se compaiono testi si passa al parsing cella per cella di sf36_batch.
+    """
+    np = sf36_library.np
+    try:
+        values = np.array([row[1:] for row in rows], dtype=float) # NULL -> NaN
+    except (TypeError, ValueError):
+        values = np.array([
+            [sf36_batch._parse_answer_token(v) if isinstance(v, str) else (np.nan if v is None else float(v))
+             for v in row[1:37]]
+            + [sf36_batch._parse_demographic_token(v) if isinstance(v, str) else (np.nan if v is None else float(v))
+               for v in row[37:]]
+            for row in rows
+        ], dtype=float)
+    return values[:, :36], values[:, 36], values[:, 37]
+
+
+def check_columns(conn, table, columns):
+    """
+    Verifica che tabella e colonne richieste esistano (PRAGMA table_info).
+
+    Necessario perché SQLite tratta un identificatore tra doppi apici che non corrisponde
+    a nessuna colonna come una stringa letterale: senza questo controllo un nome errato
+    darebbe solo risultati N/D e farebbe avanzare comunque il mark.
+    """
+    existing = {row[1].lower() for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")}
+    if not existing:
+        raise ValueError(f"Table '{table}' not found.")
+    existing |= ROWID_ALIASES
+    missing = [column for column in columns if column is not None and column.lower() not in existing]
+    if missing:
+        raise ValueError(f"Columns not found in table '{table}': {', '.join(missing)}.")
+
+
+def _ensure_tables(conn, results_table, watermark_table):
+    columns = ', '.join(f"{quote_identifier(column)} REAL" for column in RESULT_COLUMNS)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(results_table)} "
+                 f"({quote_identifier(RESULTS_KEY_COLUMN)} INTEGER PRIMARY KEY, {columns})")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(watermark_table)} "
+                 "(source_table TEXT NOT NULL, results_table TEXT NOT NULL, last_id INTEGER NOT NULL, "
+                 "last_run_rows INTEGER NOT NULL, updated_at TEXT NOT NULL, PRIMARY KEY (source_table, results_table))")
+    conn.commit()
+
+
+def read_watermark(conn, table, results_table, watermark_table=DEFAULT_WATERMARK_TABLE):
+    """Ultimo id calcolato per (tabella sorgente, tabella risultati), None se mai calcolata."""
+    try:
+        row = conn.execute(f"SELECT last_id FROM {quote_identifier(watermark_table)} "
+                           "WHERE source_table = ? AND results_table = ?", (table, results_table)).fetchone()
+    except sqlite3.OperationalError: # Tabella dei mark non ancora creata
+        return None
+    return None if row is None else row[0]
+
+
+def score_sqlite_table(db_path, table, results_table=None, id_column=DEFAULT_ID_COLUMN,
+                       answer_columns=DEFAULT_ANSWER_TEMPLATE, age_column=None, sex_column=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, full=False, watermark_table=DEFAULT_WATERMARK_TABLE,
+                       progress=None):
+    """
+    Calcola le righe nuove di una tabella SQLite e scrive i risultati nel database.
+
+    Args:
+        db_path (str): File del database SQLite.
+        table (str): Tabella sorgente (una riga per questionario).
+        results_table (str, optional): Tabella dei risultati (source_id + RESULT_COLUMNS, NULL = N/D),
+                                       creata se manca. Default '<table>_sf36'.
+        id_column (str): Colonna intera crescente usata come chiave e high-water mark. Default 'rowid'.
+        answer_columns (str or list): Colonne delle 36 risposte (vedi resolve_answer_columns). Default 'Q{}'.
+        age_column, sex_column (str, optional): Colonne di età e sesso. Default None (T-score N/D).
+        chunk_size (int): Righe per blocco letto, calcolato e salvato in una transazione. Default DEFAULT_CHUNK_SIZE.
+        full (bool): Ignora il mark e ricalcola tutte le righe (i risultati esistenti sono sostituiti). Default False.
+        watermark_table (str): Tabella degli high-water mark. Default DEFAULT_WATERMARK_TABLE.
+        progress (callable, optional): Chiamata dopo ogni blocco come progress(righe_fatte, ultimo_id).
+
+    Returns:
+        tuple: (righe calcolate, id di partenza escluso o None, nuovo high-water mark o None).
+    """
+    if sf36_library.np is None:
+        raise ImportError("Batch scoring requires numpy. Install it with: pip install numpy")
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be a positive integer.")
+    results_table = results_table or f"{table}_sf36"
+    answer_columns = resolve_answer_columns(answer_columns)
+    selected = [id_column] + answer_columns + [age_column, sex_column]
+    select_list = ', '.join('NULL' if column is None else quote_identifier(column) for column in selected)
+    insert_sql = (f"INSERT OR REPLACE INTO {quote_identifier(results_table)} "
+                  f"({', '.join(quote_identifier(c) for c in [RESULTS_KEY_COLUMN] + list(RESULT_COLUMNS))}) "
+                  f"VALUES ({', '.join('?' * (1 + len(RESULT_COLUMNS)))})")
+    watermark_sql = (f"INSERT OR REPLACE INTO {quote_identifier(watermark_table)} "
+                     "(source_table, results_table, last_id, last_run_rows, updated_at) VALUES (?, ?, ?, ?, ?)")
+
+    conn = sqlite3.connect(db_path)
+    try:
+        check_columns(conn, table, selected)
+        _ensure_tables(conn, results_table, watermark_table)
+        start_id = None if full else read_watermark(conn, table, results_table, watermark_table)
+        where = '' if start_id is None else f" WHERE {quote_identifier(id_column)} > ?"
+        reader = conn.cursor()
+        try:
+            reader.execute(f"SELECT {select_list} FROM {quote_identifier(table)}{where} "
+                           f"ORDER BY {quote_identifier(id_column)}", () if start_id is None else (start_id,))
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Cannot read table '{table}': {e}.") from None
+
+        n_rows = 0
+        last_id = start_id
+        while True:
+            rows = reader.fetchmany(chunk_size)
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            bad_ids = [row_id for row_id in ids if not isinstance(row_id, int)]
+            if bad_ids:
+                raise ValueError(f"Column '{id_column}' must contain integers (found {bad_ids[0]!r}).")
+            answers, ages, sexes = _rows_to_arrays(rows) # Colonne età/sesso assenti -> NaN (T-score N/D)
+            matrix = sf36_batch.batch_results_to_matrix(sf36_library.calculate_sf36_batch(answers, ages, sexes))
+            records = [[row_id] + [None if v != v else v for v in values]
+                       for row_id, values in zip(ids, matrix.tolist())]
+            last_id = ids[-1]
+            n_rows += len(rows)
+            # Risultati e mark nella stessa transazione (implicita, chiusa da commit)
+            conn.executemany(insert_sql, records)
+            conn.execute(watermark_sql, (table, results_table, last_id, n_rows,
+                                         datetime.datetime.now().isoformat(timespec='seconds')))
+            conn.commit()
+            if progress is not None:
+                progress(n_rows, last_id)
+        return n_rows, start_id, last_id
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# -----------------------------------------------------------------------------
+# INTERFACCIA COMMAND-LINE
+# -----------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sf36_library.py sqlite",
+        description="Score new rows of a SQLite table in batches and write the results back to the database.\n"
+                    "A high-water mark on the id column makes reruns process only rows added since the last run.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--db", required=True, help="SQLite database file.")
+    parser.add_argument("--table", required=True, help="Source table (one questionnaire per row).")
+    parser.add_argument("--results-table", help="OPTIONAL. Results table, created if missing. Default: <table>_sf36.")
+    parser.add_argument("--id-column", default=DEFAULT_ID_COLUMN,
+                        help=f"OPTIONAL. Increasing integer key of the source table. Default: {DEFAULT_ID_COLUMN}.")
+    parser.add_argument("--answer-columns", default=DEFAULT_ANSWER_TEMPLATE,
+                        help="OPTIONAL. The 36 answer columns: a template numbered 1..36 (e.g. 'Q{}')\n"
+                             f"or 36 comma-separated names. Default: {DEFAULT_ANSWER_TEMPLATE}.")
+    parser.add_argument("--age-column", help="OPTIONAL. Age column (needed for T-scores).")
+    parser.add_argument("--sex-column", help="OPTIONAL. Sex column, 1 = male, 2 = female (needed for T-scores).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"OPTIONAL. Rows read, scored and committed per transaction. Default: {DEFAULT_CHUNK_SIZE}.")
+    parser.add_argument("--full", action='store_true',
+                        help="OPTIONAL. Ignore the high-water mark and rescore every row.")
+    parser.add_argument("--watermark-table", default=DEFAULT_WATERMARK_TABLE,
+                        help=f"OPTIONAL. Table storing the high-water marks. Default: {DEFAULT_WATERMARK_TABLE}.")
+    args = parser.parse_args(argv)
+
+    try:
+        n_rows, start_id, last_id = score_sqlite_table(
+            args.db, args.table, args.results_table, args.id_column, args.answer_columns,
+            args.age_column, args.sex_column, args.chunk_size, args.full, args.watermark_table)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"Input Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    after = 'all rows' if start_id is None else f"rows with {args.id_column} > {start_id}"
+    print(f"Scored {n_rows} rows of '{args.table}' ({after}); high-water mark: {last_id}.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
+
+# Example Usage from command line:
+# python sf36_library.py sqlite --db trial.sqlite --table questionnaires --age-column age --sex-column sex
+# python sf36_library.py sqlite --db trial.sqlite --table visits --id-column visit_id --answer-columns "item_{}" --results-table visit_scores
+# python sf36_library.py sqlite --db trial.sqlite --table questionnaires --full
@@ -0,0 +1,295 @@
+# sf36_synth.py
+# Generatore riproducibile di coorti SF-36 sintetiche per test di carico.
+# Risposte correlate all'interno di ogni scala (fattore latente di salute
+# globale + fattore di scala, centrati sulle norme italiane per età e sesso),
+# età/sesso distribuiti sulle classi di AGE_SEX_NORMS, percentuali configurabili
+# di item mancanti, pagine saltate, valori fuori range e stringhe malformate.
+# Interamente vettoriale (numpy) e a blocchi: scrive CSV o il formato binario
+# di sf36_batch a velocità disco, opzionalmente su più processi.
+#
+# Uso:
+#   python sf36_synth.py --rows 100000000 --output cohort.csv --workers 0
+#   python sf36_synth.py --rows 1000000 --output cohort.sf36bin --format binary --seed 7
+
+import argparse
+import functools
+import math
+import sys
+
+import sf36_library
+from sf36_library import ITEM_VALID_RANGES, SCALE_INDICES, SCALES_FOR_STD, AGE_CLASS_UPPER_BOUNDS, np
+
+DEFAULT_CHUNK_SIZE = 100000
+GLOBAL_FACTOR_LOADING = 0.6 # Correlazione tra scale tramite il fattore di salute globale
+ITEM_NOISE_SD = 18.0 # DS del rumore per item (punti 0-100, uniforme) attorno al livello della scala
+AGE_MIN, AGE_MAX = 18, 90 # Estremi della prima e dell'ultima classe d'età
+
+# Tabella dei token: id 0..MAX_INT_TOKEN = interi, poi mancante e stringhe malformate
+MAX_INT_TOKEN = 119
+MISSING_TOKEN_ID = MAX_INT_TOKEN + 1
+MALFORMED_TOKENS = (b'x', b'?', b'2.5', b'3a', b'n/a', b'-1', b'1O')
+_TOKENS = [str(i).encode('ascii') for i in range(MAX_INT_TOKEN + 1)] + [b''] + list(MALFORMED_TOKENS)
+_PAD_BYTE = 0 # Riempimento delle celle a larghezza fissa (4 byte: token + separatore), rimosso in serializzazione
+
+
+# -----------------------------------------------------------------------------
+# TABELLE DEL MODELLO
+# -----------------------------------------------------------------------------
+
+_MODEL = None
+
+def _model_tables():
+    """Tabelle dense per la generazione (calcolate una volta per processo)."""
+    global _MODEL
+    if _MODEL is None:
+        plan = sf36_library.get_scoring_plan()
+        # Scala latente di ogni item: le scale standardizzate, HT segue GH
+        item_scale = np.empty(36, dtype=np.intp)
+        for j, scale in enumerate(SCALES_FOR_STD):
+            item_scale[SCALE_INDICES[scale]] = j
+        item_scale[SCALE_INDICES['HT']] = SCALES_FOR_STD.index('GH')
+        # Ricodifiche lineari: punteggio = offset + passo * risposta (passo < 0 per gli item invertiti)
+        lows = np.array([ITEM_VALID_RANGES[i][0] for i in range(36)])
+        highs = np.array([ITEM_VALID_RANGES[i][1] for i in range(36)])
+        steps = np.array([(plan.item_recode[i][highs[i]] - plan.item_recode[i][lows[i]]) / (highs[i] - lows[i])
+                          for i in range(36)])
+        offsets = np.array([plan.item_recode[i][lows[i]] for i in range(36)]) - steps * lows
+        # Classi d'età presenti nelle norme per ciascun sesso e relative medie/DS
+        norm_classes = {sex: [c for c in range(9) if plan.age_sex_norms[sex][c] is not None] for sex in (1, 2)}
+        norm_means = np.full((3, 9, len(SCALES_FOR_STD)), 50.0, dtype=np.float32)
+        norm_sds = np.full((3, 9, len(SCALES_FOR_STD)), 20.0, dtype=np.float32)
+        for sex, classes in norm_classes.items():
+            for c in classes:
+                norm_means[sex, c] = [m for m, _ in plan.age_sex_norms[sex][c]]
+                norm_sds[sex, c] = [sd for _, sd in plan.age_sex_norms[sex][c]]
+        bounds = [AGE_MIN - 1] + list(AGE_CLASS_UPPER_BOUNDS) + [AGE_MAX]
+        class_age_range = {2 + k: (bounds[k] + 1, bounds[k + 1]) for k in range(len(bounds) - 1)}
+        _MODEL = {
+            'item_scale': item_scale, 'norm_classes': norm_classes,
+            'norm_means': norm_means, 'norm_sds': norm_sds, 'class_age_range': class_age_range,
+            'lows': lows, 'highs': highs, 'steps': steps.astype(np.float32), 'offsets': offsets.astype(np.float32),
+        }
+    return _MODEL
+
+
+# -----------------------------------------------------------------------------
+# GENERAZIONE
+# -----------------------------------------------------------------------------
+
+def generate_tokens(n_rows, seed=0, chunk_index=0, missing_rate=0.02, skipped_page_rate=0.005, out_of_range_rate=0.0,
+                    malformed_rate=0.0, missing_demographics_rate=0.02):
+    """
+    Genera un blocco di n_rows questionari come matrice di id di token (N x 38: 36 risposte, età, sesso).
+
+    Il blocco dipende solo da (seed, chunk_index), quindi i blocchi possono essere
+    generati in parallelo e in qualsiasi ordine con risultato identico.
+
+    Args:
+        missing_rate (float): Probabilità che un singolo item sia mancante.
+        skipped_page_rate (float): Probabilità che una riga salti un blocco di 9 item consecutivi.
+        out_of_range_rate (float): Probabilità che un item sia un intero fuori dal range valido.
+        malformed_rate (float): Probabilità che un item sia una stringa non numerica/non intera.
+        missing_demographics_rate (float): Probabilità (separata) di età e sesso mancanti.
+
+    Returns:
+        numpy.ndarray: int16 N x 38; id <= MAX_INT_TOKEN = intero, MISSING_TOKEN_ID = mancante,
+                       oltre = stringa malformata (MALFORMED_TOKENS).
+    """
+    if np is None:
+        raise ImportError("Synthetic data generation requires numpy. Install it with: pip install numpy")
+    if out_of_range_rate + malformed_rate + missing_rate > 1:
+        raise ValueError("Missing, out-of-range and malformed item rates must sum to at most 1.")
+    model = _model_tables()
+    rng = np.random.default_rng([seed, chunk_index])
+
+    # Demografia: sesso uniforme, classe d'età uniforme tra quelle con norme, età uniforme nella classe
+    sexes = rng.integers(1, 3, size=n_rows)
+    age_classes = np.empty(n_rows, dtype=np.intp)
+    for sex, classes in model['norm_classes'].items():
+        mask = sexes == sex
+        age_classes[mask] = rng.choice(classes, size=int(mask.sum()))
+    lo = np.array([model['class_age_range'].get(c, (AGE_MIN, AGE_MAX))[0] for c in range(9)])
+    hi = np.array([model['class_age_range'].get(c, (AGE_MIN, AGE_MAX))[1] for c in range(9)])
+    ages = rng.integers(lo[age_classes], hi[age_classes] + 1)
+
+    # Livello latente per scala: fattore globale + fattore specifico, sulla scala delle norme
+    n_scales = len(SCALES_FOR_STD)
+    latent = (GLOBAL_FACTOR_LOADING * rng.standard_normal((n_rows, 1), dtype=np.float32)
+              + math.sqrt(1 - GLOBAL_FACTOR_LOADING ** 2) * rng.standard_normal((n_rows, n_scales), dtype=np.float32))
+    scale_level = model['norm_means'][sexes, age_classes] + model['norm_sds'][sexes, age_classes] * latent
+
+    # Ogni item: risposta valida il cui punteggio 0-100 è più vicino al livello della scala + rumore
+    # (rumore uniforme con la stessa DS: molto più economico della normale su N x 36)
+    targets = scale_level[:, model['item_scale']]
+    noise = rng.random((n_rows, 36), dtype=np.float32)
+    noise -= 0.5
+    noise *= np.float32(2 * math.sqrt(3) * ITEM_NOISE_SD)
+    targets += noise
+    targets -= model['offsets']
+    targets /= model['steps']
+    raw = np.rint(targets, out=targets)
+    tokens = np.empty((n_rows, 38), dtype=np.int16)
+    tokens[:, :36] = np.clip(raw, model['lows'], model['highs'])
+    tokens[:, 36] = ages
+    tokens[:, 37] = sexes
+
+    # Corruzioni degli item: un'unica estrazione uniforme ripartita tra i tipi
+    answers = tokens[:, :36]
+    u = rng.random((n_rows, 36), dtype=np.float32)
+    out_of_range = u < out_of_range_rate
+    if out_of_range.any():
+        cols = np.nonzero(out_of_range)[1]
+        too_high = rng.random(cols.size) < 0.8 # Soprattutto valori oltre il massimo (es. 7, 9)
+        answers[out_of_range] = np.where(too_high, rng.integers(model['highs'][cols] + 1, 10), 0)
+    malformed = (u >= out_of_range_rate) & (u < out_of_range_rate + malformed_rate)
+    if malformed.any():
+        answers[malformed] = MISSING_TOKEN_ID + 1 + rng.integers(0, len(MALFORMED_TOKENS), size=int(malformed.sum()))
+    answers[u >= 1 - missing_rate] = MISSING_TOKEN_ID
+    if skipped_page_rate > 0:
+        skipped = np.flatnonzero(rng.random(n_rows) < skipped_page_rate)
+        page_start = rng.integers(0, 4, size=skipped.size) * 9
+        for offset in range(9):
+            answers[skipped, page_start + offset] = MISSING_TOKEN_ID
+    if missing_demographics_rate > 0:
+        demographics = rng.random((n_rows, 2), dtype=np.float32) < missing_demographics_rate
+        tokens[:, 36:][demographics] = MISSING_TOKEN_ID
+    return tokens
+
+
+def tokens_to_arrays(tokens):
+    """Converte una matrice di token in (answers N x 36, ages N, sexes N) float; mancanti e malformati = NaN."""
+    values = np.where(tokens <= MAX_INT_TOKEN, tokens, np.nan)
+    return values[:, :36], values[:, 36], values[:, 37]
+
+
+def generate_cohort(n_rows, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, **rates):
+    """
+    Genera una coorte completa in memoria (opzioni come generate_tokens).
+
+    Returns:
+        tuple: (answers N x 36, ages N, sexes N) float con NaN, pronti per calculate_sf36_batch.
+    """
+    parts = [generate_tokens(min(chunk_size, n_rows - start), seed, k, **rates)
+             for k, start in enumerate(range(0, n_rows, chunk_size))]
+    tokens = np.concatenate(parts) if parts else np.empty((0, 38), dtype=np.int16)
+    return tokens_to_arrays(tokens)
+
+
+# -----------------------------------------------------------------------------
+# SERIALIZZAZIONE
+# -----------------------------------------------------------------------------
+
+def _token_cell_table(separator):
+    """Token -> cella di 4 byte (token, riempimento, separatore) vista come uint32."""
+    table = np.full((len(_TOKENS), 4), _PAD_BYTE, dtype=np.uint8)
+    for k, token in enumerate(_TOKENS):
+        table[k, :len(token)] = np.frombuffer(token, dtype=np.uint8)
+    table[:, 3] = ord(separator)
+    return table.view(np.uint32).ravel()
+
+
+def tokens_to_csv_bytes(tokens, delimiter=','):
+    """
+    Serializza una matrice di token in righe CSV senza loop Python.
+
+    Ogni cella è una parola di 4 byte (token + separatore) presa da una tabella;
+    i byte di riempimento sono poi rimossi con una sola maschera booleana.
+    """
+    cells = _token_cell_table(delimiter)[tokens]
+    cells[:, -1] = _token_cell_table('\n')[tokens[:, -1]]
+    flat = cells.view(np.uint8).ravel()
+    return flat[flat != _PAD_BYTE].tobytes()
+
+
+def csv_header_bytes(delimiter=','):
+    return (delimiter.join([f"Q{i + 1}" for i in range(36)] + ['Age', 'Sex']) + "\n").encode('ascii')
+
+
+def _chunk_payload(output_format, delimiter, rates, n_rows, seed, chunk_index):
+    """Worker: genera un blocco e lo restituisce già serializzato."""
+    tokens = generate_tokens(n_rows, seed, chunk_index, **rates)
+    if output_format == 'csv':
+        return tokens_to_csv_bytes(tokens, delimiter)
+    import sf36_batch
+    return sf36_batch.encode_binary_records(*tokens_to_arrays(tokens)).tobytes()
+
+
+def write_cohort(output_path, n_rows, output_format=None, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                 header=True, delimiter=',', **rates):
+    """
+    Genera n_rows questionari e li scrive a blocchi in CSV o nel formato binario di sf36_batch.
+
+    Args:
+        output_path (str): File di output ('-' per stdout).
+        output_format (str, optional): 'csv' o 'binary'. Default None (binary per .bin/.sf36bin, altrimenti csv).
+        seed (int): Seme; stesso seme e chunk_size -> stesso file, con qualsiasi numero di worker.
+        chunk_size (int): Righe per blocco. Default DEFAULT_CHUNK_SIZE.
+        workers (int): Processi di generazione (0 = tutti i core). Default 1.
+        header (bool): Riga di intestazione nel CSV. Default True.
+        delimiter (str): Separatore di campo del CSV (un carattere). Default ','.
+        **rates: Percentuali di corruzione, come generate_tokens.
+
+    Returns:
+        int: Numero di righe scritte.
+    """
+    import sf36_batch
+    if output_format is None:
+        output_format = 'binary' if output_path.lower().endswith(('.bin', '.sf36bin')) else 'csv'
+    if output_format not in ('csv', 'binary'):
+        raise ValueError(f"Unsupported output format '{output_format}' (use 'csv' or 'binary').")
+    if len(delimiter) != 1:
+        raise ValueError("Delimiter must be a single character.")
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be a positive integer.")
+    generate_tokens(0, seed, **rates) # Valida le percentuali prima di creare il file
+
+    worker = functools.partial(_chunk_payload, output_format, delimiter, rates)
+    chunks = ((min(chunk_size, n_rows - start), seed, k) for k, start in enumerate(range(0, n_rows, chunk_size)))
+    out = sys.stdout.buffer if output_path == '-' else open(output_path, 'wb')
+    try:
+        if output_format == 'binary':
+            out.write(sf36_batch.BINARY_HEADER.pack(sf36_batch.BINARY_MAGIC, sf36_batch._binary_record_dtype().itemsize, 0))
+        elif header:
+            out.write(csv_header_bytes(delimiter))
+        for payload in sf36_batch.map_chunks_ordered(worker, chunks, workers):
+            out.write(payload)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic SF-36 cohort (CSV or binary records).")
+    parser.add_argument("--rows", type=int, required=True, help="Number of questionnaires to generate.")
+    parser.add_argument("--output", default='-', help="Output file ('-' = stdout, CSV only). Default: '-'.")
+    parser.add_argument("--format", choices=['csv', 'binary'], help="Output format. Default: from the extension (.bin/.sf36bin = binary), else csv.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed. Default: 0.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help=f"Rows per generated chunk. Default: {DEFAULT_CHUNK_SIZE}.")
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes (0 = all cores). Default: 1.")
+    parser.add_argument("--missing-rate", type=float, default=0.02, help="Per-item missing probability. Default: 0.02.")
+    parser.add_argument("--skipped-page-rate", type=float, default=0.005, help="Per-row probability of 9 consecutive missing items. Default: 0.005.")
+    parser.add_argument("--out-of-range-rate", type=float, default=0.0, help="Per-item out-of-range integer probability. Default: 0.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Per-item malformed string probability (CSV; missing in binary). Default: 0.")
+    parser.add_argument("--missing-demographics-rate", type=float, default=0.02, help="Probability of missing age and of missing sex. Default: 0.02.")
+    parser.add_argument("--delimiter", default=',', help="CSV field delimiter. Default: ','.")
+    parser.add_argument("--no-header", action="store_true", help="Do not write the CSV header row.")
+    args = parser.parse_args()
+
+    try:
+        if args.rows < 0:
+            raise ValueError("--rows must be >= 0.")
+        if args.format == 'binary' and args.output == '-':
+            raise ValueError("Binary output requires --output FILE.")
+        write_cohort(args.output, args.rows, output_format=args.format, seed=args.seed, chunk_size=args.chunk_size,
+                     workers=args.workers, header=not args.no_header, delimiter=args.delimiter,
+                     missing_rate=args.missing_rate, skipped_page_rate=args.skipped_page_rate,
+                     out_of_range_rate=args.out_of_range_rate, malformed_rate=args.malformed_rate,
+                     missing_demographics_rate=args.missing_demographics_rate)
+    except (ValueError, ImportError) as e:
+        print(f"Input Error: {e}", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
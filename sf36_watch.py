@@ -0,0 +1,303 @@
+# sf36_watch.py
+# Watch-folder daemon for sf36_library.py
+# Start with: python sf36_library.py watch --dir inbox [--output-dir scored] [--max-files 2]
+#
+# Controlla periodicamente una cartella (non ricorsiva) e calcola con sf36_batch.score_file
+# ogni file CSV/Excel/binario nuovo o modificato, scrivendo i risultati accanto all'input
+# (<nome>_<estensione>_sf36.<formato>, così a.csv e a.xlsx non si sovrascrivono a vicenda)
+# o nella cartella di output. Un file è preso in carico solo quando
+# non viene modificato da settle_seconds (esportazione completata).
+#
+# Il manifest (.sf36_manifest.json nella cartella sorvegliata) registra per ogni file
+# dimensione, mtime, SHA-256, output ed esito: un file con stessa dimensione e mtime non
+# viene nemmeno riletto, uno "toccato" ma con lo stesso hash non viene ricalcolato.
+# Anche i file in errore sono registrati, così non vengono riprovati finché non cambiano.
+#
+# I file sono calcolati in un pool di al massimo max_files processi; i file in più restano
+# in attesa del polling successivo. Il manifest è aggiornato (in modo atomico) a ogni file.
+# Se un processo del pool termina in modo anomalo il pool viene ricreato e i file
+# interessati sono ripresi al controllo successivo.
+
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import sf36_batch
+
+DEFAULT_INTERVAL = 5.0 # Secondi tra due controlli della cartella
+DEFAULT_SETTLE_SECONDS = 5.0 # Età minima (mtime) di un file per considerarlo completo
+DEFAULT_MAX_FILES = 2
+MANIFEST_NAME = '.sf36_manifest.json'
+OUTPUT_SUFFIX = '_sf36'
+WATCHED_EXTENSIONS = ('.csv', '.txt', '.xlsx', '.xls', '.sf36bin')
+_OUTPUT_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather', 'arrow': '.arrow'}
+
+
+def _log(message):
+    print(f"[{datetime.datetime.now().isoformat(sep=' ', timespec='seconds')}] {message}", file=sys.stderr, flush=True)
+
+
+def file_sha256(path, block_size=1 << 20):
+    """SHA-256 del contenuto di un file, letto a blocchi."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _score_dropped_file(input_path, output_path, previous_hash, options):
+    """
+    Worker: hash del file e, se diverso da previous_hash, calcolo su un file temporaneo
+    (nome univoco nella cartella di output) rinominato in output_path solo a calcolo completato.
+
+    Returns:
+        tuple: (sha256, righe calcolate o None se il contenuto non è cambiato).
+    """
+    sha256 = file_sha256(input_path)
+    if sha256 == previous_hash:
+        return sha256, None
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(output_path) + '.', suffix='.part',
+                                    dir=os.path.dirname(output_path) or '.')
+    os.close(fd)
+    try:
+        n_rows = sf36_batch.score_file(input_path, tmp_path, **options)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return sha256, n_rows
+
+
+class WatchFolder:
+    """
+    Stato del daemon: manifest dei file elaborati e file in calcolo.
+
+    Args:
+        directory (str): Cartella sorvegliata.
+        output_dir (str, optional): Cartella dei risultati. Default None (accanto all'input).
+        output_format (str): Uno di sf36_batch.OUTPUT_FORMATS. Default 'csv'.
+        max_files (int): File calcolati contemporaneamente (processi). Default DEFAULT_MAX_FILES.
+        settle_seconds (float): Età minima dell'ultima modifica prima di calcolare un file.
+        manifest_path (str, optional): Default <directory>/.sf36_manifest.json.
+        options (dict, optional): Altre opzioni per sf36_batch.score_file (chunk_size, delimiter, ...).
+    """
+
+    def __init__(self, directory, output_dir=None, output_format='csv', max_files=DEFAULT_MAX_FILES,
+                 settle_seconds=DEFAULT_SETTLE_SECONDS, manifest_path=None, options=None):
+        if not os.path.isdir(directory):
+            raise ValueError(f"Watch directory '{directory}' does not exist.")
+        if output_format not in _OUTPUT_EXTENSIONS:
+            raise ValueError(f"Unsupported output format '{output_format}'. "
+                             f"Choose one of: {', '.join(_OUTPUT_EXTENSIONS)}.")
+        if max_files <= 0:
+            raise ValueError("Maximum concurrent files must be a positive integer.")
+        self.directory = directory
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.max_files = max_files
+        self.settle_seconds = settle_seconds
+        self.manifest_path = manifest_path or os.path.join(directory, MANIFEST_NAME)
+        self.options = dict(options or {}, output_format=output_format)
+        self.manifest = self._load_manifest()
+        self._running = {} # future -> (nome, dimensione, mtime_ns, output)
+        self._executor = None
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Cannot read manifest '{self.manifest_path}': {e}.") from None
+        return manifest if isinstance(manifest, dict) else {}
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def output_path(self, name):
+        """File dei risultati: a.csv -> a_csv_sf36.csv (l'estensione dell'input evita collisioni)."""
+        stem, ext = os.path.splitext(name)
+        stem = f"{stem}_{ext.lstrip('.')}" if ext else stem
+        return os.path.join(self.output_dir or self.directory, stem + OUTPUT_SUFFIX + _OUTPUT_EXTENSIONS[self.output_format])
+
+    def _is_candidate(self, name):
+        stem, ext = os.path.splitext(name)
+        return (ext.lower() in WATCHED_EXTENSIONS and not name.startswith(('.', '~$'))
+                and not stem.endswith(OUTPUT_SUFFIX)) # Non ricalcola i propri risultati
+
+    def pending_files(self, now=None):
+        """File nuovi o modificati (dimensione/mtime diversi dal manifest) e stabili, non già in calcolo."""
+        now = time.time() if now is None else now
+        busy = {name for name, _, _, _ in self._running.values()}
+        pending = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name in busy or not self._is_candidate(entry.name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError: # Rimosso o rinominato durante la scansione
+                    continue
+                if now - stat.st_mtime < self.settle_seconds:
+                    continue # Probabilmente ancora in scrittura
+                known = self.manifest.get(entry.name)
+                if known and known.get('size') == stat.st_size and known.get('mtime_ns') == stat.st_mtime_ns:
+                    continue
+                pending.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        return [(name, size, mtime_ns) for mtime_ns, name, size in sorted(pending)] # I più vecchi prima
+
+    def poll(self):
+        """Raccoglie i file terminati e avvia i nuovi fino a max_files in calcolo. Ritorna i file avviati."""
+        self.collect()
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_files)
+        started = []
+        outputs = {output for _, _, _, output in self._running.values()}
+        for name, size, mtime_ns in self.pending_files():
+            if len(self._running) >= self.max_files:
+                break # Gli altri file al prossimo controllo
+            output_path = self.output_path(name)
+            if output_path in outputs:
+                continue # Stesso output di un file in calcolo: al prossimo controllo
+            previous_hash = (self.manifest.get(name) or {}).get('sha256')
+            try:
+                future = self._executor.submit(_score_dropped_file, os.path.join(self.directory, name),
+                                               output_path, previous_hash, self.options)
+            except BrokenProcessPool as e:
+                _log(f"Process pool broken ({e}); restarting it.")
+                self._restart_executor()
+                break # Nuovi tentativi al prossimo controllo
+            self._running[future] = (name, size, mtime_ns, output_path)
+            outputs.add(output_path)
+            started.append(name)
+        return started
+
+    def _restart_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_files)
+
+    def collect(self, wait=False):
+        """Registra nel manifest i file terminati (wait=True: attende tutti quelli in calcolo)."""
+        if not self._running:
+            return
+        if wait:
+            concurrent.futures.wait(list(self._running))
+        broken = False
+        for future in [f for f in self._running if f.done()]:
+            name, size, mtime_ns, output_path = self._running.pop(future)
+            entry = {'size': size, 'mtime_ns': mtime_ns,
+                     'processed_at': datetime.datetime.now().isoformat(timespec='seconds')}
+            try:
+                sha256, n_rows = future.result()
+            except BrokenProcessPool:
+                # Processo terminato in modo anomalo: il file non è registrato e sarà ripreso
+                _log(f"Worker for '{name}' terminated abruptly; will retry.")
+                broken = True
+                continue
+            except Exception as e: # Registrato: non riprovato finché il file non cambia
+                entry.update(sha256=None, error=str(e))
+                _log(f"Failed '{name}': {e}")
+            else:
+                previous = self.manifest.get(name) or {}
+                if n_rows is None: # Stesso contenuto: aggiorna solo dimensione/mtime
+                    entry.update({k: previous[k] for k in ('output', 'rows') if k in previous}, sha256=sha256)
+                    _log(f"Unchanged '{name}' (same content), skipped.")
+                else:
+                    entry.update(sha256=sha256, output=output_path, rows=n_rows)
+                    _log(f"Scored {n_rows} rows from '{name}' -> '{output_path}'.")
+            self.manifest[name] = entry
+            self._save_manifest()
+        if broken:
+            self._restart_executor()
+
+    def run(self, interval=DEFAULT_INTERVAL, once=False):
+        """
+        Ciclo del daemon: poll ogni interval secondi fino a Ctrl+C.
+        Con once=True elabora i file presenti (attendendo i calcoli) ed esce.
+        """
+        try:
+            while True:
+                started = self.poll()
+                for name in started:
+                    _log(f"Processing '{name}'...")
+                if once:
+                    self.collect(wait=True)
+                    if not self.pending_files():
+                        return
+                    continue
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            _log("Stopping: waiting for files being scored...")
+            self.collect(wait=True)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+# -----------------------------------------------------------------------------
+# INTERFACCIA COMMAND-LINE
+# -----------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sf36_library.py watch",
+        description="Watch a directory and score every new or changed CSV/Excel/binary answers file.\n"
+                    "Results are written next to the input (<name>_<input ext>_sf36.<ext>) or to --output-dir.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--dir", required=True, help="Directory to watch (not recursive).")
+    parser.add_argument("--output-dir", help="OPTIONAL. Directory for results. Default: next to each input file.")
+    parser.add_argument("--output-format", choices=sf36_batch.OUTPUT_FORMATS, default='csv',
+                        help="OPTIONAL. Output format of the results. Default: csv.")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help=f"OPTIONAL. Seconds between directory scans. Default: {DEFAULT_INTERVAL:g}.")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="OPTIONAL. Seconds a file must be left unmodified before it is scored.\n"
+                             f"Default: {DEFAULT_SETTLE_SECONDS:g}.")
+    parser.add_argument("--max-files", type=int, default=DEFAULT_MAX_FILES,
+                        help=f"OPTIONAL. Files scored at the same time (processes). Default: {DEFAULT_MAX_FILES}.")
+    parser.add_argument("--manifest", help=f"OPTIONAL. Processed-files manifest. Default: <dir>/{MANIFEST_NAME}.")
+    parser.add_argument("--chunk-size", type=int, default=sf36_batch.DEFAULT_CHUNK_SIZE,
+                        help=f"OPTIONAL. Rows read and scored per chunk. Default: {sf36_batch.DEFAULT_CHUNK_SIZE}.")
+    parser.add_argument("--once", action='store_true',
+                        help="OPTIONAL. Score the files currently in the directory, then exit (e.g. from cron).")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.chunk_size <= 0:
+            raise ValueError("--chunk-size must be a positive integer.")
+        watcher = WatchFolder(args.dir, args.output_dir, args.output_format, args.max_files, args.settle,
+                              args.manifest, options={'chunk_size': args.chunk_size})
+    except ValueError as e:
+        print(f"Input Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not args.once:
+        _log(f"Watching '{args.dir}' every {args.interval:g} s (up to {args.max_files} files at a time).")
+    watcher.run(args.interval, args.once)
+
+
+if __name__ == "__main__":
+    main()
+
+# Example Usage from command line:
+# python sf36_library.py watch --dir /shared/sf36_inbox
+# python sf36_library.py watch --dir /shared/sf36_inbox --output-dir /shared/sf36_scored --output-format parquet --max-files 4
+# python sf36_library.py watch --dir /shared/sf36_inbox --once --settle 0